@@ -1,5 +1,64 @@
+import importlib
+
+from gym.envs.registration import register
+
 from gym_brt.data.config import configuration
 from gym_brt.data.config.configuration import *
-from gym_brt.control import *
-from gym_brt import envs
-from gym_brt import blackfly
+
+# The subpackages pull in scipy and numba (and with the camera cv2 and PySpin), so that they are only imported on first
+# access (e.g. `gym_brt.envs` or `from gym_brt import QubeFlipUpControl`) instead of with `import gym_brt`; the module
+# `__getattr__` requires Python 3.7 (PEP 562)
+_SUBPACKAGES = ("blackfly", "control", "envs", "quanser")
+_CONTROL_NAMES = (
+    "dampen_policy",
+    "QubeFlipUpControl",
+    "QubeHoldControl",
+    "QubeMPPIControl",
+    "RandomControl",
+    "NoControl",
+    "LQRGainCache",
+    "LQR_GAIN_CACHE",
+    "precompute_lqr_gains",
+    "CalibrCtrl",
+    "GoToLimCtrl",
+    "PIDCtrl",
+    "calibrate",
+)
+
+# Only the entry points are registered, the environments are imported by `gym.make`
+register(
+    id='QubeBeginDownEnv-v1',
+    entry_point='gym_brt.envs:QubeBeginDownEnv',
+    )
+
+register(
+    id='QubeSwingupEnv-v1',
+    entry_point='gym_brt.envs:QubeSwingupEnv',
+    )
+
+register(
+    id='QubeBeginUpEnv-v1',
+    entry_point='gym_brt.envs:QubeBeginUpEnv',
+    )
+
+register(
+    id='QubeNoisyEnv-v1',
+    entry_point='gym_brt.envs:NoisyEnv',
+    )
+
+register(
+    id='QubeRandomStartEnv-v1',
+    entry_point='gym_brt.envs:RandomStartEnv',
+    )
+
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f"gym_brt.{name}")
+    if name in _CONTROL_NAMES:
+        return getattr(importlib.import_module("gym_brt.control"), name)
+    raise AttributeError(f"module 'gym_brt' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBPACKAGES) | set(_CONTROL_NAMES))
@@ -5,7 +5,8 @@ import cv2
 try:
     import PySpin
 except ImportError:
-    print("Warning: Package 'PySpin' not found. Please install it via the Spinnaker SDK from Flir.")
+    # Only raised once a camera is opened
+    PySpin = None
 
 
 """
@@ -24,6 +25,9 @@ exposure_time = 1000 # less than 1000 does not reduce the exposure time anymore
 class Blackfly:
 
     def __init__(self, exposure_time=exposure_time):
+        if PySpin is None:
+            raise ImportError("Package 'PySpin' not found. Please install it via the Spinnaker SDK from Flir.")
+
         # Retrieve singleton reference to system object
         self.system = PySpin.System.GetInstance()
 
@@ -1,2 +1,3 @@
-from gym_brt.control.control import dampen_policy, QubeFlipUpControl, QubeHoldControl, RandomControl, NoControl
+from gym_brt.control.control import dampen_policy, QubeFlipUpControl, QubeHoldControl, QubeMPPIControl, RandomControl, NoControl, \
+    LQRGainCache, LQR_GAIN_CACHE, precompute_lqr_gains
 from gym_brt.control.calibration import CalibrCtrl, GoToLimCtrl, PIDCtrl, calibrate
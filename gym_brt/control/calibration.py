@@ -18,12 +18,6 @@ import time
 import warnings
 import typing as tp
 
-# For other platforms where it's impossible to install the HIL SDK
-try:
-    from gym_brt.quanser import QubeHardware
-except ImportError:
-    print("Warning: Can not import QubeHardware in calibration.py. Calibration not possible!")
-
 
 class PIDCtrl:
     """PID controller to move the arm of a Qube to the specified angle `th_des`.
@@ -173,6 +167,9 @@ def calibrate(qube=None, desired_theta: float = 0.0, frequency: int = 120, u_max
         raise ValueError(f"Unknown angle unit '{unit}'")
 
     if qube is None:
+        # Imported here since gym_brt.quanser imports the controllers of this package
+        from gym_brt.quanser import QubeHardware
+
         with QubeHardware(frequency=frequency) as qube:
             return _calibrate_qube(qube=qube, desired_theta=desired_theta, frequency=frequency, u_max=u_max, limits=limits)
     else:
@@ -2,15 +2,21 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
+import hashlib
+import os
+import time
+
 import numpy as np
-from scipy import linalg
-from scipy import signal
 
 from gym_brt import configuration as config
 
 # Set the motor saturation limits for the Aero and Qube
 AERO_MAX_VOLTAGE = 15.0
 
+# Linear model of the upright pendulum from the Quanser workbook
+WORKBOOK_A = np.array([[0, 0, 1, 0], [0, 0, 0, 1], [0, 149.2751, -0.0104, 0], [0, 261.6091, -0.0103, 0]])
+WORKBOOK_B = np.array([[0], [0], [49.7275], [49.1493]])
+
 
 def _convert_state(state):
     state = np.asarray(state)
@@ -102,18 +108,123 @@ class RandomControl(Control):
         return self._action_space.sample()
 
 
+def dlqr(A, B, Q, R):
+    """
+    Solve the discrete time lqr controller.
+    x[k+1] = A x[k] + B u[k]
+    cost = sum x[k].T*Q*x[k] + u[k].T*R*u[k]
+    """
+    # scipy is imported on first use, since it takes long to import
+    from scipy import linalg
+
+    # first, solve the ricatti equation
+    P = np.array(linalg.solve_discrete_are(A, B, Q, R))
+    # compute the LQR gain
+    K = np.array((linalg.inv(B.T.dot(P).dot(B) + R)).dot(B.T.dot(P).dot(A)))
+    return K
+
+
+class LQRGainCache(object):
+    """Memoized gains of the discrete LQR.
+
+    The gains are keyed by the continuous linear model (A, B), the weights (Q, R), the sample frequency and the
+    discretization method, so that the model is only discretized and the Riccati equation is only solved once per
+    configuration. If `path` is given, the gains are also stored in this .npz file (and loaded from it on first use),
+    so that they are shared between processes and runs.
+
+    All instances of `QubeFlipUpControl` use `LQR_GAIN_CACHE` by default, whose file can be set with the environment
+    variable `GYM_BRT_LQR_CACHE`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._gains = {}
+        self._loaded = path is None
+
+    def __len__(self):
+        self._load()
+        return len(self._gains)
+
+    @staticmethod
+    def key(A, B, Q, R, freq, method):
+        digest = hashlib.sha1(repr((float(freq), method)).encode())
+        for matrix in (A, B, Q, R):
+            matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+            digest.update(repr(matrix.shape).encode())
+            digest.update(matrix.tobytes())
+        return digest.hexdigest()
+
+    def _load(self):
+        if not self._loaded:
+            self._loaded = True
+            if os.path.exists(self.path):
+                with np.load(self.path) as gains:
+                    self._gains.update({key: gains[key] for key in gains.files})
+
+    def gain(self, A, B, Q, R, freq, method, discretize):
+        """Gain K of the discrete LQR.
+
+        Args:
+            A, B: Continuous linear model (only used as key)
+            Q, R: Weights of the states and the actions
+            freq: Sample frequency
+            method: Name of the discretization method (only used as key)
+            discretize: Callable `f(freq) -> (Ad, Bd)` which returns the discrete model, only called on a cache miss
+
+        Returns:
+            The gain matrix K of shape (1, 4)
+        """
+        self._load()
+        key = self.key(A, B, Q, R, freq, method)
+        K = self._gains.get(key)
+        if K is None:
+            Ad, Bd = discretize(freq)
+            K = dlqr(Ad, Bd, Q, R)
+            self._gains[key] = K
+            if self.path is not None:
+                self.save()
+        return K
+
+    def save(self, path=None):
+        """Writes all gains to `path` (by default the path of the cache)."""
+        path = path if path is not None else self.path
+        self._load()
+        # Replaced atomically, other processes might read the file at the same time
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **self._gains)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        self._gains.clear()
+        self._loaded = True
+
+
+LQR_GAIN_CACHE = LQRGainCache(os.environ.get("GYM_BRT_LQR_CACHE"))
+
+
 class QubeFlipUpControl(Control):
     """Classical controller to hold the pendulum upright whenever the
     angle is within 20 degrees, and flips up the pendulum whenever
     outside 20 degrees.
+
+    By default the LQR gains are calculated from the linear model of the
+    Quanser workbook. If `params` (a `QubeParams` instance) is given, the
+    model is instead linearized analytically from the dynamics of the ODE
+    simulation with these parameters.
+
+    The gains are memoized in `gain_cache` (by default the shared
+    `LQR_GAIN_CACHE`), so that only the first controller for a model and
+    sample frequency solves the Riccati equations.
     """
 
     start = True
 
     def __init__(self, env=None, action_shape=(1,), sample_freq=1000,
-                 **kwargs):
+                 params=None, gain_cache=None, **kwargs):
         super(QubeFlipUpControl, self).__init__(env=env, action_shape=action_shape)
         self.sample_freq = sample_freq
+        self.params = params
+        self.gain_cache = gain_cache if gain_cache is not None else LQR_GAIN_CACHE
         self.kp_theta, self.kp_alpha, self.kd_theta, self.kd_alpha = self._get_optimized_gains()
 
     def _get_optimized_gains(self):
@@ -157,34 +268,42 @@ class QubeFlipUpControl(Control):
         voltage = (rm / kt) * torque
         return -voltage
 
-    def _dlqr(self, A, B, Q, R):
-        """
-        Solve the discrete time lqr controller.
-        x[k+1] = A x[k] + B u[k]
-        cost = sum x[k].T*Q*x[k] + u[k].T*R*u[k]
-        """
-        # first, solve the ricatti equation
-        P = np.array(linalg.solve_discrete_are(A, B, Q, R))
-        # compute the LQR gain
-        K = np.array((linalg.inv(B.T.dot(P).dot(B) + R)).dot(B.T.dot(P).dot(A)))
-        return K
+    def _continuous_model(self):
+        """Continuous linear model (A, B) of the upright pendulum and the method `_linearize` discretizes it with."""
+        if self.params is None:
+            return WORKBOOK_A, WORKBOOK_B, "zoh"
+        from gym_brt.quanser.qube_simulator import continuous_jacobians
+        A, B = continuous_jacobians(np.zeros(4), 0.0, params=self.params)
+        # Same sign convention as in `_linearize`
+        return A, -B, "rk4"
+
+    def _linearize(self, freq):
+        """Discrete linear model of the upright pendulum for the sample frequency `freq`."""
+        if self.params is None:
+            A, B = WORKBOOK_A, WORKBOOK_B
+            C = np.array([[1, 0, 0, 0]])
+            D = np.array([[0]])
+            from scipy import signal
+            (Ad, Bd, Cd, Dd, dt) = signal.cont2discrete((A, B, C, D), 1 / freq, method='zoh')
+            return Ad, Bd
+
+        # Imported here, since the Qube interfaces themselves depend on this module
+        from gym_brt.quanser.qube_simulator import discrete_jacobians
+        Ad, Bd = discrete_jacobians(np.zeros(4), 0.0, 1 / freq, method="rk4", params=self.params)
+        # The voltage of the simulation has the opposite sign of the workbook model, which the gains are applied for
+        return Ad, -Bd
 
     def _calculate_lqr(self, freq=None):
         if freq is None:
             freq = self.sample_freq
-        A = np.array([[0, 0, 1, 0], [0, 0, 0, 1], [0, 149.2751, -0.0104, 0], [0, 261.6091, -0.0103, 0]])
-        B = np.array([[0], [0], [49.7275], [49.1493]])
-        C = np.array([[1, 0, 0, 0]])
-        D = np.array([[0]])
-        (Ad, Bd, Cd, Dd, dt) = signal.cont2discrete((A, B, C, D), 1 / freq, method='zoh')
-
         Q = np.eye(4)
         Q[0, 0] = 12
         Q[1, 1] = 5
         Q[2, 2] = 1
         R = np.array([[1]]) * 1
 
-        K = self._dlqr(Ad, Bd, Q, R)
+        A, B, method = self._continuous_model()
+        K = self.gain_cache.gain(A, B, Q, R, freq, method, self._linearize)
         kp_theta = K[0, 0]
         kp_alpha = K[0, 1]
         kd_theta = K[0, 2]
@@ -218,6 +337,25 @@ class QubeFlipUpControl(Control):
         return voltages
 
 
+def precompute_lqr_gains(frequencies, params=None, gain_cache=None):
+    """Fills the gain cache with the LQR gains of `QubeFlipUpControl` for all `frequencies`.
+
+    Args:
+        frequencies: Sample frequencies of the controllers which will be created
+        params: Physical parameters (`QubeParams`) the controllers will be created with (`None` for the workbook model)
+        gain_cache: Cache to fill (by default `LQR_GAIN_CACHE`)
+
+    Returns:
+        Dict of the gains `(kp_theta, kp_alpha, kd_theta, kd_alpha)` for each frequency
+    """
+    gain_cache = gain_cache if gain_cache is not None else LQR_GAIN_CACHE
+    table = {}
+    for freq in frequencies:
+        controller = QubeFlipUpControl(sample_freq=freq, params=params, gain_cache=gain_cache)
+        table[freq] = (controller.kp_theta, controller.kp_alpha, controller.kd_theta, controller.kd_alpha)
+    return table
+
+
 class QubeHoldControl(QubeFlipUpControl):
     """Classical controller to hold the pendulum upright whenever the
     angle is within 20 degrees. (Same as QubeFlipUpControl but without a
@@ -226,11 +364,118 @@ class QubeHoldControl(QubeFlipUpControl):
 
     def __init__(self, env, sample_freq=1000, **kwargs):
         super(QubeHoldControl, self).__init__(
-            env, sample_freq=sample_freq)
+            env, sample_freq=sample_freq, **kwargs)
 
     def _flip_up(self, theta, alpha, theta_dot, alpha_dot):
         return 0
 
+
+class QubeMPPIControl(Control):
+    """Sampling-based model predictive controller (model predictive path
+    integral control, MPPI) for the swing-up and balance of the pendulum.
+
+    Every call of `action` perturbs the current voltage sequence with
+    Gaussian noise, simulates all `num_samples` candidate sequences over the
+    `horizon` with a single batched rollout of the ODE simulation and
+    averages them weighted by the exponential of their negative costs. The
+    first voltage is applied and the remaining sequence is used as warm start
+    for the next call.
+
+    The time of the last call of `action` (in seconds) is stored in
+    `solve_time`, the longest one in `max_solve_time`.
+    """
+
+    def __init__(self, env=None, action_shape=(1,), sample_freq=config.FREQUENCY,
+                 num_samples=256, horizon=40, noise_sigma=2.0, temperature=1.0,
+                 integration_steps=1, method="rk4", params=None,
+                 max_voltage=config.QUBE_MAX_VOLTAGE, cost=None, seed=None,
+                 **kwargs):
+        """
+        Args:
+            sample_freq: Control frequency, also the time step of the rollouts
+            num_samples: Number of candidate voltage sequences per call
+            horizon: Number of time steps of each candidate sequence
+            noise_sigma: Standard deviation of the voltage perturbations
+            temperature: Temperature of the weighting, smaller values
+                favor the best sequences more
+            integration_steps: Integration steps of the rollouts per time step
+            method: Integration method of the rollouts (`rk4` or `euler`)
+            params: Parameters of the simulated Qube (`QubeParams`)
+            max_voltage: Voltages are clipped into the range of +- max_voltage
+            cost: Function `cost(states, actions)` returning the cost of each
+                sequence given the states (num_samples, horizon + 1, 4) and
+                voltages (num_samples, horizon); defaults to `swing_up_cost`
+            seed: Seed of the noise
+        """
+        # Imported here, since the Qube interfaces themselves depend on this module
+        from gym_brt.quanser.qube_simulator import DEFAULT_PARAMS, rollout
+
+        super(QubeMPPIControl, self).__init__(env=env, action_shape=action_shape)
+        if method not in ("euler", "rk4"):
+            raise ValueError("'method' must be one of ['euler', 'rk4'].")
+        self.sample_freq = sample_freq
+        self._rollout = rollout
+        self._dt = 1.0 / sample_freq
+        self._num_samples = num_samples
+        self._horizon = horizon
+        self._noise_sigma = noise_sigma
+        self._temperature = temperature
+        self._integration_steps = integration_steps
+        self._method = method
+        self._params = params if params is not None else DEFAULT_PARAMS
+        self._max_voltage = max_voltage
+        self._cost = cost if cost is not None else self.swing_up_cost
+        self._np_random = np.random.RandomState(seed)
+
+        self._sequence = np.zeros(horizon, dtype=np.float64)
+        self._actions = np.zeros((num_samples, horizon), dtype=np.float64)
+        self._init_states = np.zeros((num_samples, 4), dtype=np.float64)
+        self.solve_time = 0.0
+        self.max_solve_time = 0.0
+        # Load the compiled rollout now, so that the first call of `action` stays within the control period as well
+        self._rollout(self._init_states[:1], self._actions[:1, :1], self._dt, self._integration_steps,
+                      method=self._method, params=self._params)
+
+    @staticmethod
+    def swing_up_cost(states, actions):
+        """Cost of swinging up and balancing the pendulum at theta = 0."""
+        theta, alpha = states[:, 1:, 0], states[:, 1:, 1]
+        theta_dot, alpha_dot = states[:, 1:, 2], states[:, 1:, 3]
+        stage = 10.0 * (1.0 - np.cos(alpha)) + 1.0 * theta ** 2 \
+            + 0.01 * theta_dot ** 2 + 0.01 * alpha_dot ** 2 + 0.01 * actions ** 2
+        # Theta beyond the limits of the arm
+        stage += 100.0 * (np.abs(theta) > (80.0 * np.pi / 180.0))
+        return stage.sum(axis=1)
+
+    def reset(self):
+        """Forget the warm start (e.g. at the beginning of an episode)."""
+        self._sequence[:] = 0.0
+
+    def action(self, state):
+        start = time.perf_counter()
+        self._init_states[:] = _convert_state(state)[:4]
+
+        # Warm start: shift the last sequence by one step
+        self._sequence[:-1] = self._sequence[1:]
+        self._sequence[-1] = 0.0
+
+        noise = self._np_random.normal(0.0, self._noise_sigma, size=self._actions.shape)
+        np.add(self._sequence, noise, out=self._actions)
+        np.clip(self._actions, -self._max_voltage, self._max_voltage, out=self._actions)
+
+        states = self._rollout(self._init_states, self._actions, self._dt, self._integration_steps,
+                               method=self._method, max_voltage=self._max_voltage, params=self._params)
+        costs = self._cost(states, self._actions)
+        weights = np.exp(-(costs - costs.min()) / self._temperature)
+        weights /= weights.sum()
+        self._sequence[:] = weights.dot(self._actions)
+
+        voltages = np.array([self._sequence[0]], dtype=np.float64)
+        self.solve_time = time.perf_counter() - start
+        self.max_solve_time = max(self.max_solve_time, self.solve_time)
+        return voltages
+
+
 # # No input
 # def zero_policy(state, **kwargs):
 #     return np.array([0.0])
@@ -1,6 +1,10 @@
 from gym_brt.envs.reinforcementlearning_extensions.rl_reward_functions import (
     swing_up_reward,
-    balance_reward
+    balance_reward,
+    swing_up_reward_batch,
+    balance_reward_batch,
+    extended_swing_up_reward_batch,
+    exp_swing_up_reward_batch,
 )
 
 from gym_brt.envs.qube_balance_env import (
@@ -20,29 +24,6 @@ from gym_brt.envs.reinforcementlearning_extensions.rl_gym_classes import (
     convert_state_back
 )
 
-from gym.envs.registration import register
-
-register(
-    id='QubeBeginDownEnv-v1',
-    entry_point='gym_brt.envs:QubeBeginDownEnv',
-    )
-
-register(
-    id='QubeSwingupEnv-v1',
-    entry_point='gym_brt.envs:QubeSwingupEnv',
-    )
-
-register(
-    id='QubeBeginUpEnv-v1',
-    entry_point='gym_brt.envs:QubeBeginUpEnv',
-    )
-
-register(
-    id='QubeNoisyEnv-v1',
-    entry_point='gym_brt.envs:NoisyEnv',
-    )
-
-register(
-    id='QubeRandomStartEnv-v1',
-    entry_point='gym_brt.envs:RandomStartEnv',
-    )
\ No newline at end of file
+from gym_brt.envs.qube_vec_env import (
+    QubeVecEnv,
+)
@@ -72,6 +72,8 @@ class QubeBalanceSparseEnv(QubeBalanceEnv):
 
 
 class QubeBalanceFollowEnv(QubeBalanceEnv):
+    _observe_target_angle = True
+
     def __init__(self, **kwargs):
         super(QubeBalanceFollowEnv, self).__init__(**kwargs)
         obs_max = np.asarray(
@@ -79,19 +81,6 @@ class QubeBalanceFollowEnv(QubeBalanceEnv):
         )
         self.observation_space = spaces.Box(-obs_max, obs_max)
 
-    def _get_state(self):
-        state = np.array(
-            [
-                self._theta,
-                self._alpha,
-                self._theta_dot,
-                self._alpha_dot,
-                self._target_angle,
-            ],
-            dtype=np.float64,
-        )
-        return state
-
     def _next_target_angle(self):
         # Update the target angle twice a second on average at random intervals
         if np.random.randint(1, self._frequency / 2) == 1:
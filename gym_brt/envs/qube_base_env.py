@@ -9,17 +9,17 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
+import math
+import time
+
 import gym
 import numpy as np
 
 from gym import spaces
 from gym.utils import seeding
 
-# For other platforms where it's impossible to install the HIL SDK
-try:
-    from gym_brt.quanser import QubeHardware
-except ImportError:
-    print("Warning: Can not import QubeHardware in qube_base_env.py")
+from gym_brt.quanser import QubeHardware
+from gym_brt.quanser.timing import StepTimer
 
 
 MAX_MOTOR_VOLTAGE = 18
@@ -31,6 +31,14 @@ def normalize_angle(angle):
     return angle/np.pi
 
 
+def _defining_class(cls, name):
+    """Class in the MRO of `cls` which defines the attribute `name`."""
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return klass
+    return None
+
+
 class QubeBaseEnv(gym.Env):
     """Base class for all qube-based environments.
 
@@ -62,21 +70,44 @@ class QubeBaseEnv(gym.Env):
                 state, reward, done, info = env.step(action)
     ```
     Instead it can also be closed manually by using explicitly calling `env.close()` inside a try-finally statement.
+
+    With `fast_step=True` the environment avoids creating new Python objects in every step: the action is clipped into
+    a preallocated buffer, the LED color is fixed and the observation is written into a preallocated array by
+    `_write_state`. The returned observation is therefore overwritten by the next call of `step` or `reset` and has to
+    be copied if it should be kept. The `info` of every step is a new dict; with `step_info=False` it stays empty
+    (apart from the `timing` of the last step of an episode) instead of holding the state of the Qube.
+
+    With `timing_stats=True` the wall time of every step is recorded in constant-memory histograms, split into the
+    sensor read (step of the Qube), the reward and the remaining bookkeeping, together with the number of control
+    period overruns and missed HIL samples (hardware only). The statistics of an episode are added to the `info` of its
+    last step under the key `timing`, the statistics of all steps are returned by `get_timing_stats()`.
     """
 
+    # Layout of the observation of `_get_state` and `_write_state`: the angles as cosine and sine instead of radians and
+    # the target angle as an additional last element
+    _trigonometric_angles = False
+    _observe_target_angle = False
+
     def __init__(self, frequency=250, batch_size=2048, use_simulator=False, simulation_mode='ode',
-                 integration_steps=10, encoder_reset_steps=int(1e8),):
+                 integration_steps=10, encoder_reset_steps=int(1e8), fast_step=False, timing_stats=False,
+                 hardware_options=None, step_info=True):
         """Starting point for the creation of new instances of a Qube (both simulation and hardware).
 
         Args:
             frequency: Sample frequency
             batch_size: Number of timesteps of a single episode
             use_simulator: Specifies if a simulator should be used instead of the hardware
-            simulation_mode: If `use_simulator=True` this specifies the used simulator; either `ode`, `mujoco` or
-                            `bullet`; does not affect the hardware classes
+            simulation_mode: If `use_simulator=True` this specifies the used simulator; either `ode`, `euler`,
+                            `euler_jit` (compiled Euler integration), `rk4` (compiled fixed-step Runge-Kutta
+                            integration of the ODE), `mujoco` or `bullet`; does not affect the hardware classes
             integration_steps: Number of integration steps of the simulation during a single timestep; does not affect
                                 the hardware classes
             encoder_reset_steps: Number of timesteps to be done after the hardware encoders should be reinitialized
+            fast_step: Reuse preallocated buffers for the action and the observation in every step
+            timing_stats: Record the timing of every step (see `get_timing_stats`)
+            hardware_options: Additional keyword arguments of `QubeHardware` (e.g. `control_thread=True` or
+                                `velocity_filter="kalman"`); does not affect the simulators
+            step_info: Add the state (`theta`, `alpha`, `theta_dot` and `alpha_dot`) to the info of every step
         """
         self.observation_space = spaces.Box(-OBS_MAX, OBS_MAX, dtype=np.float64)
         self.action_space = spaces.Box(-ACT_MAX, ACT_MAX, dtype=np.float64)
@@ -96,9 +127,22 @@ class QubeBaseEnv(gym.Env):
         self._theta, self._alpha, self._theta_dot, self._alpha_dot = 0, 0, 0, 0
         self._dtheta, self._dalpha = 0, 0
 
+        self._fast_step = fast_step
+        self._zero_action = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
+        self._action_buffer = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
+        self._clip_buffer = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
+        self._action_min = -ACT_MAX
+        self._led_buffer = np.asarray(self._led(), dtype=np.float64)
+        self._step_info = step_info
+        # Created on first use, subclasses define their observation space after this constructor
+        self._observation_buffer = None
+        # Observations can only be written in place if `_write_state` matches the `_get_state` of the subclass
+        self._write_observation = _defining_class(type(self), "_write_state") is \
+            _defining_class(type(self), "_get_state")
+
         # Open the Qube: This means create the appropriate interface (simulation or hardware)
         if use_simulator:
-            if simulation_mode == 'ode' or simulation_mode == 'euler':
+            if simulation_mode in ('ode', 'euler', 'euler_jit', 'rk4'):
                 # TODO: Check assumption: ODE integration should be ~ once per ms
                 from gym_brt.quanser import QubeSimulator
                 #integration_steps = int(np.ceil(1000 / self._frequency))
@@ -128,12 +172,20 @@ class QubeBaseEnv(gym.Env):
                 self._own_rendering = False
             else:
                 raise ValueError(f"Unsupported simulation type '{simulation_mode}'. "
-                                 f"Valid ones are 'ode', 'mujoco' and 'bullet'.")
+                                 f"Valid ones are 'ode', 'euler', 'euler_jit', 'rk4', 'mujoco' and 'bullet'.")
         else:
-            self.qube = QubeHardware(frequency=self._frequency, max_voltage=MAX_MOTOR_VOLTAGE)
+            # The fast step passes preallocated float64 arrays, which do not have to be validated by the wrapper
+            hardware_options = dict({"trusted_actions": fast_step}, **(hardware_options or {}))
+            self.qube = QubeHardware(frequency=self._frequency, max_voltage=MAX_MOTOR_VOLTAGE, **hardware_options)
             self._own_rendering = True
         self.qube.__enter__()
 
+        # Timing of the current episode and of all previous episodes
+        self._episode_timing = StepTimer(frequency) if timing_stats else None
+        self._timing = StepTimer(frequency) if timing_stats else None
+        self._last_step_start = None
+        self._samples_overflowed = self._missed_samples()
+
         self.seed()
         self._viewer = None
 
@@ -161,43 +213,149 @@ class QubeBaseEnv(gym.Env):
         return [seed]
 
     def _step(self, action):
-        led = self._led()
-
-        action = np.clip(np.array(action, dtype=np.float64), -ACT_MAX, ACT_MAX)
+        if self._fast_step:
+            led = self._led_buffer
+            # Unlike `np.clip` the ufuncs with a positional output (which must not be an input as well) do not allocate
+            # any temporary objects
+            np.minimum(action, ACT_MAX, self._clip_buffer)
+            action = np.maximum(self._clip_buffer, self._action_min, self._action_buffer)
+        else:
+            led = self._led()
+            action = np.clip(np.array(action, dtype=np.float64), -ACT_MAX, ACT_MAX)
         state = self.qube.step(action, led=led)
 
         self._dtheta = state[0] - self._theta
         self._dalpha = state[1] - self._alpha
         self._theta, self._alpha, self._theta_dot, self._alpha_dot = state
 
+    def _missed_samples(self):
+        # Only the hardware counts missed samples of the HIL task
+        return getattr(self.qube, "samples_overflowed", 0)
+
+    def _finish_episode_timing(self):
+        """Moves the timing statistics of the current episode to the ones of all episodes."""
+        timing = self._episode_timing
+        samples_overflowed = self._missed_samples()
+        timing.missed_samples = samples_overflowed - self._samples_overflowed
+        self._samples_overflowed = samples_overflowed
+        self._timing.merge(timing)
+        timing.clear()
+        self._last_step_start = None
+
+    def get_timing_stats(self):
+        """Timing statistics of all steps so far or `None` if the environment was created without `timing_stats`.
+
+        Returns:
+            Dict with the count, mean, p50, p99 and max duration (in us) of the phases `read`, `bookkeeping`, `reward`,
+            `step` and `interval` (time between two steps) as well as the control `period_us` and the number of
+            `overruns` and `missed_samples`; with the control thread of the hardware also its statistics under the key
+            `control_thread` (see `QubeHardware.get_control_stats`)
+        """
+        if self._timing is None:
+            return None
+        stats = StepTimer(self._frequency)
+        stats.merge(self._timing)
+        stats.merge(self._episode_timing)
+        stats.missed_samples += self._missed_samples() - self._samples_overflowed
+        summary = stats.summary()
+        control_stats = getattr(self.qube, "get_control_stats", lambda: None)()
+        if control_stats is not None:
+            summary["control_thread"] = control_stats
+        return summary
+
     def reset(self):
+        if self._timing is not None:
+            self._finish_episode_timing()
         self._episode_reward = 0
         self._episode_steps = 0
         # Occasionaly reset the encoders to remove sensor drift
         if self._steps_since_encoder_reset >= self._encoder_reset_steps:
             self.qube.reset_encoders()
             self._steps_since_encoder_reset = 0
-        action = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
-        self._step(action)
-        return self._get_state()
+        self._step(self._zero_action)
+        return self._observation()
 
     def _reset_up(self):
         self.qube.reset_up()
-        action = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
-        self._step(action)
-        return self._get_state()
+        self._step(self._zero_action)
+        return self._observation()
 
     def _reset_down(self):
         self.qube.reset_down()
-        action = np.zeros(shape=self.action_space.shape, dtype=self.action_space.dtype)
-        self._step(action)
-        return self._get_state()
+        self._step(self._zero_action)
+        return self._observation()
+
+    def get_state(self):
+        """Snapshot of the simulation and the current episode which can be restored by `set_state` (simulation only).
+
+        Restoring a snapshot continues the episode from this point, e.g. to branch several rollouts from the same state
+        or to restart an episode from the middle of a trajectory.
+
+        Returns:
+            Dict with the state of the simulated Qube (see `get_state` of the simulators) and the episode bookkeeping
+        """
+        return {
+            "qube": self.qube.get_state(),
+            "dtheta": self._dtheta,
+            "dalpha": self._dalpha,
+            "episode_steps": self._episode_steps,
+            "episode_reward": self._episode_reward,
+            "target_angle": self._target_angle,
+        }
+
+    def set_state(self, state):
+        """Restores a snapshot of `get_state` or sets the Qube to the state `[theta, alpha, theta_dot, alpha_dot]`.
+
+        Unlike a snapshot, a plain state only changes the simulated Qube and the current episode goes on (this can be
+        used to reset an episode to an arbitrary state after `reset`).
+
+        Args:
+            state: Snapshot returned by `get_state` or array-like state `[theta, alpha, theta_dot, alpha_dot]`
+
+        Returns:
+            The observation of the new state
+        """
+        if isinstance(state, dict):
+            qube_state = self.qube.set_state(state["qube"])
+            self._dtheta, self._dalpha = state["dtheta"], state["dalpha"]
+            self._episode_steps = state["episode_steps"]
+            self._episode_reward = state["episode_reward"]
+            self._target_angle = state["target_angle"]
+        else:
+            qube_state = self.qube.set_state(state)
+            self._dtheta, self._dalpha = 0, 0
+        self._theta, self._alpha, self._theta_dot, self._alpha_dot = qube_state
+        return self._observation()
 
     def _get_state(self):
-        return np.array(
-            [self._theta, self._alpha, self._theta_dot, self._alpha_dot],
-            dtype=np.float64,
-        )
+        state = np.empty(4 + 2 * self._trigonometric_angles + self._observe_target_angle, dtype=np.float64)
+        self._write_state(state)
+        return state
+
+    def _write_state(self, out):
+        """Same as `_get_state` but writes the observation into the preallocated array `out`."""
+        if self._trigonometric_angles:
+            out[0] = math.cos(self._theta)
+            out[1] = math.sin(self._theta)
+            out[2] = math.cos(self._alpha)
+            out[3] = math.sin(self._alpha)
+            out[4] = self._theta_dot
+            out[5] = self._alpha_dot
+        else:
+            out[0] = self._theta
+            out[1] = self._alpha
+            out[2] = self._theta_dot
+            out[3] = self._alpha_dot
+        if self._observe_target_angle:
+            out[-1] = self._target_angle
+
+    def _observation(self):
+        if not (self._fast_step and self._write_observation):
+            return self._get_state()
+        if self._observation_buffer is None:
+            self._observation_buffer = np.zeros(self.observation_space.shape, dtype=np.float64)
+        self._write_state(self._observation_buffer)
+        return self._observation_buffer
 
     def _next_target_angle(self):
         return 0
@@ -222,22 +380,42 @@ class QubeBaseEnv(gym.Env):
         return led
 
     def step(self, action):
+        timing = self._episode_timing
+        if timing is not None:
+            start = time.perf_counter_ns()
         self._step(action)
-        state = self._get_state()
+        if timing is not None:
+            read_end = time.perf_counter_ns()
+        state = self._observation()
+        if timing is not None:
+            reward_start = time.perf_counter_ns()
         reward = self._reward()
         done = self._isdone()
+        if timing is not None:
+            reward_end = time.perf_counter_ns()
         self._episode_reward += reward
-        info = {
-            "theta": self._theta,
-            "alpha": self._alpha,
-            "theta_dot": self._theta_dot,
-            "alpha_dot": self._alpha_dot,
-        }
+        if self._step_info:
+            info = {
+                "theta": self._theta,
+                "alpha": self._alpha,
+                "theta_dot": self._theta_dot,
+                "alpha_dot": self._alpha_dot,
+            }
+        else:
+            info = {}
 
         self._episode_steps += 1
         self._steps_since_encoder_reset += 1
         self._target_angle = self._next_target_angle()
 
+        if timing is not None:
+            interval = start - self._last_step_start if self._last_step_start is not None else None
+            self._last_step_start = start
+            timing.record(read_end - start, reward_end - reward_start, time.perf_counter_ns() - start, interval)
+            if done:
+                timing.missed_samples = self._missed_samples() - self._samples_overflowed
+                info["timing"] = timing.summary()
+
         return state, reward, done, info
 
     def render(self, mode="human", width=1024, height=1024):
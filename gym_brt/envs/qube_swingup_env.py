@@ -70,6 +70,8 @@ class QubeSwingupSparseEnv(QubeSwingupEnv):
 
 
 class QubeSwingupFollowEnv(QubeSwingupEnv):
+    _observe_target_angle = True
+
     def __init__(self, **kwargs):
         super(QubeSwingupFollowEnv, self).__init__(**kwargs)
         obs_max = np.asarray(
@@ -77,19 +79,6 @@ class QubeSwingupFollowEnv(QubeSwingupEnv):
         )
         self.observation_space = spaces.Box(-obs_max, obs_max)
 
-    def _get_state(self):
-        state = np.array(
-            [
-                self._theta,
-                self._alpha,
-                self._theta_dot,
-                self._alpha_dot,
-                self._target_angle,
-            ],
-            dtype=np.float64,
-        )
-        return state
-
     def _next_target_angle(self):
         # Update the target angle twice a second on average at random intervals
         if np.random.randint(1, self._frequency / 2) == 1:
@@ -0,0 +1,220 @@
+"""Vectorized Qube environments for the ODE simulation.
+
+Instead of stepping a separate `QubeBaseEnv` (and a separate scalar simulation) for each environment, `QubeVecEnv` holds
+the states of all simulated Qubes in a single array and advances them with one call of a batched forward model. The
+reward, the termination and the automatic reset are computed on the whole batch as well, so that thousands of
+environments can be stepped in a single process:
+
+```python
+from gym_brt.envs import QubeVecEnv
+
+env = QubeVecEnv(num_envs=1024, task="swingup", frequency=250)
+obs = env.reset()
+for step in range(1000):
+    obs, rewards, dones, infos = env.step(env.action_space.sample())
+```
+
+The observations are the trigonometric states of `QubeBeginDownEnv`/`QubeBeginUpEnv`:
+`[cos(theta), sin(theta), cos(alpha), sin(alpha), theta_dot, alpha_dot]`.
+
+For domain randomization each sub-environment can simulate a Qube with its own physical parameters, which are drawn
+again whenever the sub-environment is reset:
+
+```python
+env = QubeVecEnv(num_envs=1024, param_distributions={
+    "Rm": (7.5, 9.5),  # uniform
+    "mp": lambda np_random, size: np_random.normal(0.04, 0.002, size),
+})
+```
+"""
+from types import MappingProxyType
+
+import numpy as np
+from gym import spaces
+from gym.utils import seeding
+from gym.vector import VectorEnv
+
+from gym_brt.envs.qube_base_env import ACT_MAX, MAX_MOTOR_VOLTAGE
+from gym_brt.envs.reinforcementlearning_extensions.rl_gym_classes import OBS_MAX
+from gym_brt.envs.reinforcementlearning_extensions.rl_reward_functions import (
+    balance_reward_batch,
+    swing_up_reward_batch,
+)
+from gym_brt.quanser.qube_simulator import (
+    DEFAULT_PARAMS,
+    QubeParams,
+    forward_model_euler_batch,
+    forward_model_euler_batch_jit,
+    forward_model_rk4_batch,
+)
+
+BATCHED_FORWARD_MODELS = {
+    "euler_batch": forward_model_euler_batch,
+    "euler_jit": forward_model_euler_batch_jit,
+    "rk4": forward_model_rk4_batch,
+}
+
+# Info of all sub-environments which were not reset in a step
+EMPTY_INFO = MappingProxyType({})
+
+
+class QubeVecEnv(VectorEnv):
+    """Vectorized swing-up (`QubeBeginDownEnv`) and balance (`QubeBeginUpEnv`) task for the ODE simulation.
+
+    Sub-environments are reset automatically once they are done. In this case the returned observation is already the
+    first observation of the next episode and the last observation of the finished episode can be found in the info
+    dict of the sub-environment under the key `terminal_observation`, together with the return (`episode_reward`) and
+    the length (`episode_steps`) of the episode. Only these sub-environments get a new info dict,
+    the infos of all others are the same read-only empty mapping (`EMPTY_INFO`).
+    """
+
+    def __init__(self, num_envs=1024, task="swingup", frequency=250, batch_size=2048, integration_steps=10,
+                 forward_model="rk4", params=None, param_distributions=None, copy=True):
+        """Creates `num_envs` simulated Qubes which are all stepped at once.
+
+        Args:
+            num_envs: Number of sub-environments
+            task: Either `swingup` (pendulum starts downwards) or `balance` (pendulum starts upright)
+            frequency: Sample frequency
+            batch_size: Number of timesteps of a single episode
+            integration_steps: Number of integration steps of the simulation during a single timestep
+            forward_model: Batched forward model; either `rk4`, `euler_jit` or `euler_batch`
+            params: Physical parameters of the simulated Qubes (`QubeParams`, either shared or for `num_envs` Qubes)
+            param_distributions: Dict of parameter distributions (see `QubeParams.sample`) from which the parameters of
+                                 a sub-environment are drawn on each reset; other parameters are taken from a copy of
+                                 `params`
+            copy: If `True` the returned observations are copies of the internal buffer
+        """
+        if task not in ("swingup", "balance"):
+            raise ValueError(f"Unsupported task '{task}'. Valid ones are 'swingup' and 'balance'.")
+        if forward_model not in BATCHED_FORWARD_MODELS:
+            raise ValueError(f"Unsupported forward model '{forward_model}'. "
+                             f"Valid ones are {list(BATCHED_FORWARD_MODELS)}.")
+        super(QubeVecEnv, self).__init__(
+            num_envs=num_envs,
+            observation_space=spaces.Box(-OBS_MAX, OBS_MAX, dtype=np.float64),
+            action_space=spaces.Box(-ACT_MAX, ACT_MAX, dtype=np.float64),
+        )
+        self.reward_range = (-float(0.), float(1.))
+
+        self._task = task
+        self._frequency = frequency
+        self._dt = 1.0 / frequency
+        self._max_episode_steps = batch_size
+        self._integration_steps = integration_steps
+        self._forward_model = BATCHED_FORWARD_MODELS[forward_model]
+        params = params if params is not None else DEFAULT_PARAMS
+        if params.num_qubes not in (None, num_envs):
+            raise ValueError(f"'params' are given for {params.num_qubes} Qubes but there are {num_envs} environments.")
+        self._param_distributions = param_distributions
+        if param_distributions:
+            # Per-environment copy of the parameters which is resampled in place (the parameters of the caller are never
+            # changed)
+            params = QubeParams(**params.as_dict(), num_qubes=num_envs)
+        self._params = params
+        self._copy = copy
+        self._target_angle = 0.0
+        self._reward_function = swing_up_reward_batch if task == "swingup" else balance_reward_batch
+        # Alpha at the start of an episode (pendulum downwards for the swing-up, upright for the balance task)
+        self._alpha_start = np.pi if task == "swingup" else 0.0
+
+        self._states = np.zeros((num_envs, 4), dtype=np.float64)
+        self._observations = np.zeros((num_envs, 6), dtype=np.float64)
+        self._episode_steps = np.zeros(num_envs, dtype=np.int64)
+        self._episode_rewards = np.zeros(num_envs, dtype=np.float64)
+        self._zero_actions = np.zeros(num_envs, dtype=np.float64)
+        self._actions = self._zero_actions
+
+        self.seed()
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @property
+    def params(self):
+        """Physical parameters of the simulated Qubes (per sub-environment with parameter distributions)."""
+        return self._params
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def _reset_envs(self, mask=None):
+        """Reset all sub-environments or only the ones selected by the boolean `mask`.
+
+        Like `QubeBaseEnv.reset` a single step with zero voltage is made after the new state is set. With parameter
+        distributions the physical parameters of the reset sub-environments are drawn again beforehand.
+        """
+        if self._param_distributions:
+            self._params.sample(self._param_distributions, self.np_random, mask)
+        coefficients = self._params.coefficients
+        if coefficients.ndim == 2 and mask is not None:
+            coefficients = coefficients[mask]
+
+        num_reset = self.num_envs if mask is None else int(np.count_nonzero(mask))
+        states = np.array([0, self._alpha_start, 0, 0], dtype=np.float64) \
+            + self.np_random.normal(0.0, 0.01, size=(num_reset, 4))
+        states = self._forward_model(states, self._zero_actions[:num_reset], self._dt, self._integration_steps,
+                                     coefficients)
+        if mask is None:
+            self._states[:] = states
+            self._episode_steps[:] = 0
+            self._episode_rewards[:] = 0
+        else:
+            self._states[mask] = states
+            self._episode_steps[mask] = 0
+            self._episode_rewards[mask] = 0
+
+    def _get_observations(self):
+        theta, alpha = self._states[:, 0], self._states[:, 1]
+        np.cos(theta, out=self._observations[:, 0])
+        np.sin(theta, out=self._observations[:, 1])
+        np.cos(alpha, out=self._observations[:, 2])
+        np.sin(alpha, out=self._observations[:, 3])
+        self._observations[:, 4:] = self._states[:, 2:]
+        return self._observations.copy() if self._copy else self._observations
+
+    def _reward(self):
+        # Same as `swing_up_reward` and `balance_reward` for each sub-environment
+        return self._reward_function(self._states, target_angle=self._target_angle)
+
+    def _isdone(self):
+        theta, alpha = self._states[:, 0], self._states[:, 1]
+        done = self._episode_steps >= self._max_episode_steps
+        done |= np.abs(theta) > (90 * np.pi / 180)
+        if self._task == "balance":
+            done |= np.abs(alpha) > (20 * np.pi / 180)
+        return done
+
+    def reset_wait(self, **kwargs):
+        self._reset_envs()
+        return self._get_observations()
+
+    def step_async(self, actions):
+        actions = np.asarray(actions, dtype=np.float64).reshape((self.num_envs,))
+        self._actions = np.clip(actions, -MAX_MOTOR_VOLTAGE, MAX_MOTOR_VOLTAGE)
+
+    def step_wait(self, **kwargs):
+        self._states = self._forward_model(self._states, self._actions, self._dt, self._integration_steps,
+                                           self._params)
+        rewards = self._reward()
+        dones = self._isdone()
+        self._episode_rewards += rewards
+        self._episode_steps += 1
+
+        infos = [EMPTY_INFO] * self.num_envs
+        if dones.any():
+            terminal_observations = self._get_observations()[dones]
+            for i, terminal_observation in zip(np.flatnonzero(dones), terminal_observations):
+                infos[i] = {
+                    "terminal_observation": terminal_observation,
+                    "episode_reward": float(self._episode_rewards[i]),
+                    "episode_steps": int(self._episode_steps[i]),
+                }
+            self._reset_envs(dones)
+
+        return self._get_observations(), rewards, dones, infos
+
+    def close_extras(self, **kwargs):
+        pass
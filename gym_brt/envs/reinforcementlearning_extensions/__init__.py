@@ -1,2 +1,4 @@
 from gym_brt.envs.reinforcementlearning_extensions.wrapper import TrigonometricObservationWrapper, \
     convert_single_state, convert_states_array, ImageObservationWrapper, CalibrationWrapper, ExponentialRewardWrapper
+from gym_brt.envs.reinforcementlearning_extensions.recording import TrajectoryRecorder, TrajectoryReader, TrajectoryDataset, \
+    record_dtype
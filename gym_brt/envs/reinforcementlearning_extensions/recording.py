@@ -0,0 +1,415 @@
+"""
+Crash-safe recording of rollouts of the Qube environments into memory-mapped files.
+
+`TrajectoryRecorder` wraps any `QubeBaseEnv` (also below other wrappers) and writes one record per reset and per step
+into a preallocated structured `.npy` file. Every record contains the state `[theta, alpha, theta_dot, alpha_dot]` of
+the Qube, the applied action, the reward, the done flag and a `time.perf_counter_ns` timestamp. The file is used as a
+ring buffer, i.e. once `capacity` records are written the oldest ones are overwritten, so that the memory and the
+cost of a step stay constant for arbitrarily long runs:
+
+```python
+with QubeSwingupEnv(use_simulator=False) as env:
+    env = TrajectoryRecorder(env, "rollout.npy", capacity=2 ** 20)
+    ...
+    env.flush()
+
+reader = TrajectoryReader("rollout.npy")
+states, actions = reader.states, reader.actions  # Memory-mapped views of the file
+```
+
+Since the file is memory-mapped, all records are kept by the operating system if the process crashes. The file is
+additionally flushed to the disk every `flush_interval` records and on `flush`/`close`.
+"""
+import json
+import os
+import time
+import zipfile
+
+import numpy as np
+from gym import Wrapper
+
+
+def record_dtype(action_shape=(1,)):
+    """Dtype of a single record of `TrajectoryRecorder`."""
+    return np.dtype([
+        ("time_ns", np.int64),
+        ("episode", np.int64),
+        ("step", np.int64),  # 0 for the record of the reset
+        ("state", np.float64, (4,)),
+        ("action", np.float64, tuple(action_shape)),  # NaN for the record of the reset
+        ("reward", np.float64),
+        ("done", np.bool_),
+        # Number of the record since the start of the recording, -1 if empty or incomplete (written last)
+        ("index", np.int64),
+    ])
+
+
+class TrajectoryRecorder(Wrapper):
+    """Wrapper which streams the states, actions, rewards and timestamps of an environment into a memory-mapped file.
+
+    The state is read from the wrapped `QubeBaseEnv` (`env.unwrapped`), so it is the state of the Qube regardless of
+    the observation the (wrapped) environment returns.
+    """
+
+    def __init__(self, env, path, capacity=2 ** 20, flush_interval=1000):
+        """
+        Args:
+            env:            Environment to record (a `QubeBaseEnv` or a wrapper of it)
+            path:           Path of the `.npy` file which is created (or overwritten)
+            capacity:       Number of records in the file; older records are overwritten once it is full
+            flush_interval: Number of records after which the file is flushed to the disk
+        """
+        super(TrajectoryRecorder, self).__init__(env)
+        self.path = path
+        self.capacity = capacity
+        self._flush_interval = flush_interval
+
+        self._records = np.lib.format.open_memmap(
+            path, mode="w+", dtype=record_dtype(env.action_space.shape), shape=(capacity,)
+        )
+        self._records["index"] = -1
+        self._records.flush()
+        # Plain array views (indexing a `np.memmap` is slower)
+        self._rows = self._records.view(np.ndarray)
+        self._index = self._rows["index"]
+
+        self._qube_env = env.unwrapped
+        self._num_records = 0
+        self._episode_count = -1
+        self._episode_steps = 0
+
+    @property
+    def num_records(self):
+        """Number of records written so far (including the overwritten ones)."""
+        return self._num_records
+
+    def _write(self, action, reward, done):
+        i = self._num_records % self.capacity
+        qube_env = self._qube_env
+        # The record is marked as incomplete while it is written (its index is the last field), so that a reader skips
+        # it after a crash
+        self._index[i] = -1
+        self._rows[i] = (
+            time.perf_counter_ns(),
+            self._episode_count,
+            self._episode_steps,
+            (qube_env._theta, qube_env._alpha, qube_env._theta_dot, qube_env._alpha_dot),
+            action,
+            reward,
+            done,
+            self._num_records,
+        )
+
+        self._num_records += 1
+        if self._num_records % self._flush_interval == 0:
+            self._records.flush()
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+        self._episode_count += 1
+        self._episode_steps = 0
+        self._write(np.nan, 0.0, False)
+        return observation
+
+    def step(self, action):
+        observation, reward, done, info = self.env.step(action)
+        self._episode_steps += 1
+        self._write(action, reward, done)
+        return observation, reward, done, info
+
+    def flush(self):
+        """Writes all records to the disk."""
+        self._records.flush()
+
+    def close(self):
+        self.flush()
+        return self.env.close()
+
+
+class TrajectoryReader(object):
+    """Read-only access to a file written by `TrajectoryRecorder`.
+
+    The columns (`states`, `actions`, `rewards`, `dones`, `times_ns`, `episodes`, `steps`) are returned in the order
+    they were recorded. As long as the ring buffer of the file did not wrap around, they are views of the memory-mapped
+    file (no copy); otherwise they are concatenations of the two segments returned by `segments`. Incomplete records
+    of a crash are skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = np.load(path, mmap_mode="r")
+        index = self._records["index"]
+        capacity = len(self._records)
+        newest = int(np.argmax(index))
+        num_records = int(index[newest]) + 1
+        # The oldest record follows the newest one (ring buffer), unless it is the incomplete one of a crash
+        oldest = (newest + 1) % capacity if num_records >= capacity else 0
+        if num_records > 0 and index[oldest] < 0:
+            oldest = (oldest + 1) % capacity
+        if oldest <= newest or num_records == 0:
+            self._segments = (self._records[oldest:oldest + min(num_records, newest + 1 - oldest)],)
+        else:
+            self._segments = (self._records[oldest:], self._records[:newest + 1])
+
+    def __len__(self):
+        return sum(len(segment) for segment in self._segments)
+
+    def segments(self):
+        """One or two (if the ring buffer wrapped around) memory-mapped views of the records in recording order."""
+        return self._segments
+
+    def _column(self, name):
+        if len(self._segments) == 1:
+            return self._segments[0][name]
+        return np.concatenate([segment[name] for segment in self._segments])
+
+    @property
+    def records(self):
+        if len(self._segments) == 1:
+            return self._segments[0]
+        return np.concatenate(self._segments)
+
+    @property
+    def states(self):
+        return self._column("state")
+
+    @property
+    def actions(self):
+        return self._column("action")
+
+    @property
+    def rewards(self):
+        return self._column("reward")
+
+    @property
+    def dones(self):
+        return self._column("done")
+
+    @property
+    def times_ns(self):
+        return self._column("time_ns")
+
+    @property
+    def episodes(self):
+        return self._column("episode")
+
+    @property
+    def steps(self):
+        return self._column("step")
+
+
+class TrajectoryDataset(object):
+    """Store of many recorded trajectories in a single compressed file with an index of their metadata.
+
+    The file is a zip archive. Every column of a trajectory (`time_ns`, `state`, `action`, `reward`, `done`) is split
+    into chunks of `chunk_size` steps, which are stored as separately compressed `.npy` members, and the index (a JSON
+    member) holds the metadata of all trajectories: the `policy`, the `frequency`, the `init_state`, the `length`, the
+    time of the recording and any additional keyword arguments given to `add`. Trajectories can be selected by their
+    metadata and only the chunks which are accessed are read and decompressed:
+
+    ```python
+    with TrajectoryDataset("trajectories.zip", mode="a") as dataset:
+        dataset.add_recording(TrajectoryReader("rollout.npy"), policy="flip_up", frequency=250)
+
+    dataset = TrajectoryDataset("trajectories.zip")
+    for entry, trajectory in dataset.iter_trajectories(policy="flip_up", frequency=(200, 300)):
+        states, actions = trajectory["state"], trajectory["action"]
+    ```
+
+    Trajectories are only appended, the index is rewritten (as a new member) whenever the file is flushed or closed.
+    """
+
+    COLUMNS = ("time_ns", "state", "action", "reward", "done")
+
+    def __init__(self, path, mode="r", chunk_size=4096, compresslevel=6):
+        """
+        Args:
+            path:           Path of the file
+            mode:           `r` to read, `a` to append (the file is created if it does not exist) or `w` to overwrite
+            chunk_size:     Number of steps per chunk of new trajectories
+            compresslevel:  Compression level (0-9) of new chunks
+        """
+        if mode not in ("r", "a", "w"):
+            raise ValueError(f"Unsupported mode '{mode}'. Valid ones are 'r', 'a' and 'w'.")
+        if mode == "a" and not os.path.exists(path):
+            mode = "w"
+        self.path = path
+        self.chunk_size = chunk_size
+        self._zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self._writable = mode != "r"
+        self._modified = False
+
+        # The latest version of the index is the valid one
+        index_names = sorted(name for name in self._zip.namelist() if name.startswith("index/"))
+        self._index_version = len(index_names)
+        self._entries = json.loads(self._zip.read(index_names[-1])) if index_names else []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def index(self):
+        """Metadata of all trajectories (list of dicts, the position is the id of the trajectory)."""
+        return self._entries
+
+    def add(self, states, actions, rewards=None, dones=None, times_ns=None, policy=None, frequency=None,
+            init_state=None, **metadata):
+        """Appends a trajectory.
+
+        Args:
+            states:     States of shape (T, 4)
+            actions:    Actions of shape (T,) or (T, 1)
+            rewards:    Rewards of shape (T,) (NaN if not given)
+            dones:      Done flags of shape (T,) (only the last step is done if not given)
+            times_ns:   Timestamps of the steps in ns (-1 if not given)
+            policy:     Name of the policy which generated the trajectory
+            frequency:  Sample frequency
+            init_state: Initial state (by default the first state)
+            **metadata: Additional metadata (must be JSON serializable) the trajectories can be selected by
+
+        Returns:
+            The id of the trajectory
+        """
+        if not self._writable:
+            raise ValueError("The dataset was opened read-only, use mode='a' to add trajectories.")
+        states = np.asarray(states, dtype=np.float64).reshape((-1, 4))
+        length = len(states)
+        if length == 0:
+            raise ValueError("Can not add an empty trajectory.")
+        columns = {
+            "time_ns": np.full(length, -1, dtype=np.int64) if times_ns is None else times_ns,
+            "state": states,
+            "action": np.asarray(actions, dtype=np.float64).reshape((length, -1)),
+            "reward": np.full(length, np.nan) if rewards is None else rewards,
+            "done": np.arange(length) == length - 1 if dones is None else dones,
+        }
+
+        trajectory_id = len(self._entries)
+        for name, column in columns.items():
+            column = np.asarray(column)
+            if len(column) != length:
+                raise ValueError(f"'{name}' has {len(column)} steps but there are {length} states.")
+            for chunk, start in enumerate(range(0, length, self.chunk_size)):
+                with self._zip.open(self._member(trajectory_id, name, chunk), "w") as f:
+                    np.lib.format.write_array(f, np.ascontiguousarray(column[start:start + self.chunk_size]),
+                                              allow_pickle=False)
+
+        self._entries.append(_json_compatible(dict(
+            metadata,
+            id=trajectory_id,
+            length=length,
+            chunk_size=self.chunk_size,
+            policy=policy,
+            frequency=frequency,
+            init_state=states[0] if init_state is None else init_state,
+            added_at=time.time(),
+        )))
+        self._modified = True
+        return trajectory_id
+
+    def add_recording(self, reader, **metadata):
+        """Appends all (complete or partial) episodes of a `TrajectoryReader` as separate trajectories.
+
+        Returns:
+            The ids of the added trajectories
+        """
+        steps = np.asarray(reader.steps)
+        starts = list(np.flatnonzero(steps == 0))
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        ids = []
+        for start, stop in zip(starts, starts[1:] + [len(steps)]):
+            if stop > start:
+                ids.append(self.add(reader.states[start:stop], reader.actions[start:stop],
+                                    rewards=reader.rewards[start:stop], dones=reader.dones[start:stop],
+                                    times_ns=reader.times_ns[start:stop], **metadata))
+        return ids
+
+    def select(self, **filters):
+        """Ids of the trajectories whose metadata matches all filters.
+
+        A filter is either a value (equality), a tuple `(low, high)` (inclusive range) or a callable `f(value) -> bool`.
+        """
+        def matches(value, condition):
+            if callable(condition):
+                return condition(value)
+            if isinstance(condition, tuple):
+                low, high = condition
+                return value is not None and low <= value <= high
+            return value == condition
+
+        return [entry["id"] for entry in self._entries
+                if all(matches(entry.get(key), condition) for key, condition in filters.items())]
+
+    def load(self, trajectory_id, columns=None, start=0, stop=None):
+        """Reads the steps `start:stop` of a trajectory; only the chunks which contain these steps are decompressed.
+
+        Returns:
+            Dict of the `columns` (by default all of them)
+        """
+        entry = self._entries[trajectory_id]
+        start, stop, _ = slice(start, stop).indices(entry["length"])
+        chunk_size = entry["chunk_size"]
+        first, last = start // chunk_size, max(start, stop - 1) // chunk_size
+        trajectory = {}
+        for name in columns if columns is not None else self.COLUMNS:
+            chunks = [self._read_chunk(trajectory_id, name, chunk) for chunk in range(first, last + 1)]
+            column = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+            trajectory[name] = column[start - first * chunk_size:stop - first * chunk_size]
+        return trajectory
+
+    def iter_chunks(self, columns=None, **filters):
+        """Iterates chunk by chunk over all trajectories matching the filters (see `select`).
+
+        Yields:
+            Tuples of the metadata of the trajectory, the index of its first step in the chunk and the dict of columns
+        """
+        for trajectory_id in self.select(**filters):
+            entry = self._entries[trajectory_id]
+            for start in range(0, entry["length"], entry["chunk_size"]):
+                yield entry, start, self.load(trajectory_id, columns, start, start + entry["chunk_size"])
+
+    def iter_trajectories(self, columns=None, **filters):
+        """Iterates over all trajectories matching the filters (see `select`), one trajectory in memory at a time.
+
+        Yields:
+            Tuples of the metadata and the dict of columns of a trajectory
+        """
+        for trajectory_id in self.select(**filters):
+            yield self._entries[trajectory_id], self.load(trajectory_id, columns)
+
+    def _member(self, trajectory_id, name, chunk):
+        return f"trajectories/{trajectory_id:06d}/{name}/{chunk:06d}.npy"
+
+    def _read_chunk(self, trajectory_id, name, chunk):
+        with self._zip.open(self._member(trajectory_id, name, chunk)) as f:
+            return np.lib.format.read_array(f, allow_pickle=False)
+
+    def flush(self):
+        """Writes the index of all trajectories added so far."""
+        if self._modified:
+            self._zip.writestr(f"index/{self._index_version:06d}.json", json.dumps(self._entries))
+            self._index_version += 1
+            self._modified = False
+
+    def close(self):
+        if self._writable:
+            self.flush()
+        self._zip.close()
+
+
+def _json_compatible(value):
+    """Converts numpy arrays and scalars (also in dicts and lists) into their Python equivalents."""
+    if isinstance(value, dict):
+        return {key: _json_compatible(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_compatible(item) for item in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
@@ -27,34 +27,30 @@ OBS_MAX = np.asarray([1, 1, 1, 1, np.inf, np.inf], dtype=np.float64)
 
 
 class QubeBeginDownEnv(QubeSwingupEnv):
+    _trigonometric_angles = True
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.observation_space = spaces.Box(-OBS_MAX, OBS_MAX, dtype=np.float64)
 
-    def _get_state(self):
-        return np.array(
-            [np.cos(self._theta),
-             np.sin(self._theta),
-             np.cos(self._alpha),
-             np.sin(self._alpha),
-             self._theta_dot,
-             self._alpha_dot],
-            dtype=np.float64,
-        )
-
 
 class RandomStartEnv(QubeBeginDownEnv):
 
     def __init__(self, **kwargs):
-        assert kwargs["use_simulator"], "Just possible in simulation"
+        # Every reset moves the Qube to a random state with `set_state`, which only the simulators support
+        if not kwargs.get("use_simulator", False):
+            raise ValueError("RandomStartEnv starts every episode in a random state, which is only possible in "
+                             "simulation (use_simulator=True).")
         super().__init__(**kwargs)
 
     def reset(self):
+        # Start a new episode (without the reset to the bottom) and move the Qube to a random state
+        super(QubeSwingupEnv, self).reset()
         theta = 60 /180*np.pi*(2*np.random.rand()-1)
         alpha = 180 /180 * np.pi * (2 * np.random.rand() - 1)
         theta_vel = 2 * (2 * np.random.rand() - 1)
         alpha_vel = 2 * (2 * np.random.rand() - 1)
-        return convert_state_back(np.array([theta, alpha, theta_vel, alpha_vel], dtype=np.float64))
+        return self.set_state(np.array([theta, alpha, theta_vel, alpha_vel], dtype=np.float64))
 
 
 class NoisyEnv(QubeBeginDownEnv):
@@ -80,21 +76,12 @@ class NoisyEnv(QubeBeginDownEnv):
 
 
 class QubeBeginUpEnv(QubeBalanceEnv):
+    _trigonometric_angles = True
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.observation_space = spaces.Box(-OBS_MAX, OBS_MAX, dtype=np.float32)
 
-    def _get_state(self):
-        return np.array(
-            [np.cos(self._theta),
-             np.sin(self._theta),
-             np.cos(self._alpha),
-             np.sin(self._alpha),
-             self._theta_dot,
-             self._alpha_dot],
-            dtype=np.float64,
-        )
-
 
 def convert_state(state):
     return np.array(
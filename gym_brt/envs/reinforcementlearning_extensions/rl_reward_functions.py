@@ -2,11 +2,15 @@
 Reinforcement learning reward functions for the different tasks Balance, Swing Up and General. Simple rewards and
 energy based rewards can be found in the functions and need to be selected or modified.
 
+The functions ending with `_batch` compute the same rewards for whole trajectories (states of shape (T, 4) in the form
+`[theta, alpha, theta_dot, alpha_dot]` and actions of shape (T,)), e.g. to relabel stored transitions. Their results are
+bit-identical to the ones of the scalar functions: both square by multiplication (instead of `** 2`, which uses `pow`
+for scalars but not for arrays) and use `np.exp` (which can differ from `math.exp` in the last bit).
+
 @Author: Steffen Bleher (adapted by Moritz Schneider)
 """
 import numpy as np
 import typing as tp
-import math
 
 
 def angle_normalize(x):
@@ -24,7 +28,8 @@ def swing_up_reward(theta: float, alpha: float, alpha_dot, theta_dot, target_ang
     #     reward -= 1
     # # if np.abs(alpha) < 5 / 180 * np.pi: reward *= 2
     # # if np.abs(alpha) < 3 / 180 * np.pi: reward *= 2
-    return max(reward, 0) ** 2  # Clip for the follow env case
+    reward = max(reward, 0)  # Clip for the follow env case
+    return reward * reward
 
     # # Energy Based Reward
     # mr = 0.095
@@ -49,16 +54,17 @@ def swing_up_reward(theta: float, alpha: float, alpha_dot, theta_dot, target_ang
 
 def extended_swing_up_reward(state, action: float, target_angle: float = 0.0):
     theta, alpha, theta_dot, alpha_dot = state
-    cost = angle_normalize(alpha) ** 2
-    cost += 5e-3 * alpha_dot ** 2
-    cost += 1e-1 * np.abs(theta - target_angle) ** 2
-    cost += 2e-2 * theta_dot ** 2
-    cost += 3e-3 * action ** 2
+    alpha = angle_normalize(alpha)
+    cost = alpha * alpha
+    cost += 5e-3 * (alpha_dot * alpha_dot)
+    cost += 1e-1 * ((theta - target_angle) * (theta - target_angle))
+    cost += 2e-2 * (theta_dot * theta_dot)
+    cost += 3e-3 * (action * action)
     return -cost
 
 
 def cosine_swing_up_reward(theta: float, alpha: float, weight: float = 0.8):
-    return weight * np.cosine(alpha) + (1.0 - weight) * np.cosine(theta)
+    return weight * np.cos(alpha) + (1.0 - weight) * np.cos(theta)
 
 
 def exp_swing_up_reward(state, action: float, dt: float):
@@ -74,11 +80,12 @@ def exp_swing_up_reward(state, action: float, dt: float):
     Returns:        Calculated reward
     """
     theta, alpha, theta_dot, alpha_dot = state
-    cost = alpha ** 2 + 5e-3 * alpha_dot ** 2 + 1e-1 * theta ** 2 + 2e-2 * theta_dot ** 2 + 3e-3 * action ** 2
+    cost = alpha * alpha + 5e-3 * (alpha_dot * alpha_dot) + 1e-1 * (theta * theta) + 2e-2 * (theta_dot * theta_dot) \
+        + 3e-3 * (action * action)
     if abs(theta) > (90.0 * np.pi / 180.0):
         return -1
     else:
-        return math.exp(-cost) #* dt
+        return float(np.exp(-cost)) #* dt
 
 
 def balance_reward(theta, alpha, target_angle):
@@ -88,6 +95,55 @@ def balance_reward(theta, alpha, target_angle):
     )
     return max(reward, 0)  # Clip for the follow env case
 
+
+def _trajectory(states, actions=None):
+    """Columns `theta, alpha, theta_dot, alpha_dot` of states of shape (T, 4) and the actions as array of shape (T,)."""
+    states = np.asarray(states, dtype=np.float64).reshape((-1, 4))
+    if actions is not None:
+        actions = np.asarray(actions, dtype=np.float64).reshape((states.shape[0],))
+    return states[:, 0], states[:, 1], states[:, 2], states[:, 3], actions
+
+
+def swing_up_reward_batch(states, actions=None, target_angle=0.0):
+    """`swing_up_reward` for states of shape (T, 4); `target_angle` is a scalar or of shape (T,)."""
+    theta, alpha, _, _, _ = _trajectory(states)
+    reward = 1 - (
+            (0.8 * np.abs(alpha) + 0.2 * np.abs(target_angle - theta))
+            / np.pi
+    )
+    reward = np.maximum(reward, 0)
+    return reward * reward
+
+
+def balance_reward_batch(states, actions=None, target_angle=0.0):
+    """`balance_reward` for states of shape (T, 4); `target_angle` is a scalar or of shape (T,)."""
+    theta, alpha, _, _, _ = _trajectory(states)
+    reward = 1 - (
+            (0.8 * np.abs(alpha) + 0.2 * np.abs(target_angle - theta))
+            / np.pi
+    )
+    return np.maximum(reward, 0)
+
+
+def extended_swing_up_reward_batch(states, actions, target_angle=0.0):
+    """`extended_swing_up_reward` for states of shape (T, 4) and actions of shape (T,)."""
+    theta, alpha, theta_dot, alpha_dot, actions = _trajectory(states, actions)
+    alpha = angle_normalize(alpha)
+    cost = alpha * alpha
+    cost += 5e-3 * (alpha_dot * alpha_dot)
+    cost += 1e-1 * ((theta - target_angle) * (theta - target_angle))
+    cost += 2e-2 * (theta_dot * theta_dot)
+    cost += 3e-3 * (actions * actions)
+    return -cost
+
+
+def exp_swing_up_reward_batch(states, actions, dt=None):
+    """`exp_swing_up_reward` for states of shape (T, 4) and actions of shape (T,)."""
+    theta, alpha, theta_dot, alpha_dot, actions = _trajectory(states, actions)
+    cost = alpha * alpha + 5e-3 * (alpha_dot * alpha_dot) + 1e-1 * (theta * theta) + 2e-2 * (theta_dot * theta_dot) \
+        + 3e-3 * (actions * actions)
+    return np.where(np.abs(theta) > (90.0 * np.pi / 180.0), -1.0, np.exp(-cost))
+
 # class GeneralReward(object):
 #     def __init__(self):
 #         self.target_space = spaces.Box(-ACT_MAX, ACT_MAX, dtype=np.float32)
@@ -14,18 +14,13 @@ with QubeSwingupEnv() as env:
 """
 import typing as tp
 
-import cv2
 import numpy as np
 from gym import Env, Wrapper, ObservationWrapper, spaces
 
 from gym_brt.control import calibrate
 from gym_brt.data.config.configuration import FREQUENCY
 from gym_brt.envs.reinforcementlearning_extensions.rl_reward_functions import exp_swing_up_reward
-
-try:
-    from gym_brt.quanser import QubeHardware
-except ImportError:
-    print("Warning: Can not import QubeHardware in wrapper.py")
+from gym_brt.quanser import QubeHardware
 
 Array = tp.Union[tp.List, np.ndarray]
 
@@ -51,6 +46,8 @@ class ImageObservationWrapper(ObservationWrapper):
         self.observation_space = spaces.Box(low=0, high=255, shape=obs_shape, dtype=dummy_obs.dtype)
 
     def observation(self, observation: np.ndarray) -> np.ndarray:
+        import cv2  # Only needed for image observations and slow to import
+
         img = self.env.render("rgb_array", width=self.out_shape[0], height=self.out_shape[1])
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         #if self.out_shape is not None:
@@ -78,6 +78,26 @@ class QubeMujoco(QubeSimulatorBase, MujocoBase):
         self.state = self._get_obs()
         return self.state
 
+    def get_state(self) -> np.ndarray:
+        """Positions and velocities of the joints `[theta, alpha, theta_dot, alpha_dot]` (angles not normalized)."""
+        return np.concatenate((self.sim.data.qpos, self.sim.data.qvel))
+
+    def set_state(self, state, qvel=None) -> np.ndarray:
+        """Sets the joints to a state returned by `get_state`.
+
+        For compatibility with `MujocoBase.set_state` the positions and velocities can also be given separately as
+        `set_state(qpos, qvel)`.
+
+        Returns:
+            The new observation
+        """
+        qpos = np.asarray(state, dtype=np.float64)
+        if qvel is None:
+            qpos, qvel = qpos[:self.model.nq], qpos[self.model.nq:]
+        MujocoBase.set_state(self, qpos, np.asarray(qvel, dtype=np.float64))
+        self.state = self._get_obs()
+        return self.state
+
     def reset(self):
         MujocoBase.reset(self)
 
@@ -136,18 +136,30 @@ class QubeBullet(QubeSimulatorBase, XmlBasedRobot):
                     self._p, self.objects)
         self.robot_specific_reset(self._p)
 
-        s = self._get_obs()  # optimization: calc_state() can calculate something in self.* for calc_potential() to use
+        self.state = self._get_obs()  # optimization: calc_state() can calculate something in self.* for calc_potential() to use
 
         self.potential = 0
 
-        return s
+        return self.state
 
     def reset_down(self) -> np.ndarray:
-        self.reset()
+        return self.reset()
 
     def reset_up(self) -> np.ndarray:
         self.swingup = False
-        self.reset()
+        return self.reset()
+
+    def get_state(self) -> np.ndarray:
+        """Positions and velocities of the joints `[theta, alpha, theta_dot, alpha_dot]`."""
+        return self._get_obs()
+
+    def set_state(self, state) -> np.ndarray:
+        """Sets the joints to a state returned by `get_state` and returns the new observation."""
+        theta, alpha, theta_dot, alpha_dot = state
+        self.base_motor.reset_current_position(theta, theta_dot)
+        self.arm_pendulum_joint.reset_current_position(alpha, alpha_dot)
+        self.state = self._get_obs()
+        return self.state
 
     def _get_obs(self) -> np.ndarray:
         theta, theta_dot = self.base_motor.current_position()
@@ -163,7 +175,7 @@ class QubeBullet(QubeSimulatorBase, XmlBasedRobot):
         self.base_motor.set_motor_torque(action)
 
         self.scene.global_step()
-        state = self._get_obs()
+        state = self.state = self._get_obs()
 
         # TODO: ?
         #theta_x = state[0]
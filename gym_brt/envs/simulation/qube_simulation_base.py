@@ -35,6 +35,14 @@ class QubeSimulatorBase(object):
     def step(self, action, led=None):
         raise NotImplementedError
 
+    def get_state(self):
+        """Snapshot `[theta, alpha, theta_dot, alpha_dot]` of the simulation which can be restored by `set_state`."""
+        raise NotImplementedError
+
+    def set_state(self, state):
+        """Sets the simulation to the state `[theta, alpha, theta_dot, alpha_dot]` and returns the new observation."""
+        raise NotImplementedError
+
     def reset_up(self):
         raise NotImplementedError
 
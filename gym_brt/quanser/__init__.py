@@ -1,6 +1,2 @@
-from gym_brt.quanser.qube_interfaces import QubeSimulator
-
-try:
-    from gym_brt.quanser.qube_interfaces import QubeHardware
-except ImportError:
-    print("Warning: Can not import QubeHardware in quanser/__init__.py")
+from gym_brt.quanser.qube_interfaces import QubeHardware, QubeSimulator
+from gym_brt.quanser.qube_simulator import QubeParams
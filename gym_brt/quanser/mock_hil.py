@@ -0,0 +1,431 @@
+"""Software stand-in for the HIL SDK of Quanser, driven by the ODE model of the Qube.
+
+The extension `quanser_wrapper_mock` is `quanser_wrapper.pyx` compiled against the stub headers in
+`quanser_wrapper/mock`, whose HIL functions (`mock_hil.c`) forward every call to the function of the same name in this
+module. The wrapper, the state estimator and the timing of the hardware path are thus the compiled code used with the
+Qube, only the board is simulated. `QubeHardware(backend="mock")` uses this extension.
+
+The `hil_*` functions take the arguments of the functions of the HIL SDK without the numbers of channels and samples of
+the buffers: channels and buffers are objects supporting the buffer protocol (memoryviews of the C buffers or
+contiguous NumPy arrays of the C type) or `None` for NULL. Functions which return a handle in C (`hil_open` and the
+task creation) return a tuple `(result, handle)`. Errors are returned as negative error codes like in C.
+
+The simulated board (`MockBoard`) integrates the ODE of the Qube (`forward_model_rk4`) on the clock of its task. A
+task takes samples with `realtime=True` at the wall time of the sample period (a read blocks until the requested
+samples were taken and samples which are not read in time fill the buffer and overflow like on the hardware), with
+`realtime=False` on a virtual clock which only advances when samples are read (as fast as possible, e.g. for tests;
+reads never block, so the board appears to run ahead of the clock of the PC and the control thread of `QubeHardware`
+is not paced). Voltages written immediately are applied at the time of the write (on the virtual clock at the time of
+the last sample), voltages written by a reader/writer task on the clock edge of the sample they are queued for.
+
+The options of the boards opened next (the arguments of `MockBoard`) are set by `set_board_options`, since `hil_open`
+only receives the board type and identifier.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import collections
+import time
+
+import numpy as np
+
+from gym_brt.quanser.qube_simulator import forward_model_rk4, DEFAULT_PARAMS
+
+HARDWARE_CLOCK_0 = 0
+BUFFER_MODE_ERROR_ON_OVERFLOW = 0
+BUFFER_MODE_OVERWRITE_ON_OVERFLOW = 1
+BUFFER_MODE_DISCARD_ON_OVERFLOW = 2
+
+QERR_INVALID_ARGUMENT = 4
+QERR_NOT_SUPPORTED = 6
+QERR_INVALID_CARD_HANDLE = 88
+QERR_INVALID_TASK_HANDLE = 105
+QERR_BUFFER_OVERFLOW = 111
+QERR_TOO_MANY_SAMPLES_FOR_BUFFER = 159
+
+# Angle of a single count of the encoders of the Qube (2048 counts per revolution)
+COUNT_TO_RAD = 2.0 * np.pi / 2048
+
+# Open boards by their id and the options of the boards opened next
+_open_boards = {}
+_board_options = {}
+
+
+def set_board_options(**options):
+    """Sets the arguments of the `MockBoard` of the next calls of `hil_open` (replaces the previous options)."""
+    _board_options.clear()
+    _board_options.update(options)
+
+
+def open_boards():
+    """List of the currently open boards (e.g. to inspect the simulated state)."""
+    return list(_open_boards.values())
+
+
+class MockBoard(object):
+    """Simulated Qube-Servo 2 board.
+
+    The state `[theta, alpha, theta_dot, alpha_dot]` uses the convention of the simulators (`alpha = 0` is upright),
+    the encoders count the unwrapped angles like the hardware (the pendulum hangs down when the encoders are reset).
+    """
+
+    def __init__(self, params=None, realtime=True, integration_steps=4, initial_state=None, noise=0.0, seed=None,
+                 clock_drift=0.0):
+        """
+        Args:
+            params: Physical parameters of the Qube (`QubeParams`)
+            realtime: Take the samples of a task at the wall time (`True`) or on a virtual clock (`False`)
+            integration_steps: Number of RK4 steps per sample
+            initial_state: Initial state, by default the pendulum hangs down at rest
+            noise: Standard deviation of a random disturbance of the angular accelerations (in rad/s^2)
+            seed: Seed of the disturbance
+            clock_drift: Relative deviation of the clock of the board from the one of the PC (e.g. `1e-4` for a board
+                            clock which runs 100 ppm fast)
+        """
+        self.params = params if params is not None else DEFAULT_PARAMS
+        self.realtime = realtime
+        self.integration_steps = integration_steps
+        self.state = np.array([0.0, np.pi, 0.0, 0.0] if initial_state is None else initial_state, dtype=np.float64)
+        self.noise = noise
+        self.clock_drift = clock_drift
+        self._random = np.random.RandomState(seed)
+        # Unwrapped angles (the simulation wraps them into [-pi, pi)) and the offsets of the encoder counts
+        self._angles = np.array([self.state[0], self.state[1]], dtype=np.float64)
+        self._offsets = np.zeros(2, dtype=np.int64)
+        self.voltage = 0.0
+        self.enabled = False
+        self.led = np.zeros(3, dtype=np.float64)
+        self.task = None
+        # Simulated time since the start of the task
+        self.time = 0.0
+        # Number of data transfers to or from the board
+        self.transactions = 0
+        # Compile the model now instead of in the first sample period of a task
+        forward_model_rk4(*self.state, 0.0, 0.0, 1, self.params.coefficients)
+
+    def _encoder_counts(self):
+        raw = np.floor(np.array([-self._angles[0], self._angles[1] + np.pi]) / COUNT_TO_RAD).astype(np.int64)
+        return raw + self._offsets
+
+    def set_encoder_counts(self, channels, counts):
+        raw = self._encoder_counts() - self._offsets
+        for channel, count in zip(channels, counts):
+            self._offsets[channel] = count - raw[channel]
+
+    def sample(self):
+        """Current values of the inputs: motor current, encoder counts and tachometers (counts/s)."""
+        theta_dot, alpha_dot = self.state[2], self.state[3]
+        voltage = self.voltage if self.enabled else 0.0
+        current = (voltage - self.params.km * theta_dot) / self.params.Rm
+        tachometers = np.array([-theta_dot / COUNT_TO_RAD, alpha_dot / COUNT_TO_RAD])
+        return current, self._encoder_counts(), tachometers
+
+    def advance_to(self, t, frequency):
+        """Integrates the dynamics up to the time `t` with the current voltage (zero if the amplifier is disabled)."""
+        dt = t - self.time
+        if dt <= 0.0:
+            return
+        self.time = t
+        voltage = self.voltage if self.enabled else 0.0
+        steps = max(int(np.ceil(self.integration_steps * dt * frequency)), 1)
+        theta, alpha = self.state[0], self.state[1]
+        state = forward_model_rk4(*self.state, voltage, dt, steps, self.params.coefficients)
+        self.state[:] = state
+        if self.noise > 0.0:
+            self.state[2:] += self._random.normal(0.0, self.noise * dt, 2)
+        # Accumulate the wrapped differences of the angles
+        self._angles[0] += (self.state[0] - theta + np.pi) % (2 * np.pi) - np.pi
+        self._angles[1] += (self.state[1] - alpha + np.pi) % (2 * np.pi) - np.pi
+
+    def sync(self):
+        """Takes all samples of the running task which are due by now and integrates up to now."""
+        task = self.task
+        if task is not None and task.running and self.realtime:
+            now = time.perf_counter()
+            task.take_samples_until(now)
+            self.advance_to(now - task.start_time, task.frequency)
+
+
+class MockTask(object):
+    """Clocked task of a `MockBoard` with a buffer of samples (and of queued voltages for reader/writer tasks)."""
+
+    def __init__(self, board, samples_in_buffer, num_analog, num_encoders, num_others, num_analog_outputs, writer):
+        self.board = board
+        self.capacity = samples_in_buffer
+        self.num_analog, self.num_encoders, self.num_others = num_analog, num_encoders, num_others
+        self.num_analog_outputs = num_analog_outputs
+        self.writer = writer
+        self.overflow_mode = BUFFER_MODE_ERROR_ON_OVERFLOW
+        self.overflows = 0
+        self.overflowed = False
+        self.buffer = collections.deque()
+        self.outputs = collections.deque()
+        self.frequency = None
+        self.start_time = None
+        self.samples_taken = 0
+        self.running = False
+
+    def start(self, frequency):
+        self.frequency = frequency
+        # Samples per second of the PC clock
+        self.sample_rate = frequency * (1.0 + self.board.clock_drift)
+        self.start_time = time.perf_counter()
+        self.samples_taken = 0
+        self.board.time = 0.0
+        self.running = True
+
+    def _take_sample(self):
+        board = self.board
+        board.advance_to(self.samples_taken / self.sample_rate, self.frequency)
+        if self.writer and self.outputs:
+            # Voltage queued for this clock edge
+            board.voltage = self.outputs.popleft()
+        sample = board.sample()
+        if len(self.buffer) < self.capacity:
+            self.buffer.append(sample)
+        else:
+            self.overflows += 1
+            if self.overflow_mode == BUFFER_MODE_OVERWRITE_ON_OVERFLOW:
+                self.buffer.popleft()
+                self.buffer.append(sample)
+            elif self.overflow_mode == BUFFER_MODE_ERROR_ON_OVERFLOW:
+                self.overflowed = True
+        self.samples_taken += 1
+
+    def queue_outputs(self, num_samples, analog_buffer):
+        """Queues the voltage (of the motor, the first analog output) of the next `num_samples` clock edges."""
+        for i in range(num_samples):
+            self.outputs.append(float(analog_buffer[i * self.num_analog_outputs]))
+
+    def take_samples_until(self, now):
+        due = int((now - self.start_time) * self.sample_rate) + 1
+        while self.samples_taken < due:
+            self._take_sample()
+
+    def next_sample_time(self):
+        return self.start_time + self.samples_taken / self.sample_rate
+
+    def wait_for_samples(self, num_samples):
+        """Takes samples until the buffer holds `num_samples` (sleeps until they are due with a real-time clock)."""
+        while len(self.buffer) < num_samples:
+            if self.board.realtime:
+                delay = self.next_sample_time() - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.take_samples_until(time.perf_counter())
+            else:
+                self._take_sample()
+
+
+def _board(card):
+    return card if isinstance(card, MockBoard) and _open_boards.get(id(card)) is card else None
+
+
+def _task(task):
+    return task if isinstance(task, MockTask) and task.board.task is task else None
+
+
+def _array(buffer, dtype):
+    """Array view of a buffer (or `None`)."""
+    return None if buffer is None else np.frombuffer(buffer, dtype=dtype)
+
+
+def hil_open(board_type, board_identifier):
+    """Opens a simulated `qube_servo2_usb` board with the options of `set_board_options`.
+
+    Returns:
+        The result and the board
+    """
+    if board_type != b"qube_servo2_usb":
+        return -QERR_NOT_SUPPORTED, None
+    board = MockBoard(**_board_options)
+    _open_boards[id(board)] = board
+    return 0, board
+
+
+def hil_close(card):
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE
+    del _open_boards[id(board)]
+    board.task = None
+    return 0
+
+
+def hil_close_all():
+    for board in open_boards():
+        hil_close(board)
+    return 0
+
+
+def hil_write_analog(card, channels, buffer):
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE
+    board.sync()
+    board.transactions += 1
+    board.voltage = float(_array(buffer, np.float64)[0])
+    return 0
+
+
+def hil_write_digital(card, lines, buffer):
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE
+    board.sync()
+    board.transactions += 1
+    board.enabled = bool(_array(buffer, np.int8)[0])
+    return 0
+
+
+def hil_write_other(card, channels, buffer):
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE
+    board.sync()
+    board.transactions += 1
+    values = _array(buffer, np.float64)
+    board.led[:len(values)] = values
+    return 0
+
+
+def hil_set_encoder_counts(card, channels, buffer):
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE
+    board.sync()
+    board.transactions += 1
+    board.set_encoder_counts(_array(channels, np.uint32), _array(buffer, np.int32))
+    return 0
+
+
+def _channel_count(channels):
+    return 0 if channels is None else len(_array(channels, np.uint32))
+
+
+def hil_task_create_reader(card, samples_in_buffer, analog_channels, encoder_channels, digital_lines,
+                           other_channels):
+    """Returns the result and the task."""
+    return hil_task_create_reader_writer(card, samples_in_buffer, analog_channels, encoder_channels, digital_lines,
+                                         other_channels, None, None, None, None, writer=False)
+
+
+def hil_task_create_reader_writer(card, samples_in_buffer, analog_input_channels, encoder_input_channels,
+                                  digital_input_lines, other_input_channels, analog_output_channels,
+                                  pwm_output_channels, digital_output_lines, other_output_channels, writer=True):
+    """Returns the result and the task (only the analog outputs are written by the task)."""
+    board = _board(card)
+    if board is None:
+        return -QERR_INVALID_CARD_HANDLE, None
+    if samples_in_buffer < 1:
+        return -QERR_INVALID_ARGUMENT, None
+    if _channel_count(pwm_output_channels) or _channel_count(digital_output_lines) or \
+            _channel_count(other_output_channels):
+        return -QERR_NOT_SUPPORTED, None
+    board.task = MockTask(
+        board, samples_in_buffer, _channel_count(analog_input_channels), _channel_count(encoder_input_channels),
+        _channel_count(other_input_channels), _channel_count(analog_output_channels), writer=writer
+    )
+    return 0, board.task
+
+
+def hil_task_set_buffer_overflow_mode(task, mode):
+    task = _task(task)
+    if task is None:
+        return -QERR_INVALID_TASK_HANDLE
+    task.overflow_mode = mode
+    return 0
+
+
+def hil_task_get_buffer_overflows(task):
+    task = _task(task)
+    if task is None:
+        return -QERR_INVALID_TASK_HANDLE
+    task.board.sync()
+    return task.overflows
+
+
+def hil_task_start(task, clock, frequency, num_samples):
+    task = _task(task)
+    if task is None:
+        return -QERR_INVALID_TASK_HANDLE
+    task.start(frequency)
+    return 0
+
+
+def hil_task_flush(task):
+    return 0 if _task(task) is not None else -QERR_INVALID_TASK_HANDLE
+
+
+def hil_task_stop(task):
+    task = _task(task)
+    if task is None:
+        return -QERR_INVALID_TASK_HANDLE
+    task.board.sync()
+    task.running = False
+    return 0
+
+
+def hil_task_delete(task):
+    task = _task(task)
+    if task is None:
+        return -QERR_INVALID_TASK_HANDLE
+    task.board.task = None
+    return 0
+
+
+def hil_task_read(task, num_samples, analog_buffer, encoder_buffer, digital_buffer, other_buffer):
+    """Reads `num_samples` samples (blocks until they were taken) into the buffers (one row per sample)."""
+    task = _task(task)
+    if task is None or not task.running:
+        return -QERR_INVALID_TASK_HANDLE
+    if num_samples > task.capacity:
+        return -QERR_TOO_MANY_SAMPLES_FOR_BUFFER
+    board = task.board
+    board.sync()
+    board.transactions += 1
+    if task.overflowed:
+        task.overflowed = False
+        return -QERR_BUFFER_OVERFLOW
+    task.wait_for_samples(num_samples)
+    analog = _array(analog_buffer, np.float64)
+    encoders = _array(encoder_buffer, np.int32)
+    others = _array(other_buffer, np.float64)
+    for i in range(num_samples):
+        current, counts, tachometers = task.buffer.popleft()
+        if analog is not None:
+            analog[i * task.num_analog:(i + 1) * task.num_analog] = current
+        if encoders is not None:
+            encoders[i * task.num_encoders:(i + 1) * task.num_encoders] = counts[:task.num_encoders]
+        if others is not None:
+            others[i * task.num_others:(i + 1) * task.num_others] = tachometers[:task.num_others]
+    return num_samples
+
+
+def hil_task_write(task, num_samples, analog_buffer, pwm_buffer, digital_buffer, other_buffer):
+    """Queues the voltages of the next `num_samples` samples of a reader/writer task."""
+    task = _task(task)
+    if task is None or not task.writer:
+        return -QERR_INVALID_TASK_HANDLE
+    task.board.sync()
+    task.board.transactions += 1
+    task.queue_outputs(num_samples, _array(analog_buffer, np.float64))
+    return num_samples
+
+
+def hil_task_read_write(task, num_samples, analog_input_buffer, encoder_input_buffer, digital_input_buffer,
+                        other_input_buffer, analog_output_buffer, pwm_output_buffer, digital_output_buffer,
+                        other_output_buffer):
+    """Reads `num_samples` samples and queues the voltages of the following ones in a single transaction."""
+    task = _task(task)
+    if task is None or not task.writer:
+        return -QERR_INVALID_TASK_HANDLE
+    result = hil_task_read(task, num_samples, analog_input_buffer, encoder_input_buffer, digital_input_buffer,
+                           other_input_buffer)
+    if result < 0:
+        return result
+    # The read and the write are a single transaction
+    task.board.transactions -= 1
+    task.queue_outputs(num_samples, _array(analog_output_buffer, np.float64))
+    return result
@@ -1,6 +1,6 @@
 include "quanser_types.pxd"
 
-cdef extern from "/opt/quanser/hil_sdk/include/hil.h":
+cdef extern from "hil.h" nogil:
     ctypedef struct t_card:
         pass
     ctypedef struct t_task:
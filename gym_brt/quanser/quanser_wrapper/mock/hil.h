@@ -0,0 +1,97 @@
+/*
+ * Stand-in for hil.h of the HIL SDK of Quanser.
+ *
+ * Declares the HIL functions used by quanser_wrapper.pyx with the signatures of the SDK. They are implemented by
+ * mock_hil.c, which forwards them to the simulated board of gym_brt.quanser.mock_hil, so that the unmodified wrapper
+ * can be compiled and run without the SDK (the extension quanser_wrapper_mock).
+ */
+#ifndef MOCK_HIL_H
+#define MOCK_HIL_H
+
+#include "quanser_types.h"
+
+typedef struct tag_card * t_card;
+typedef struct tag_task * t_task;
+typedef struct tag_monitor * t_monitor;
+
+typedef enum t_clock
+{
+    SYSTEM_CLOCK_4 = -4,
+    SYSTEM_CLOCK_3 = -3,
+    SYSTEM_CLOCK_2 = -2,
+    SYSTEM_CLOCK_1 = -1,
+    HARDWARE_CLOCK_0 = 0,
+    HARDWARE_CLOCK_1,
+    HARDWARE_CLOCK_2,
+    HARDWARE_CLOCK_3,
+    HARDWARE_CLOCK_4,
+    HARDWARE_CLOCK_5,
+    HARDWARE_CLOCK_6,
+    HARDWARE_CLOCK_7,
+    HARDWARE_CLOCK_8,
+    HARDWARE_CLOCK_9,
+    HARDWARE_CLOCK_10,
+    HARDWARE_CLOCK_11,
+    HARDWARE_CLOCK_12,
+    HARDWARE_CLOCK_13,
+    HARDWARE_CLOCK_14,
+    HARDWARE_CLOCK_15,
+    HARDWARE_CLOCK_16,
+    HARDWARE_CLOCK_17,
+    HARDWARE_CLOCK_18,
+    HARDWARE_CLOCK_19
+} t_clock;
+
+typedef enum t_buffer_overflow_mode
+{
+    BUFFER_MODE_ERROR_ON_OVERFLOW,
+    BUFFER_MODE_OVERWRITE_ON_OVERFLOW,
+    BUFFER_MODE_DISCARD_ON_OVERFLOW
+} t_buffer_overflow_mode;
+
+t_error hil_open(const char * card_type, const char * card_identifier, t_card * card);
+t_error hil_close(t_card card);
+t_error hil_close_all(void);
+
+t_error hil_set_encoder_counts(t_card card, const t_uint32 encoder_channels[], t_uint32 num_channels,
+                               const t_int32 buffer[]);
+t_error hil_write_analog(t_card card, const t_uint32 analog_channels[], t_uint32 num_channels,
+                         const t_double buffer[]);
+t_error hil_write_digital(t_card card, const t_uint32 digital_lines[], t_uint32 num_lines, const t_boolean buffer[]);
+t_error hil_write_other(t_card card, const t_uint32 other_channels[], t_uint32 num_channels, const t_double buffer[]);
+
+t_error hil_task_create_reader(t_card card, t_uint32 samples_in_buffer,
+                               const t_uint32 analog_channels[], t_uint32 num_analog_channels,
+                               const t_uint32 encoder_channels[], t_uint32 num_encoder_channels,
+                               const t_uint32 digital_lines[], t_uint32 num_digital_lines,
+                               const t_uint32 other_channels[], t_uint32 num_other_channels,
+                               t_task * task);
+t_error hil_task_create_reader_writer(t_card card, t_uint32 samples_in_buffer,
+                                      const t_uint32 analog_input_channels[], t_uint32 num_analog_input_channels,
+                                      const t_uint32 encoder_input_channels[], t_uint32 num_encoder_input_channels,
+                                      const t_uint32 digital_input_lines[], t_uint32 num_digital_input_lines,
+                                      const t_uint32 other_input_channels[], t_uint32 num_other_input_channels,
+                                      const t_uint32 analog_output_channels[], t_uint32 num_analog_output_channels,
+                                      const t_uint32 pwm_output_channels[], t_uint32 num_pwm_output_channels,
+                                      const t_uint32 digital_output_lines[], t_uint32 num_digital_output_lines,
+                                      const t_uint32 other_output_channels[], t_uint32 num_other_output_channels,
+                                      t_task * task);
+t_error hil_task_start(t_task task, t_clock clock, t_double frequency, t_uint32 num_samples);
+t_error hil_task_flush(t_task task);
+t_error hil_task_stop(t_task task);
+t_error hil_task_delete(t_task task);
+
+t_error hil_task_read(t_task task, t_uint32 num_samples, t_double analog_buffer[], t_int32 encoder_buffer[],
+                      t_boolean digital_buffer[], t_double other_buffer[]);
+t_error hil_task_write(t_task task, t_uint32 num_samples, const t_double analog_buffer[], const t_double pwm_buffer[],
+                       const t_boolean digital_buffer[], const t_double other_buffer[]);
+t_error hil_task_read_write(t_task task, t_uint32 num_samples,
+                            t_double analog_input_buffer[], t_int32 encoder_input_buffer[],
+                            t_boolean digital_input_buffer[], t_double other_input_buffer[],
+                            const t_double analog_output_buffer[], const t_double pwm_output_buffer[],
+                            const t_boolean digital_output_buffer[], const t_double other_output_buffer[]);
+
+t_error hil_task_set_buffer_overflow_mode(t_task task, t_buffer_overflow_mode mode);
+t_int hil_task_get_buffer_overflows(t_task task);
+
+#endif
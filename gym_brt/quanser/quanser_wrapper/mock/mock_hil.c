@@ -0,0 +1,389 @@
+/*
+ * Implementation of the HIL functions of hil.h by the simulated board of gym_brt.quanser.mock_hil.
+ *
+ * Every function acquires the GIL (the wrapper calls the blocking functions without it) and calls the Python function
+ * of the same name. Handles are references to the Python objects, the C buffers are passed as memoryviews (their
+ * lengths are known from the number of channels, which is recorded for every task). A Python exception is printed and
+ * returned as QERR_DEVICE_DISCONNECTED.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "hil.h"
+
+#define QERR_INVALID_ARGUMENT 4
+#define QERR_INVALID_CARD_HANDLE 88
+#define QERR_INVALID_TASK_HANDLE 105
+#define QERR_DEVICE_DISCONNECTED 1160
+
+struct tag_card
+{
+    PyObject * board;
+};
+
+struct tag_task
+{
+    PyObject * task;
+    t_uint32 num_analog_inputs;
+    t_uint32 num_encoder_inputs;
+    t_uint32 num_digital_inputs;
+    t_uint32 num_other_inputs;
+    t_uint32 num_analog_outputs;
+    t_uint32 num_pwm_outputs;
+    t_uint32 num_digital_outputs;
+    t_uint32 num_other_outputs;
+};
+
+static PyObject * mock_module = NULL;
+
+/* New reference to a memoryview of the buffer or to None if there is no buffer */
+static PyObject * buffer(const void * data, t_uint32 count, size_t item_size, int writable)
+{
+    if (data == NULL || count == 0)
+        Py_RETURN_NONE;
+    return PyMemoryView_FromMemory((char *) data, (Py_ssize_t) count * item_size, writable ? PyBUF_WRITE : PyBUF_READ);
+}
+
+/*
+ * Calls the Python function `name` with the arguments of `format` (see Py_BuildValue). The result is either the
+ * error code or a tuple of the error code and a handle, which is stored as new reference in `handle` (if not NULL).
+ */
+static t_error call(const char * name, PyObject ** handle, const char * format, ...)
+{
+    PyObject * function = NULL;
+    PyObject * arguments = NULL;
+    PyObject * result = NULL;
+    PyObject * object = NULL;
+    t_error error = -QERR_DEVICE_DISCONNECTED;
+    va_list va;
+
+    if (mock_module == NULL)
+        mock_module = PyImport_ImportModule("gym_brt.quanser.mock_hil");
+    if (mock_module == NULL)
+        goto done;
+    function = PyObject_GetAttrString(mock_module, name);
+    if (function == NULL)
+        goto done;
+
+    va_start(va, format);
+    arguments = Py_VaBuildValue(format, va);
+    va_end(va);
+    if (arguments == NULL)
+        goto done;
+
+    result = PyObject_CallObject(function, arguments);
+    if (result == NULL)
+        goto done;
+    if (handle != NULL)
+    {
+        if (!PyArg_ParseTuple(result, "iO", &error, &object))
+            goto done;
+        Py_INCREF(object);
+        *handle = object;
+    }
+    else
+    {
+        error = (t_error) PyLong_AsLong(result);
+    }
+
+done:
+    if (PyErr_Occurred())
+    {
+        PyErr_Print();
+        error = -QERR_DEVICE_DISCONNECTED;
+    }
+    Py_XDECREF(result);
+    Py_XDECREF(arguments);
+    Py_XDECREF(function);
+    return error;
+}
+
+t_error hil_open(const char * card_type, const char * card_identifier, t_card * card)
+{
+    PyGILState_STATE state = PyGILState_Ensure();
+    PyObject * board = NULL;
+    t_error error = call("hil_open", &board, "(yy)", card_type, card_identifier);
+    *card = NULL;
+    if (error >= 0)
+    {
+        *card = (t_card) PyMem_RawMalloc(sizeof(struct tag_card));
+        if (*card == NULL)
+        {
+            Py_DECREF(board);
+            error = -QERR_DEVICE_DISCONNECTED;
+        }
+        else
+        {
+            (*card)->board = board;
+        }
+    }
+    else
+    {
+        Py_XDECREF(board);
+    }
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_close(t_card card)
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_close", NULL, "(O)", card->board);
+    Py_DECREF(card->board);
+    PyMem_RawFree(card);
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_close_all(void)
+{
+    PyGILState_STATE state = PyGILState_Ensure();
+    t_error error = call("hil_close_all", NULL, "()");
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_set_encoder_counts(t_card card, const t_uint32 encoder_channels[], t_uint32 num_channels,
+                               const t_int32 buffer_[])
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_set_encoder_counts", NULL, "(ONN)", card->board,
+                 buffer(encoder_channels, num_channels, sizeof(t_uint32), 0),
+                 buffer(buffer_, num_channels, sizeof(t_int32), 0));
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_write_analog(t_card card, const t_uint32 analog_channels[], t_uint32 num_channels,
+                         const t_double buffer_[])
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_write_analog", NULL, "(ONN)", card->board,
+                 buffer(analog_channels, num_channels, sizeof(t_uint32), 0),
+                 buffer(buffer_, num_channels, sizeof(t_double), 0));
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_write_digital(t_card card, const t_uint32 digital_lines[], t_uint32 num_lines, const t_boolean buffer_[])
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_write_digital", NULL, "(ONN)", card->board,
+                 buffer(digital_lines, num_lines, sizeof(t_uint32), 0),
+                 buffer(buffer_, num_lines, sizeof(t_boolean), 0));
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_write_other(t_card card, const t_uint32 other_channels[], t_uint32 num_channels, const t_double buffer_[])
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_write_other", NULL, "(ONN)", card->board,
+                 buffer(other_channels, num_channels, sizeof(t_uint32), 0),
+                 buffer(buffer_, num_channels, sizeof(t_double), 0));
+    PyGILState_Release(state);
+    return error;
+}
+
+static t_error create_task(t_card card, t_uint32 samples_in_buffer,
+                           const t_uint32 analog_input_channels[], t_uint32 num_analog_input_channels,
+                           const t_uint32 encoder_input_channels[], t_uint32 num_encoder_input_channels,
+                           const t_uint32 digital_input_lines[], t_uint32 num_digital_input_lines,
+                           const t_uint32 other_input_channels[], t_uint32 num_other_input_channels,
+                           const t_uint32 analog_output_channels[], t_uint32 num_analog_output_channels,
+                           const t_uint32 pwm_output_channels[], t_uint32 num_pwm_output_channels,
+                           const t_uint32 digital_output_lines[], t_uint32 num_digital_output_lines,
+                           const t_uint32 other_output_channels[], t_uint32 num_other_output_channels,
+                           int writer, t_task * task)
+{
+    PyGILState_STATE state;
+    PyObject * handle = NULL;
+    t_error error;
+    if (card == NULL)
+        return -QERR_INVALID_CARD_HANDLE;
+    if (task == NULL)
+        return -QERR_INVALID_ARGUMENT;
+    state = PyGILState_Ensure();
+    *task = NULL;
+    if (writer)
+        error = call("hil_task_create_reader_writer", &handle, "(OINNNNNNNN)", card->board, samples_in_buffer,
+                     buffer(analog_input_channels, num_analog_input_channels, sizeof(t_uint32), 0),
+                     buffer(encoder_input_channels, num_encoder_input_channels, sizeof(t_uint32), 0),
+                     buffer(digital_input_lines, num_digital_input_lines, sizeof(t_uint32), 0),
+                     buffer(other_input_channels, num_other_input_channels, sizeof(t_uint32), 0),
+                     buffer(analog_output_channels, num_analog_output_channels, sizeof(t_uint32), 0),
+                     buffer(pwm_output_channels, num_pwm_output_channels, sizeof(t_uint32), 0),
+                     buffer(digital_output_lines, num_digital_output_lines, sizeof(t_uint32), 0),
+                     buffer(other_output_channels, num_other_output_channels, sizeof(t_uint32), 0));
+    else
+        error = call("hil_task_create_reader", &handle, "(OINNNN)", card->board, samples_in_buffer,
+                     buffer(analog_input_channels, num_analog_input_channels, sizeof(t_uint32), 0),
+                     buffer(encoder_input_channels, num_encoder_input_channels, sizeof(t_uint32), 0),
+                     buffer(digital_input_lines, num_digital_input_lines, sizeof(t_uint32), 0),
+                     buffer(other_input_channels, num_other_input_channels, sizeof(t_uint32), 0));
+    if (error >= 0)
+    {
+        *task = (t_task) PyMem_RawMalloc(sizeof(struct tag_task));
+        if (*task == NULL)
+        {
+            Py_DECREF(handle);
+            error = -QERR_DEVICE_DISCONNECTED;
+        }
+        else
+        {
+            (*task)->task = handle;
+            (*task)->num_analog_inputs = analog_input_channels != NULL ? num_analog_input_channels : 0;
+            (*task)->num_encoder_inputs = encoder_input_channels != NULL ? num_encoder_input_channels : 0;
+            (*task)->num_digital_inputs = digital_input_lines != NULL ? num_digital_input_lines : 0;
+            (*task)->num_other_inputs = other_input_channels != NULL ? num_other_input_channels : 0;
+            (*task)->num_analog_outputs = analog_output_channels != NULL ? num_analog_output_channels : 0;
+            (*task)->num_pwm_outputs = pwm_output_channels != NULL ? num_pwm_output_channels : 0;
+            (*task)->num_digital_outputs = digital_output_lines != NULL ? num_digital_output_lines : 0;
+            (*task)->num_other_outputs = other_output_channels != NULL ? num_other_output_channels : 0;
+        }
+    }
+    else
+    {
+        Py_XDECREF(handle);
+    }
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_task_create_reader(t_card card, t_uint32 samples_in_buffer,
+                               const t_uint32 analog_channels[], t_uint32 num_analog_channels,
+                               const t_uint32 encoder_channels[], t_uint32 num_encoder_channels,
+                               const t_uint32 digital_lines[], t_uint32 num_digital_lines,
+                               const t_uint32 other_channels[], t_uint32 num_other_channels,
+                               t_task * task)
+{
+    return create_task(card, samples_in_buffer, analog_channels, num_analog_channels, encoder_channels,
+                       num_encoder_channels, digital_lines, num_digital_lines, other_channels, num_other_channels,
+                       NULL, 0, NULL, 0, NULL, 0, NULL, 0, 0, task);
+}
+
+t_error hil_task_create_reader_writer(t_card card, t_uint32 samples_in_buffer,
+                                      const t_uint32 analog_input_channels[], t_uint32 num_analog_input_channels,
+                                      const t_uint32 encoder_input_channels[], t_uint32 num_encoder_input_channels,
+                                      const t_uint32 digital_input_lines[], t_uint32 num_digital_input_lines,
+                                      const t_uint32 other_input_channels[], t_uint32 num_other_input_channels,
+                                      const t_uint32 analog_output_channels[], t_uint32 num_analog_output_channels,
+                                      const t_uint32 pwm_output_channels[], t_uint32 num_pwm_output_channels,
+                                      const t_uint32 digital_output_lines[], t_uint32 num_digital_output_lines,
+                                      const t_uint32 other_output_channels[], t_uint32 num_other_output_channels,
+                                      t_task * task)
+{
+    return create_task(card, samples_in_buffer, analog_input_channels, num_analog_input_channels,
+                       encoder_input_channels, num_encoder_input_channels, digital_input_lines,
+                       num_digital_input_lines, other_input_channels, num_other_input_channels,
+                       analog_output_channels, num_analog_output_channels, pwm_output_channels,
+                       num_pwm_output_channels, digital_output_lines, num_digital_output_lines,
+                       other_output_channels, num_other_output_channels, 1, task);
+}
+
+/* Calls a task function which only takes the task (and optionally an integer argument) */
+#define TASK_CALL(name, format, ...)                                \
+    PyGILState_STATE state;                                         \
+    t_error error;                                                  \
+    if (task == NULL)                                               \
+        return -QERR_INVALID_TASK_HANDLE;                           \
+    state = PyGILState_Ensure();                                    \
+    error = call(name, NULL, format, task->task, ##__VA_ARGS__);    \
+    PyGILState_Release(state);                                      \
+    return error;
+
+t_error hil_task_start(t_task task, t_clock clock, t_double frequency, t_uint32 num_samples)
+{
+    TASK_CALL("hil_task_start", "(OidI)", (int) clock, frequency, num_samples)
+}
+
+t_error hil_task_flush(t_task task)
+{
+    TASK_CALL("hil_task_flush", "(O)")
+}
+
+t_error hil_task_stop(t_task task)
+{
+    TASK_CALL("hil_task_stop", "(O)")
+}
+
+t_error hil_task_set_buffer_overflow_mode(t_task task, t_buffer_overflow_mode mode)
+{
+    TASK_CALL("hil_task_set_buffer_overflow_mode", "(Oi)", (int) mode)
+}
+
+t_int hil_task_get_buffer_overflows(t_task task)
+{
+    TASK_CALL("hil_task_get_buffer_overflows", "(O)")
+}
+
+t_error hil_task_delete(t_task task)
+{
+    PyGILState_STATE state;
+    t_error error;
+    if (task == NULL)
+        return -QERR_INVALID_TASK_HANDLE;
+    state = PyGILState_Ensure();
+    error = call("hil_task_delete", NULL, "(O)", task->task);
+    Py_DECREF(task->task);
+    PyMem_RawFree(task);
+    PyGILState_Release(state);
+    return error;
+}
+
+t_error hil_task_read(t_task task, t_uint32 num_samples, t_double analog_buffer[], t_int32 encoder_buffer[],
+                      t_boolean digital_buffer[], t_double other_buffer[])
+{
+    TASK_CALL("hil_task_read", "(OINNNN)", num_samples,
+              buffer(analog_buffer, num_samples * task->num_analog_inputs, sizeof(t_double), 1),
+              buffer(encoder_buffer, num_samples * task->num_encoder_inputs, sizeof(t_int32), 1),
+              buffer(digital_buffer, num_samples * task->num_digital_inputs, sizeof(t_boolean), 1),
+              buffer(other_buffer, num_samples * task->num_other_inputs, sizeof(t_double), 1))
+}
+
+t_error hil_task_write(t_task task, t_uint32 num_samples, const t_double analog_buffer[], const t_double pwm_buffer[],
+                       const t_boolean digital_buffer[], const t_double other_buffer[])
+{
+    TASK_CALL("hil_task_write", "(OINNNN)", num_samples,
+              buffer(analog_buffer, num_samples * task->num_analog_outputs, sizeof(t_double), 0),
+              buffer(pwm_buffer, num_samples * task->num_pwm_outputs, sizeof(t_double), 0),
+              buffer(digital_buffer, num_samples * task->num_digital_outputs, sizeof(t_boolean), 0),
+              buffer(other_buffer, num_samples * task->num_other_outputs, sizeof(t_double), 0))
+}
+
+t_error hil_task_read_write(t_task task, t_uint32 num_samples,
+                            t_double analog_input_buffer[], t_int32 encoder_input_buffer[],
+                            t_boolean digital_input_buffer[], t_double other_input_buffer[],
+                            const t_double analog_output_buffer[], const t_double pwm_output_buffer[],
+                            const t_boolean digital_output_buffer[], const t_double other_output_buffer[])
+{
+    TASK_CALL("hil_task_read_write", "(OINNNNNNNN)", num_samples,
+              buffer(analog_input_buffer, num_samples * task->num_analog_inputs, sizeof(t_double), 1),
+              buffer(encoder_input_buffer, num_samples * task->num_encoder_inputs, sizeof(t_int32), 1),
+              buffer(digital_input_buffer, num_samples * task->num_digital_inputs, sizeof(t_boolean), 1),
+              buffer(other_input_buffer, num_samples * task->num_other_inputs, sizeof(t_double), 1),
+              buffer(analog_output_buffer, num_samples * task->num_analog_outputs, sizeof(t_double), 0),
+              buffer(pwm_output_buffer, num_samples * task->num_pwm_outputs, sizeof(t_double), 0),
+              buffer(digital_output_buffer, num_samples * task->num_digital_outputs, sizeof(t_boolean), 0),
+              buffer(other_output_buffer, num_samples * task->num_other_outputs, sizeof(t_double), 0))
+}
@@ -0,0 +1,28 @@
+/*
+ * Types of the HIL SDK of Quanser used by hil.pxd (see hil.h in this directory).
+ */
+#ifndef MOCK_QUANSER_TYPES_H
+#define MOCK_QUANSER_TYPES_H
+
+#include <stdint.h>
+
+typedef int t_error;
+
+typedef int8_t t_boolean;
+typedef int8_t t_byte;
+typedef uint8_t t_ubyte;
+typedef int16_t t_short;
+typedef uint16_t t_ushort;
+typedef int32_t t_int;
+typedef uint32_t t_uint;
+typedef double t_double;
+typedef int64_t t_long;
+
+typedef int8_t t_int8;
+typedef uint8_t t_uint8;
+typedef int16_t t_int16;
+typedef uint16_t t_uint16;
+typedef int32_t t_int32;
+typedef uint32_t t_uint32;
+
+#endif
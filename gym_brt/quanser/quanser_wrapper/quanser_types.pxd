@@ -1,6 +1,6 @@
 cimport numpy as np
 
-cdef extern from "/opt/quanser/hil_sdk/include/quanser_types.h":
+cdef extern from "quanser_types.h":
     ctypedef int t_error
 
     ctypedef np.npy_int8    t_boolean # must always be 8 bits
@@ -1,13 +1,12 @@
-from __future__ import absolute_import
-from __future__ import print_function
-from __future__ import division
-
+# cython: language_level=3
 cimport gym_brt.quanser.quanser_wrapper.quanser_types as qt
 cimport gym_brt.quanser.quanser_wrapper.hil as hil
 cimport numpy as np
+from libc.math cimport fmod, M_PI
 
 from gym_brt.quanser.quanser_wrapper.error_codes import error_codes
 import numpy as np
+import time
 
 
 cdef print_possible_error(int result):
@@ -44,9 +43,35 @@ cdef class QuanserWrapper:
     cdef qt.t_uint32 num_led_w_channels
     cdef qt.t_double[::] led_w_buffer
 
+    # Clipped voltages of `action_trusted`
+    cdef object voltages_trusted
+    cdef qt.t_double[::1] voltages_trusted_view
+
+    # Preallocated buffers of `action_all` with one row per sample
+    cdef qt.t_double[:, ::1] currents_r_samples
+    cdef qt.t_int32[:, ::1] encoder_r_samples
+    cdef qt.t_double[:, ::1] other_r_samples
+
     cdef qt.t_double frequency, max_voltage
-    cdef qt.t_int samples_overflowed
+    # Total number of samples missed by the task (readable from Python)
+    cdef readonly qt.t_int samples_overflowed
+    # Number of samples the task buffers and total number of samples read since the task was started
+    cdef readonly qt.t_uint32 buffer_size
+    cdef readonly long long samples_read
+    # Samples which were overwritten before `action_all` could read them
+    cdef long long samples_skipped
+    # Start of the task on the clock of the PC and `samples_read` when it was last aligned with the hardware clock
+    cdef double task_start_time
+    cdef long long samples_aligned
     cdef bint task_started
+    # The LED and the enables are only written if they differ from the last written values (which are known after the
+    # first write)
+    cdef bint led_written, enables_written
+    # Number of data transfers to or from the board (reads and writes) and of skipped unchanged LED/enable writes
+    cdef readonly long long transactions
+    cdef readonly long long writes_skipped
+    # Write the voltages with the task on the clock edge of the next sample instead of immediately
+    cdef readonly bint timed_write
 
     def __init__(
         self,
@@ -57,8 +82,12 @@ cdef class QuanserWrapper:
         encoder_r_channels,
         other_r_channels,
         led_w_channels,
-        frequency=1000
+        frequency=1000,
+        buffer_size=1,
+        timed_write=False
     ):
+        if buffer_size < 1:
+            raise ValueError("The buffer of the task must hold at least one sample.")
         self.max_voltage = max_voltage
         # Convert the channels into numpy arrays which are then stored in
         # memoryviews (to pass C buffers to the HIL API)
@@ -76,7 +105,18 @@ cdef class QuanserWrapper:
         self.led_w_channels = np.array(led_w_channels, dtype=np.uint32)
 
         self.frequency = frequency
+        self.buffer_size = buffer_size
+        self.timed_write = timed_write
         self.task_started = False
+        self.samples_overflowed = 0
+        self.samples_read = 0
+        self.samples_skipped = 0
+        self.led_written = False
+        self.enables_written = False
+        self.transactions = 0
+        self.writes_skipped = 0
+        self.voltages_trusted = np.zeros(self.num_analog_w_channels, dtype=np.float64)
+        self.voltages_trusted_view = self.voltages_trusted
 
     def __enter__(self):
         """Start the hardware in a deterministic way (all motors,
@@ -89,6 +129,15 @@ cdef class QuanserWrapper:
         self.other_r_buffer = np.zeros(
             self.num_other_r_channels, dtype=np.float64
         )  # t_double is 64 bits
+        self.currents_r_samples = np.zeros(
+            (self.buffer_size, self.num_analog_r_channels), dtype=np.float64
+        )
+        self.encoder_r_samples = np.zeros(
+            (self.buffer_size, self.num_encoder_r_channels), dtype=np.int32
+        )
+        self.other_r_samples = np.zeros(
+            (self.buffer_size, self.num_other_r_channels), dtype=np.float64
+        )
 
         # Set motor voltages_w and encoders to 0
         self.voltages_w = np.zeros(
@@ -123,6 +172,7 @@ cdef class QuanserWrapper:
             &self.led_w_buffer[0]
         )
         print_possible_error(result)
+        self.led_written = result >= 0
 
         # Enables_r all the motors
         self.enables_w = np.ones(
@@ -135,6 +185,7 @@ cdef class QuanserWrapper:
             &self.enables_w[0]
         )
         print_possible_error(result)
+        self.enables_written = result >= 0
 
         return self
 
@@ -177,19 +228,37 @@ cdef class QuanserWrapper:
             &self.enables_w[0]
         )
 
+        self.led_written = False
+        self.enables_written = False
         hil.hil_close(self.board)  # Safely close the board
 
     def _create_task(self):
         """Start a task reads and writes at fixed intervals"""
-        result = hil.hil_task_create_reader(
-            self.board,
-            1,  # Read 1 sample at a time
-            &self.analog_r_channels[0], self.num_analog_r_channels,
-            &self.encoder_r_channels[0], self.num_encoder_r_channels,
-            NULL, 0,
-            &self.other_r_channels[0], self.num_other_r_channels,
-            &self.task
-        )
+        if self.timed_write:
+            # The voltages are written by the task as well (synchronized with the reads on the hardware clock)
+            result = hil.hil_task_create_reader_writer(
+                self.board,
+                self.buffer_size,  # Number of samples buffered between two reads
+                &self.analog_r_channels[0], self.num_analog_r_channels,
+                &self.encoder_r_channels[0], self.num_encoder_r_channels,
+                NULL, 0,
+                &self.other_r_channels[0], self.num_other_r_channels,
+                &self.analog_w_channels[0], self.num_analog_w_channels,
+                NULL, 0,
+                NULL, 0,
+                NULL, 0,
+                &self.task
+            )
+        else:
+            result = hil.hil_task_create_reader(
+                self.board,
+                self.buffer_size,  # Number of samples buffered between two reads
+                &self.analog_r_channels[0], self.num_analog_r_channels,
+                &self.encoder_r_channels[0], self.num_encoder_r_channels,
+                NULL, 0,
+                &self.other_r_channels[0], self.num_other_r_channels,
+                &self.task
+            )
         print_possible_error(result)
 
         # Allow discarding of old samples after missed reads
@@ -197,6 +266,16 @@ cdef class QuanserWrapper:
             self.task, hil.BUFFER_MODE_OVERWRITE_ON_OVERFLOW
         )
 
+        if self.timed_write:
+            # Output of the first sample (every read/write then queues the output of the next sample)
+            self.voltages_w = np.zeros(
+                self.num_analog_w_channels, dtype=np.float64
+            )  # t_double is 64 bits
+            result = hil.hil_task_write(
+                self.task, 1, &self.voltages_w[0], NULL, NULL, NULL
+            )
+            print_possible_error(result)
+
         # Start the task
         result = hil.hil_task_start(
             self.task,
@@ -208,6 +287,10 @@ cdef class QuanserWrapper:
         if result < 0:
             raise ValueError("Could not start hil task")
 
+        self.task_start_time = time.perf_counter()
+        self.samples_read = 0
+        self.samples_skipped = 0
+        self.samples_aligned = 0
         self.task_started = True
 
     def _stop_task(self):
@@ -244,6 +327,112 @@ cdef class QuanserWrapper:
         print_possible_error(result)
 
     def action(self, voltages_w, led_w=None):
+        """Reads the latest sample of the task and then writes the voltages.
+
+        With `timed_write` the read and the write are a single transaction of the task and the voltages are applied on
+        the clock edge of the next sample (constant latency of one sample period).
+
+        Returns:
+            The currents, encoder counts and other channels of a single sample
+        """
+        voltages_w = self._prepare_action(voltages_w, led_w)
+        return self._action(voltages_w)
+
+    def action_all(self, voltages_w, led_w=None):
+        """Reads all samples the task took since the last read in a single call and then writes the voltages.
+
+        The task has to buffer more than one sample (`buffer_size`) for this to be useful. The number of available
+        samples is derived from the time since the task was started; at most `buffer_size` samples are read (older ones
+        are overwritten and counted in `samples_overflowed`) and at least one (blocks until the next sample, like `action`).
+        The clock of the PC is aligned with the one of the hardware whenever a read blocks. To detect a hardware clock
+        which runs ahead, one sample more than estimated is requested once per second (such a read may block for up
+        to one sample period). Not supported with `timed_write`, which queues a single output sample per read.
+
+        Returns:
+            The number of samples `n` and the currents, encoder counts and other channels of shape (n, channels) with
+            the latest sample in the last row. The arrays are views of preallocated buffers, which are overwritten by
+            the next read.
+        """
+        voltages_w = self._prepare_action(voltages_w, led_w)
+        return self._action_all(voltages_w)
+
+    def action_trusted(self, qt.t_double[::1] voltages_w, qt.t_double[::1] led_w=None):
+        """Like `action` but without the validation of the arguments in Python for trusted callers.
+
+        The voltages (float64, one per analog output) are clipped into a preallocated buffer, the LED (float64 RGB in
+        the range 0-1) is not checked.
+        """
+        if not self.task_started:
+            self._create_task()
+        self._clip_trusted(voltages_w)
+        if led_w is not None:
+            self._write_led(led_w)
+        return self._action(self.voltages_trusted)
+
+    def write_trusted(self, qt.t_double[::1] voltages_w, qt.t_double[::1] led_w=None):
+        """Like `write` but without the validation of the arguments in Python (see `action_trusted`)."""
+        if not self.task_started:
+            self._create_task()
+        self._clip_trusted(voltages_w)
+        if led_w is not None:
+            self._write_led(led_w)
+        self._write_voltages(self.voltages_trusted)
+
+    cdef _clip_trusted(self, qt.t_double[::1] voltages_w):
+        cdef Py_ssize_t i
+        cdef qt.t_double voltage
+        if voltages_w.shape[0] != self.num_analog_w_channels:
+            raise ValueError(f"Expected {self.num_analog_w_channels} voltages but got {voltages_w.shape[0]}.")
+        for i in range(self.num_analog_w_channels):
+            voltage = voltages_w[i]
+            if voltage > self.max_voltage:
+                voltage = self.max_voltage
+            elif voltage < -self.max_voltage:
+                voltage = -self.max_voltage
+            self.voltages_trusted_view[i] = voltage
+
+    def set_enables(self, enables_w):
+        """Enables (1) or disables (0) the motors, the lines are only written if they changed."""
+        cdef Py_ssize_t i
+        cdef bint changed = not self.enables_written
+        enables_w = np.asarray(enables_w, dtype=np.int8)
+        assert enables_w.shape == (self.num_digital_w_channels,)
+        for i in range(self.num_digital_w_channels):
+            if self.enables_w[i] != enables_w[i]:
+                self.enables_w[i] = enables_w[i]
+                changed = True
+        if not changed:
+            self.writes_skipped += 1
+            return
+        result = hil.hil_write_digital(
+            self.board,
+            &self.digital_w_channels[0],
+            self.num_digital_w_channels,
+            &self.enables_w[0]
+        )
+        self.transactions += 1
+        print_possible_error(result)
+        self.enables_written = result >= 0
+
+    def read(self):
+        """Reads the latest sample of the task without writing (like `action`, e.g. to choose the voltages after
+        the sample arrived and then `write` them)."""
+        if not self.task_started:
+            self._create_task()
+        return self._read()
+
+    def read_all(self):
+        """Reads all samples the task took since the last read without writing (like `action_all`)."""
+        if not self.task_started:
+            self._create_task()
+        return self._read_all()
+
+    def write(self, voltages_w, led_w=None):
+        """Writes the voltages (and the LED) without reading."""
+        voltages_w = self._prepare_action(voltages_w, led_w)
+        self._write_voltages(voltages_w)
+
+    def _prepare_action(self, voltages_w, led_w):
         # If it"s the first time running action, then start the background r/w
         # task
         if not self.task_started:
@@ -266,41 +455,85 @@ cdef class QuanserWrapper:
             assert led_w.dtype == np.float64
             for i in range(self.num_led_w_channels):
                 assert 0.0 <= led_w[i] <= 1.0  # HIL uses RGB scaled from 0-1
-            self._set_led(led_w)  # An immediate write to LED (not timed task)
+            self._write_led(led_w)  # An immediate write to LED (not timed task), only if the color changed
 
-        return self._action(voltages_w)
+        return voltages_w
 
     def _action(
         self, np.ndarray[qt.t_double, ndim=1, mode="c"] voltages_w not None
     ):
-        samples_read = hil.hil_task_read(
-            self.task,
-            1,  # Number of samples to read
-            &self.currents_r[0],
-            &self.encoder_r_buffer[0],
-            NULL,
-            &self.other_r_buffer[0]
-        )
+        if self.timed_write:
+            return self._read_write(voltages_w)
+        sample = self._read()
+        # Then write voltages_w calculated for previous time step
+        self._write_voltages(voltages_w)
+        return sample
+
+    cdef _read_write(self, np.ndarray[qt.t_double, ndim=1, mode="c"] voltages_w):
+        """Reads the next sample and queues the voltages for the following one in a single transaction."""
+        cdef qt.t_error samples_read
+        cdef qt.t_double* currents = &self.currents_r[0]
+        cdef qt.t_int32* encoders = &self.encoder_r_buffer[0]
+        cdef qt.t_double* others = &self.other_r_buffer[0]
+        cdef qt.t_double* voltages
+        self.voltages_w = voltages_w
+        voltages = &self.voltages_w[0]
+        with nogil:
+            samples_read = hil.hil_task_read_write(
+                self.task,
+                1,  # Number of samples to read and write
+                currents,
+                encoders,
+                NULL,
+                others,
+                voltages,
+                NULL,
+                NULL,
+                NULL
+            )
+        self.transactions += 1
         if samples_read < 0:
             print_possible_error(samples_read)
+        else:
+            self.samples_read += samples_read
 
-        samples_overflowed = hil.hil_task_get_buffer_overflows(self.task)
-        if samples_overflowed > self.samples_overflowed:
-            # print(
-            #     "Missed {} samples".format(samples_overflowed - self.samples_overflowed)
-            # )
-            self.samples_overflowed = samples_overflowed
+        self._update_overflows()
 
-        # Then write voltages_w calculated for previous time step
-        self.voltages_w = voltages_w
-        result_write = hil.hil_write_analog(
-            self.board,
-            &self.analog_w_channels[0],
-            self.num_analog_w_channels,
-            &self.voltages_w[0]
+        return (
+            np.asarray(self.currents_r),
+            np.asarray(self.encoder_r_buffer),
+            np.asarray(self.other_r_buffer),
         )
-        if result_write < 0:
-            print_possible_error(result_write)
+
+    def _action_all(
+        self, np.ndarray[qt.t_double, ndim=1, mode="c"] voltages_w not None
+    ):
+        samples = self._read_all()
+        self._write_voltages(voltages_w)
+        return samples
+
+    cdef _read(self):
+        cdef qt.t_error samples_read
+        cdef qt.t_double* currents = &self.currents_r[0]
+        cdef qt.t_int32* encoders = &self.encoder_r_buffer[0]
+        cdef qt.t_double* others = &self.other_r_buffer[0]
+        # The read blocks until the next sample, other Python threads can run in the meantime
+        with nogil:
+            samples_read = hil.hil_task_read(
+                self.task,
+                1,  # Number of samples to read
+                currents,
+                encoders,
+                NULL,
+                others
+            )
+        self.transactions += 1
+        if samples_read < 0:
+            print_possible_error(samples_read)
+        else:
+            self.samples_read += samples_read
+
+        self._update_overflows()
 
         return (
             np.asarray(self.currents_r),
@@ -308,18 +541,126 @@ cdef class QuanserWrapper:
             np.asarray(self.other_r_buffer),
         )
 
+    cdef _read_all(self):
+        cdef long long samples_taken, num_samples
+        cdef double read_start, read_end
+        cdef bint probe
+        cdef qt.t_error samples_read
+        cdef qt.t_uint32 samples_to_read
+        cdef qt.t_double* currents = &self.currents_r_samples[0, 0]
+        cdef qt.t_int32* encoders = &self.encoder_r_samples[0, 0]
+        cdef qt.t_double* others = &self.other_r_samples[0, 0]
+        if self.timed_write:
+            raise ValueError("Reading all samples is not supported with timed_write.")
+        # Samples taken by the hardware clock since the start of the task
+        read_start = time.perf_counter()
+        samples_taken = <long long>((read_start - self.task_start_time) * self.frequency) + 1
+        samples_overflowed = hil.hil_task_get_buffer_overflows(self.task)
+        if samples_overflowed > self.samples_overflowed:
+            # The buffer is full, the overwritten samples are skipped
+            self.samples_overflowed = samples_overflowed
+            num_samples = self.buffer_size
+            if samples_taken - self.samples_read - num_samples > self.samples_skipped:
+                self.samples_skipped = samples_taken - self.samples_read - num_samples
+        else:
+            num_samples = samples_taken - self.samples_read - self.samples_skipped
+            if num_samples < 1:
+                num_samples = 1
+            elif num_samples > self.buffer_size:
+                num_samples = self.buffer_size
+        # Ask for one sample more than estimated once per second: if it is already available the clock of the hardware
+        # runs ahead of the one of the PC (the reads would never block and the unread samples pile up in the buffer)
+        probe = self.samples_read - self.samples_aligned >= self.frequency and num_samples < self.buffer_size
+        if probe:
+            num_samples += 1
+
+        samples_to_read = <qt.t_uint32>num_samples
+        with nogil:
+            samples_read = hil.hil_task_read(
+                self.task,
+                samples_to_read,
+                currents,
+                encoders,
+                NULL,
+                others
+            )
+        read_end = time.perf_counter()
+        self.transactions += 1
+        if samples_read < 0:
+            print_possible_error(samples_read)
+            num_samples = 0
+        else:
+            self.samples_read += num_samples
+            if read_end - read_start > 0.5 / self.frequency:
+                # The read waited for the latest sample, i.e. the clock of the PC runs ahead of the one of the
+                # hardware: align both to the sample which was just taken
+                self.task_start_time = read_end - (self.samples_read + self.samples_skipped - 1) / self.frequency
+                self.samples_aligned = self.samples_read
+            elif probe:
+                # The additional sample was already taken: move the start one period earlier (and probe again with the
+                # next read until a read blocks)
+                self.task_start_time -= 1.0 / self.frequency
+            # The latest sample is also returned by `action`
+            self.currents_r[:] = self.currents_r_samples[num_samples - 1]
+            self.encoder_r_buffer[:] = self.encoder_r_samples[num_samples - 1]
+            self.other_r_buffer[:] = self.other_r_samples[num_samples - 1]
+
+        return (
+            num_samples,
+            np.asarray(self.currents_r_samples)[:num_samples],
+            np.asarray(self.encoder_r_samples)[:num_samples],
+            np.asarray(self.other_r_samples)[:num_samples],
+        )
+
+    cdef _update_overflows(self):
+        samples_overflowed = hil.hil_task_get_buffer_overflows(self.task)
+        if samples_overflowed > self.samples_overflowed:
+            self.samples_overflowed = samples_overflowed
+
+    cdef _write_voltages(self, np.ndarray[qt.t_double, ndim=1, mode="c"] voltages_w):
+        self.voltages_w = voltages_w
+        if self.timed_write and self.task_started:
+            # Queued and applied by the task on the clock edge of the next sample
+            result_write = hil.hil_task_write(
+                self.task, 1, &self.voltages_w[0], NULL, NULL, NULL
+            )
+        else:
+            result_write = hil.hil_write_analog(
+                self.board,
+                &self.analog_w_channels[0],
+                self.num_analog_w_channels,
+                &self.voltages_w[0]
+            )
+        self.transactions += 1
+        if result_write < 0:
+            print_possible_error(result_write)
+
     def _set_led(
         self, np.ndarray[qt.t_double, ndim=1, mode="c"] led_w not None
     ):
-        self.led_w_buffer = led_w
+        self._write_led(led_w)
+
+    cdef _write_led(self, qt.t_double[::1] led_w):
+        cdef Py_ssize_t i
+        cdef bint changed = not self.led_written
+        # Copy into the own buffer (the array of the caller might be changed in place later on)
+        for i in range(self.num_led_w_channels):
+            if self.led_w_buffer[i] != led_w[i]:
+                self.led_w_buffer[i] = led_w[i]
+                changed = True
+        if not changed:
+            self.writes_skipped += 1
+            return
         result = hil.hil_write_other(
             self.board,
             &self.led_w_channels[0],
             self.num_led_w_channels,
             &self.led_w_buffer[0]
         )
+        self.transactions += 1
         if result < 0:
             print_possible_error(result)
+        self.led_written = result >= 0
 
 
 cdef class QuanserAero(QuanserWrapper):
@@ -331,7 +672,7 @@ cdef class QuanserAero(QuanserWrapper):
         if result < 0:
             raise IOError("Board could not be opened.")
 
-    def __init__(self, frequency=250, max_voltage=18.0):
+    def __init__(self, frequency=250, max_voltage=18.0, buffer_size=1, timed_write=False):
         analog_r_channels = [0, 1]
         analog_w_channels = [0, 1]
         digital_w_channels = [0, 1]
@@ -349,7 +690,9 @@ cdef class QuanserAero(QuanserWrapper):
             encoder_r_channels=encoder_r_channels,
             other_r_channels=other_r_channels,
             led_w_channels=led_w_channels,
-            frequency=frequency
+            frequency=frequency,
+            buffer_size=buffer_size,
+            timed_write=timed_write
         )
 
 
@@ -362,12 +705,12 @@ cdef class QubeServo2(QuanserWrapper):
         if result < 0:
             raise IOError("Board could not be opened.")
 
-    def __init__(self, frequency=250, max_voltage=18.0):
+    def __init__(self, frequency=250, max_voltage=18.0, buffer_size=1, timed_write=False):
         analog_r_channels = [0]
         analog_w_channels = [0]
         digital_w_channels = [0]
         encoder_r_channels = [0, 1]
-        other_r_channels = [14000]
+        other_r_channels = [14000, 14001]  # Tachometers (counts/s) of both encoders
         led_w_channels = [11000, 11001, 11002]
 
         super(QubeServo2, self).__init__(
@@ -378,5 +721,210 @@ cdef class QubeServo2(QuanserWrapper):
             encoder_r_channels=encoder_r_channels,
             other_r_channels=other_r_channels,
             led_w_channels=led_w_channels,
-            frequency=frequency
+            frequency=frequency,
+            buffer_size=buffer_size,
+            timed_write=timed_write
         )
+
+
+# Velocity filters of `QubeStateEstimator`
+cdef enum:
+    HIGHPASS = 0
+    SECOND_ORDER = 1
+    KALMAN = 2
+VELOCITY_FILTERS = {"highpass": HIGHPASS, "second_order": SECOND_ORDER, "kalman": KALMAN}
+# Sources of the velocities of `QubeStateEstimator`
+cdef enum:
+    SOURCE_FILTER = 0
+    SOURCE_TACHOMETER = 1
+    SOURCE_FUSED = 2
+VELOCITY_SOURCES = {"filter": SOURCE_FILTER, "tachometer": SOURCE_TACHOMETER, "fused": SOURCE_FUSED}
+# Angle of a single count of the encoders of the Qube (2048 counts per revolution)
+cdef double COUNT_TO_RAD = 2.0 * M_PI / 2048
+
+
+cdef class QubeStateEstimator:
+    """Converts the encoder counts of the Qube into the state `[theta, alpha, theta_dot, alpha_dot]`.
+
+    The velocities are estimated by one of the following filters, which are advanced with every sample:
+
+    - `highpass`: First order high-pass filter `50 s / (s + 50)` of the angles (the filter of the Quanser workbook)
+    - `second_order`: Second order low-pass filtered derivative `wc^2 s / (s^2 + 2 zeta wc s + wc^2)` with the cutoff
+      frequency `wc` and the damping `zeta`
+    - `kalman`: Kalman filter with a constant velocity model per angle, the measurement noise is the quantization noise
+      of the encoders and the process noise is the variance of the angular acceleration (`process_noise`)
+
+    The Qube-Servo 2 also measures the velocities of both encoders in hardware (tachometer, in counts/s). With
+    `velocity_source="tachometer"` they are used for `theta_dot` and `alpha_dot` directly (no phase lag of a filter),
+    with `velocity_source="fused"` the `kalman` filter uses them as additional measurements (with the variance
+    `tachometer_noise`). If no tachometer values are passed to `update`, the velocities of the filter are used.
+
+    The state is written into a preallocated array (`state`), which is returned by `update`.
+    """
+    cdef int velocity_filter, velocity_source
+    cdef double frequency, dt, cutoff, damping, process_noise, measurement_noise, tachometer_noise
+    cdef bint initialized
+    # Filter states of theta and alpha
+    cdef double[2] highpass_state
+    cdef double[2] position, velocity
+    cdef double[2] P00, P01, P11
+    cdef double[::1] state_view
+    cdef readonly object state
+
+    def __init__(self, frequency=250, velocity_filter="highpass", cutoff=50.0, damping=1.0, process_noise=1e4,
+                 velocity_source="filter", tachometer_noise=1e-2):
+        """
+        Args:
+            frequency: Sample frequency of the encoders
+            velocity_filter: `highpass`, `second_order` or `kalman`
+            cutoff: Cutoff frequency (in rad/s) of the `second_order` filter
+            damping: Damping of the `second_order` filter
+            process_noise: Variance of the angular acceleration (in rad^2/s^4) of the `kalman` filter
+            velocity_source: `filter`, `tachometer` or `fused` (requires the `kalman` filter)
+            tachometer_noise: Variance of the tachometer velocities (in rad^2/s^2) for `fused`
+        """
+        if velocity_filter not in VELOCITY_FILTERS:
+            raise ValueError(f"Unsupported velocity filter '{velocity_filter}'. "
+                             f"Valid ones are 'highpass', 'second_order' and 'kalman'.")
+        if velocity_source not in VELOCITY_SOURCES:
+            raise ValueError(f"Unsupported velocity source '{velocity_source}'. "
+                             f"Valid ones are 'filter', 'tachometer' and 'fused'.")
+        if velocity_source == "fused" and velocity_filter != "kalman":
+            raise ValueError("The velocity source 'fused' requires the velocity filter 'kalman'.")
+        self.velocity_filter = VELOCITY_FILTERS[velocity_filter]
+        self.velocity_source = VELOCITY_SOURCES[velocity_source]
+        self.tachometer_noise = tachometer_noise
+        self.frequency = frequency
+        self.dt = 1.0 / frequency
+        self.cutoff = cutoff
+        self.damping = damping
+        self.process_noise = process_noise
+        self.measurement_noise = COUNT_TO_RAD * COUNT_TO_RAD / 12.0
+        self.state = np.zeros(4, dtype=np.float64)
+        self.state_view = self.state
+        self.reset()
+
+    def reset(self):
+        """Resets the filters, the next sample is taken as the initial position at rest."""
+        cdef int i
+        for i in range(2):
+            self.highpass_state[i] = 0.0
+            self.position[i] = 0.0
+            self.velocity[i] = 0.0
+            self.P00[i] = 0.0
+            self.P01[i] = 0.0
+            self.P11[i] = 0.0
+        self.initialized = False
+
+    def update(self, qt.t_int32[::1] encoders, qt.t_double[::1] tachometers=None):
+        """Advances the filters with a single sample of the encoder counts `[theta, alpha]` (and optionally of the
+        tachometer counts/s of both encoders).
+
+        Returns:
+            The preallocated state array `[theta, alpha, theta_dot, alpha_dot]`
+        """
+        if tachometers is None or tachometers.shape[0] < 2:
+            self._update(encoders[0], encoders[1], False, 0.0, 0.0)
+        else:
+            self._update(encoders[0], encoders[1], True, tachometers[0], tachometers[1])
+        return self.state
+
+    def update_all(self, qt.t_int32[:, ::1] encoders, qt.t_double[:, ::1] tachometers=None):
+        """Advances the filters with all samples of the encoder counts of shape (n, 2) (oldest sample first) and
+        optionally of the tachometer counts/s of shape (n, 2).
+
+        Returns:
+            The preallocated state array of the latest sample
+        """
+        cdef Py_ssize_t i
+        cdef bint has_tachometers = tachometers is not None and tachometers.shape[1] >= 2
+        for i in range(encoders.shape[0]):
+            if has_tachometers:
+                self._update(encoders[i, 0], encoders[i, 1], True, tachometers[i, 0], tachometers[i, 1])
+            else:
+                self._update(encoders[i, 0], encoders[i, 1], False, 0.0, 0.0)
+        return self.state
+
+    cdef void _update(self, qt.t_int32 theta_count, qt.t_int32 alpha_count, bint has_tachometers,
+                      double theta_tachometer, double alpha_tachometer):
+        cdef double angles[2]
+        cdef double velocities[2]
+        cdef double alpha
+        cdef int i
+        angles[0] = theta_count * -COUNT_TO_RAD
+        # The velocity of alpha is estimated from the angle without normalization (no jumps at +-pi)
+        angles[1] = alpha_count * COUNT_TO_RAD
+        # The tachometers measure in counts/s with the same signs as the encoders
+        velocities[0] = theta_tachometer * -COUNT_TO_RAD
+        velocities[1] = alpha_tachometer * COUNT_TO_RAD
+        # Normalized and shifted alpha (`fmod` plus the correction of the sign like the modulo of Python)
+        alpha = fmod(angles[1], 2.0 * M_PI)
+        if alpha < 0.0:
+            alpha += 2.0 * M_PI
+        alpha -= M_PI
+
+        if not self.initialized:
+            for i in range(2):
+                self.position[i] = angles[i]
+                self.P00[i] = self.measurement_noise
+                self.P11[i] = 100.0  # The initial velocity is unknown (standard deviation of 10 rad/s)
+            self.initialized = True
+
+        for i in range(2):
+            if self.velocity_filter == HIGHPASS:
+                self.state_view[2 + i] = -2500.0 * self.highpass_state[i] + 50.0 * angles[i]
+                self.highpass_state[i] += (-50.0 * self.highpass_state[i] + angles[i]) / self.frequency
+            elif self.velocity_filter == SECOND_ORDER:
+                self._update_second_order(i, angles[i])
+                self.state_view[2 + i] = self.velocity[i]
+            else:
+                self._update_kalman(i, angles[i])
+                if has_tachometers and self.velocity_source == SOURCE_FUSED:
+                    self._update_kalman_velocity(i, velocities[i])
+                self.state_view[2 + i] = self.velocity[i]
+            if has_tachometers and self.velocity_source == SOURCE_TACHOMETER:
+                self.state_view[2 + i] = velocities[i]
+
+        self.state_view[0] = angles[0]
+        self.state_view[1] = alpha
+
+    cdef inline void _update_second_order(self, int i, double angle):
+        # Semi-implicit Euler integration of the filter (stable for cutoff * dt < 2)
+        self.velocity[i] += (
+            self.cutoff * self.cutoff * (angle - self.position[i]) - 2.0 * self.damping * self.cutoff * self.velocity[i]
+        ) * self.dt
+        self.position[i] += self.velocity[i] * self.dt
+
+    cdef inline void _update_kalman(self, int i, double angle):
+        cdef double dt = self.dt
+        cdef double q = self.process_noise
+        cdef double P00, P01, P11, S, K0, K1, innovation
+        # Prediction with the constant velocity model and a white noise acceleration
+        self.position[i] += self.velocity[i] * dt
+        P00 = self.P00[i] + 2.0 * dt * self.P01[i] + dt * dt * self.P11[i] + q * dt * dt * dt * dt / 4.0
+        P01 = self.P01[i] + dt * self.P11[i] + q * dt * dt * dt / 2.0
+        P11 = self.P11[i] + q * dt * dt
+        # Correction with the measured angle
+        S = P00 + self.measurement_noise
+        K0 = P00 / S
+        K1 = P01 / S
+        innovation = angle - self.position[i]
+        self.position[i] += K0 * innovation
+        self.velocity[i] += K1 * innovation
+        self.P00[i] = (1.0 - K0) * P00
+        self.P01[i] = (1.0 - K0) * P01
+        self.P11[i] = P11 - K1 * P01
+
+    cdef inline void _update_kalman_velocity(self, int i, double velocity):
+        # Correction with the velocity measured by the tachometer
+        cdef double P01 = self.P01[i]
+        cdef double P11 = self.P11[i]
+        cdef double S = P11 + self.tachometer_noise
+        cdef double K0 = P01 / S
+        cdef double K1 = P11 / S
+        cdef double innovation = velocity - self.velocity[i]
+        self.position[i] += K0 * innovation
+        self.velocity[i] += K1 * innovation
+        self.P00[i] -= K0 * P01
+        self.P01[i] -= K0 * P11
+        self.P11[i] -= K1 * P11
@@ -0,0 +1,4 @@
+# cython: language_level=3
+# The wrapper compiled against the stub headers in `mock`, whose HIL functions are implemented by the simulated board
+# of `gym_brt.quanser.mock_hil` (see `mock/mock_hil.c`)
+include "quanser_wrapper.pyx"
@@ -19,6 +19,12 @@ extensions = [
             "c",
         ],
         library_dirs=["/opt/quanser/hil_sdk/lib"],
-    )
+    ),
+    # The same wrapper with the simulated board of `gym_brt.quanser.mock_hil` instead of the HIL SDK
+    Extension(
+        "quanser_wrapper_mock",
+        ["quanser_wrapper_mock.pyx", "mock/mock_hil.c"],
+        include_dirs=["mock", numpy.get_include()],
+    ),
 ]
 setup(ext_modules=cythonize(extensions), include_dirs=[numpy.get_include()])
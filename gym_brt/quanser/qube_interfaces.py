@@ -2,70 +2,312 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
-import gym
+import os
+import threading
 import time
 import math
 import numpy as np
 
-from gym import spaces
-from gym.utils import seeding
-
 from gym_brt.control import QubeFlipUpControl, dampen_policy
+from gym_brt.quanser.timing import LatencyHistogram
 
 # For other platforms where it's impossible to install the HIL SDK
 try:
-    from gym_brt.quanser.quanser_wrapper.quanser_wrapper import QubeServo2
+    from gym_brt.quanser.quanser_wrapper.quanser_wrapper import QubeServo2, QubeStateEstimator
 except ImportError:
-    print("Warning: Can not import QubeServo2 in qube_interface.py")
-
-from gym_brt.quanser.qube_simulator import forward_model_euler, forward_model_ode
+    # Only raised once the hardware is used, the simulation does not need the HIL SDK
+    QubeServo2 = None
+
+from gym_brt.quanser.qube_simulator import (
+    forward_model_euler,
+    forward_model_ode,
+    forward_model_euler_batch,
+    forward_model_euler_jit,
+    forward_model_euler_batch_jit,
+    forward_model_rk4,
+    forward_model_rk4_batch,
+    rollout,
+    DEFAULT_PARAMS,
+)
 
 
 class QubeHardware(object):
-    """Simplify the interface between the environment and """
-
-    def __init__(self, frequency=250, max_voltage=18.0):
-        self._theta_dot_cstate = 0
-        self._alpha_dot_cstate = 0
+    """Simplify the interface between the environment and the Quanser wrapper of the Qube.
+
+    The encoder counts are converted into the state and the velocities are estimated by a `QubeStateEstimator` of
+    the compiled wrapper (`velocity_filter` is `highpass`, `second_order`, `kalman` or an estimator instance). The
+    state is written into a preallocated array, which is returned by `step` and overwritten by the next step. With
+    `velocity_source="tachometer"` the velocities are the ones measured by the tachometers of the Qube instead (no
+    phase lag of the filter), `velocity_source="fused"` fuses both with the `kalman` filter.
+
+    With `drain_samples=True` every step reads all samples the HIL task took since the previous step (up to
+    `buffer_size`, by default 0.1 s worth of samples) instead of only the latest one. The velocity filter is then
+    advanced with every sample, so that a step which is late does not change the velocity estimate, and the encoder
+    counts of all samples of the last step are available as `samples`.
+
+    With `control_thread=True` the Qube is read and actuated by a background thread in every sample period of the HIL
+    task, independent of the caller. `step` only hands the voltage over to the thread and returns the newest state (it
+    waits for the next sample, so that the caller is paced at `frequency`). If no new action arrived in time for a
+    sample, the thread applies the `late_action` policy: `hold` the previous voltage or apply `zero` volts. The period
+    jitter of the thread and the number of late actions are returned by `get_control_stats()`.
+
+    With `trusted_actions=True` the actions and LED colors are passed to the wrapper without the validation in Python
+    (`action_trusted`); they must be float64 arrays of shape (1,) and (3,). The LED is only written if its color
+    changed.
+
+    With `backend="mock"` the compiled wrapper is linked against the simulated board of `gym_brt.quanser.mock_hil`
+    instead of the HIL SDK (extension `quanser_wrapper_mock`), which takes the samples from the ODE model of the Qube on
+    the clock of the HIL task (`board_options` are passed to its `MockBoard`). The complete hardware code path can then
+    be run and profiled without a Qube.
+    """
+
+    def __init__(self, frequency=250, max_voltage=18.0, drain_samples=False, buffer_size=None,
+                 velocity_filter="highpass", control_thread=False, late_action="hold", realtime_priority=None,
+                 timed_write=False, trusted_actions=False, velocity_source="filter", backend="hil",
+                 board_options=None):
+        """
+        Args:
+            frequency: Sample frequency of the HIL task
+            max_voltage: Maximum motor voltage
+            drain_samples: Read all samples the task took since the last step instead of only the latest one
+            buffer_size: Number of samples the task buffers (by default 0.1 s with `drain_samples` and 1 otherwise)
+            velocity_filter: `highpass`, `second_order`, `kalman` or an instance of `QubeStateEstimator`
+            control_thread: Read and actuate the Qube in a background thread at `frequency`
+            late_action: `hold` or `zero`, the voltage the control thread applies if no new action arrived in time
+            realtime_priority: Priority (1-99) of the control thread with the `SCHED_FIFO` scheduler of Linux (requires
+                                the permission to change the scheduler, otherwise the thread runs with the default one)
+            timed_write: Write the voltages with the HIL task, i.e. on the clock edge of the next sample and in the same
+                            transaction as the read, instead of immediately
+            trusted_actions: Skip the validation of the actions and LED colors (see `QuanserWrapper.action_trusted`)
+            velocity_source: `filter`, `tachometer` or `fused` (see `QubeStateEstimator`), only used if
+                                `velocity_filter` is not an estimator instance
+            backend: `hil` (the Qube with the HIL SDK) or `mock` (a simulated board, see `gym_brt.quanser.mock_hil`)
+            board_options: Arguments of the `MockBoard` of the `mock` backend (e.g. `realtime=False`)
+        """
+        if backend not in ("hil", "mock"):
+            raise ValueError(f"Unsupported backend '{backend}'. Valid ones are 'hil' and 'mock'.")
+        if drain_samples and timed_write:
+            raise ValueError("'drain_samples' can not be combined with 'timed_write' (a single output sample is queued "
+                             "per read).")
+        if late_action not in ("hold", "zero"):
+            raise ValueError(f"Unsupported late action policy '{late_action}'. Valid ones are 'hold' and 'zero'.")
         self._frequency = frequency
+        self._drain_samples = drain_samples
+        self._num_samples = 0
+        self._encoder_samples = np.zeros((0, 2), dtype=np.int32)
+        self._thread = None
+        self._intervals = None
 
         # Open the Qube
-        self.qube = QubeServo2(frequency=frequency)  # TODO: max_voltage=max_voltage
+        if buffer_size is None:
+            buffer_size = max(int(0.1 * frequency), 1) if drain_samples else 1
+        if backend == "mock":
+            try:
+                from gym_brt.quanser.quanser_wrapper.quanser_wrapper_mock import (
+                    QubeServo2 as qube_class,
+                    QubeStateEstimator as estimator_class,
+                )
+            except ImportError:
+                raise ImportError("Can not import the mock backend. It is built with Cython and a C compiler by "
+                                  "`python setup.py build_ext --inplace`.")
+            from gym_brt.quanser import mock_hil
+
+            mock_hil.set_board_options(**(board_options or {}))
+        else:
+            if QubeServo2 is None:
+                raise ImportError("Can not import QubeServo2. The HIL SDK and the compiled quanser_wrapper are "
+                                  "required to use the hardware.")
+            qube_class, estimator_class = QubeServo2, QubeStateEstimator
+        self.qube = qube_class(
+            frequency=frequency, buffer_size=buffer_size, timed_write=timed_write
+        )  # TODO: max_voltage=max_voltage
         self.qube.__enter__()
+        self._action = self.qube.action_trusted if trusted_actions else self.qube.action
+        self._write = self.qube.write_trusted if trusted_actions else self.qube.write
 
-        self.state = np.array([0, 0, 0, 0], dtype=np.float64)
+        if isinstance(velocity_filter, str):
+            velocity_filter = estimator_class(
+                frequency=frequency, velocity_filter=velocity_filter, velocity_source=velocity_source
+            )
+        self._estimator = velocity_filter
+        self.state = self._estimator.state
         self.controller = QubeFlipUpControl(sample_freq=frequency)
 
+        if control_thread:
+            self._start_control_thread(late_action, realtime_priority)
+
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
         self.close()
 
+    @property
+    def samples_overflowed(self):
+        """Number of samples of the HIL task which were missed (overwritten before they were read)."""
+        return self.qube.samples_overflowed
+
+    @property
+    def samples(self):
+        """Encoder counts of shape (n, 2) of all samples read in the last step (only with `drain_samples=True`).
+
+        The array is a view of a buffer of the wrapper which is overwritten by the next step.
+        """
+        return self._encoder_samples
+
+    @property
+    def num_samples(self):
+        """Number of samples read in the last step."""
+        return self._num_samples
+
     def _match_state(s):
         theta, alpha, theta_dot, alpha_dot = s
         return np.array([])
 
     def step(self, action, led=None):
-        theta, alpha, theta_dot, alpha_dot = self.state
-        currents, encoders, others = self.qube.action(action, led_w=led)
-
-        # Calculate alpha, params, alpha_dot, and theta_dot
-        theta = encoders[0] * (-2.0 * np.pi / 2048)
-        # Alpha without normalizing
-        alpha_un = encoders[1] * (2.0 * np.pi / 2048)
-        # Normalized and shifted alpha
-        alpha = (alpha_un % (2.0 * np.pi)) - np.pi
-
-        # fmt: off
-        theta_dot = -2500 * self._theta_dot_cstate + 50 * theta
-        alpha_dot = -2500 * self._alpha_dot_cstate + 50 * alpha_un
-        self._theta_dot_cstate += (-50 * self._theta_dot_cstate + theta) / self._frequency
-        self._alpha_dot_cstate += (-50 * self._alpha_dot_cstate + alpha_un) / self._frequency
-        # fmt: on
-
-        state = np.array([theta, alpha, theta_dot, alpha_dot], dtype=np.float64)
-        return state
+        if self._thread is not None:
+            return self._step_threaded(action, led)
+        # Read the latest sample, then write the voltage calculated for the previous one (with `timed_write` in a single
+        # transaction of the task)
+        if self._drain_samples:
+            state = self._read()
+            self._write(action, led)
+            return state
+
+        currents, encoders, others = self._action(action, led)
+        self._num_samples = 1
+        # The other channels are the tachometers of both encoders
+        return self._estimator.update(encoders, others)
+
+    def _read(self):
+        """Reads the encoders (blocks until the next sample) and returns the estimated state."""
+        if self._drain_samples:
+            num_samples, currents, encoders, others = self.qube.read_all()
+            self._num_samples, self._encoder_samples = num_samples, encoders
+            # Angles of the latest sample, velocities filtered over all samples
+            return self._estimator.update_all(encoders, others)
+
+        currents, encoders, others = self.qube.read()
+        self._num_samples = 1
+        return self._estimator.update(encoders, others)
+
+    def _start_control_thread(self, late_action, realtime_priority):
+        self._late_action = late_action
+        self._realtime_priority = realtime_priority
+        self._zero_voltage = np.zeros(1, dtype=np.float64)
+        # The action handoff is a single reference to a tuple `(sequence number, voltage, led)`, which is replaced by
+        # `step` and read by the control thread (replacing a reference is atomic, no lock is needed)
+        self._command = (0, self._zero_voltage, None)
+        self._command_sequence = 0
+        # Double buffer of the state: the thread writes into the back buffer and then publishes its index
+        self._state_buffers = (np.zeros(4, dtype=np.float64), np.zeros(4, dtype=np.float64))
+        self._front = 0
+        self._state_sequence = 0
+        self._returned_sequence = 0
+        self._new_state = threading.Event()
+        self._pending_encoder_reset = None
+        self._running = True
+        self._loop_error = None
+
+        self._period_ns = int(1e9 / self._frequency)
+        self._intervals = LatencyHistogram()
+        self._jitter = LatencyHistogram()
+        self._late_actions = 0
+
+        self.state = np.zeros(4, dtype=np.float64)
+        self._thread = threading.Thread(target=self._control_loop, name="QubeControlThread", daemon=True)
+        self._thread.start()
+
+    def _control_loop(self):
+        if self._realtime_priority is not None:
+            try:
+                # Changes the scheduler of the calling thread only
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self._realtime_priority))
+            except (AttributeError, OSError) as e:
+                print(f"Warning: Could not run the control thread with real-time priority ({e}).")
+
+        applied_sequence = 0
+        voltage = self._zero_voltage
+        last_start = None
+        try:
+            while self._running:
+                if self._pending_encoder_reset is not None:
+                    channels, self._pending_encoder_reset = self._pending_encoder_reset, None
+                    self.qube.reset_encoders(channels=channels[0])
+
+                # Blocks until the next sample of the HIL task (the GIL is released while waiting)
+                state = self._read()
+                start = time.perf_counter_ns()
+
+                # The newest action of the caller, calculated from the previously published state
+                sequence, command, led = self._command
+                if sequence != applied_sequence:
+                    applied_sequence, voltage = sequence, command
+                else:
+                    # The action did not arrive in time for this sample
+                    if applied_sequence > 0:
+                        self._late_actions += 1
+                    led = None
+                    if self._late_action == "zero":
+                        voltage = self._zero_voltage
+                self._write(voltage, led)
+
+                if last_start is not None:
+                    interval = start - last_start
+                    self._intervals.record(interval)
+                    self._jitter.record(abs(interval - self._period_ns))
+                last_start = start
+
+                back = 1 - self._front
+                np.copyto(self._state_buffers[back], state)
+                self._front = back
+                self._state_sequence += 1
+                self._new_state.set()
+        except Exception as e:
+            self._loop_error = e
+            self._new_state.set()
+
+    def _step_threaded(self, action, led=None):
+        self._command_sequence += 1
+        self._command = (self._command_sequence, np.array(action, dtype=np.float64).reshape(1), led)
+        # Wait for a state which was not returned before
+        while self._state_sequence == self._returned_sequence:
+            if self._loop_error is not None:
+                raise RuntimeError("The control thread of the Qube stopped.") from self._loop_error
+            self._new_state.wait(timeout=0.5)
+            self._new_state.clear()
+        self._returned_sequence = self._state_sequence
+        np.copyto(self.state, self._state_buffers[self._front])
+        return self.state
+
+    def _reset_encoders(self, channels=None):
+        if self._thread is None:
+            self.qube.reset_encoders(channels=channels)
+        else:
+            # The HIL board is only accessed by the control thread
+            self._pending_encoder_reset = (channels,)
+
+    def get_control_stats(self):
+        """Statistics of the control thread or `None` if it is not used.
+
+        Returns:
+            A dict with the summaries (count, mean, p50, p99 and max in us) of the `interval` between two samples and
+            its `jitter` (absolute deviation from the period), the `period_us` and the number of `late_actions`
+        """
+        if self._intervals is None:
+            return None
+        return {
+            "interval": self._intervals.summary(),
+            "jitter": self._jitter.summary(),
+            "period_us": self._period_ns / 1000.0,
+            "late_actions": self._late_actions,
+        }
+
+    def _stop_control_thread(self):
+        if self._thread is not None:
+            self._running = False
+            self._thread.join()
+            self._thread = None
 
     def reset_up(self):
         """Run classic control for flip-up until the pendulum is inverted for
@@ -77,7 +319,7 @@ class QubeHardware(object):
         samples_upright = 0  # Consecutive samples pendulum is upright
 
         action = np.array([1], dtype=np.float64)
-        state = self.step([1.0])
+        state = self.step(np.array([1.0], dtype=np.float64))
         while True:
             action = self.controller.action(state)
             state = self.step(action)
@@ -100,7 +342,7 @@ class QubeHardware(object):
         samples_downwards = 0  # Consecutive samples pendulum is stationary
         no_move = 0
         alpha = -100
-        state = self.step([1.0])
+        state = self.step(np.array([1.0], dtype=np.float64))
         while True:
             action = dampen_policy(state)
             state = self.step(action)
@@ -118,11 +360,21 @@ class QubeHardware(object):
                     no_move += 1
                 if no_move > 5*self._frequency:
                     print('reset encoders')
-                    self.qube.reset_encoders()
-                    state = self.step([0.0])
+                    self._reset_encoders()
+                    state = self.step(np.array([0.0], dtype=np.float64))
                     break
         return state
 
+    def get_state(self):
+        """Not supported: unlike the simulators, the physical Qube can not be moved back into a saved state."""
+        raise NotImplementedError("The state of the hardware can not be saved and restored, snapshots of the state "
+                                  "require a simulator (e.g. `QubeSwingupEnv(use_simulator=True)`).")
+
+    def set_state(self, state):
+        """Not supported: unlike the simulators, the physical Qube can not be moved into an arbitrary state."""
+        raise NotImplementedError("The hardware can not be set to an arbitrary state, this requires a simulator "
+                                  "(e.g. `QubeSwingupEnv(use_simulator=True)`).")
+
     def reset_encoders(self):
         """Fully stop the pendulum at the bottom. Then reset the alpha encoder"""
         self.reset_down()
@@ -137,42 +389,105 @@ class QubeHardware(object):
         # bottom (this way alpha is very close to perfect and params does not
         # drift much)
         # print("Pre encoder reset:", self.qube.action(np.array([0], dtype=np.float64)))
-        self.qube.reset_encoders(channels=[1])  # Alpha channel only
+        self._reset_encoders(channels=[1])  # Alpha channel only
         # print("After encoder reset:", self.qube.action(np.array([0], dtype=np.float64)))
 
     def close(self, type=None, value=None, traceback=None):
+        self._stop_control_thread()
         # Safely close the Qube
         self.qube.__exit__(type=type, value=value, traceback=traceback)
 
 
 class QubeSimulator(object):
-    """Simulator that has the same interface as the hardware wrapper."""
+    """Simulator that has the same interface as the hardware wrapper.
+
+    With a batched forward model (`forward_model="euler_batch"`) and `num_qubes=N` the simulator advances N
+    independent Qubes at once: `state` has the shape (N, 4) and `step` expects N voltages.
+
+    `forward_model="euler_jit"` uses the Numba-compiled Euler kernels and `forward_model="rk4"` the compiled
+    fixed-step Runge-Kutta integration of the ODE (scalar for a single Qube, batched if `num_qubes` is given).
+
+    The physical parameters of the built-in forward models are given by `params` (an instance of `QubeParams`) and
+    can be exchanged at any time by setting `simulator.params`. Batched simulators also accept per-Qube parameters
+    (`QubeParams(..., num_qubes=N)`), which can be changed in place between episodes (see `QubeParams.sample`).
+    """
 
     def __init__(
-        self, forward_model="ode", frequency=250, integration_steps=1, max_voltage=18.0
+        self, forward_model="ode", frequency=250, integration_steps=1, max_voltage=18.0, num_qubes=None,
+        params=None
     ):
+        self._builtin = isinstance(forward_model, str)
+        self._batched = False
+        self._scalar_action = False
+        self._rollout_method = None  # Compiled integration method used by `rollout` (if available)
         if isinstance(forward_model, str):
             if forward_model == "ode":
                 self._forward_model = forward_model_ode
             elif forward_model == "euler":
                 self._forward_model = forward_model_euler
+                self._rollout_method = "euler"
+            elif forward_model == "euler_batch":
+                self._forward_model = forward_model_euler_batch
+                self._batched = True
+                self._rollout_method = "euler"
+            elif forward_model == "euler_jit":
+                self._rollout_method = "euler"
+                if num_qubes is None:
+                    self._forward_model = forward_model_euler_jit
+                    self._scalar_action = True
+                else:
+                    self._forward_model = forward_model_euler_batch_jit
+                    self._batched = True
+            elif forward_model == "rk4":
+                self._rollout_method = "rk4"
+                if num_qubes is None:
+                    self._forward_model = forward_model_rk4
+                    self._scalar_action = True
+                else:
+                    self._forward_model = forward_model_rk4_batch
+                    self._batched = True
             else:
                 raise ValueError(
-                    "'forward_model' must be one of ['ode', 'euler'] or a callable."
+                    "'forward_model' must be one of ['ode', 'euler', 'euler_batch', 'euler_jit', 'rk4'] or a callable."
                 )
         elif callable(forward_model):
             self._forward_model = forward_model
         else:
             raise ValueError(
-                "'forward_model' must be one of ['ode', 'euler'] or a callable."
+                "'forward_model' must be one of ['ode', 'euler', 'euler_batch', 'euler_jit', 'rk4'] or a callable."
             )
+        if num_qubes is not None and not self._batched:
+            raise ValueError("'num_qubes' can only be used with a batched forward model.")
 
+        self._num_qubes = num_qubes
         self._dt = 1.0 / frequency
         self._integration_steps = integration_steps
         self._max_voltage = max_voltage
-        self.state = (
-            np.array([0, 0, 0, 0], dtype=np.float64) + np.random.randn(4) * 0.01
-        )
+        self.params = params if params is not None else DEFAULT_PARAMS
+        self.state = self._initial_state(alpha=0.0)
+
+    @property
+    def num_qubes(self):
+        return self._num_qubes
+
+    @property
+    def params(self):
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        if params.num_qubes is not None and (not self._batched or params.num_qubes != self._num_qubes):
+            raise ValueError(f"Per-Qube parameters for {params.num_qubes} Qubes require a batched forward model with "
+                             f"'num_qubes={params.num_qubes}'.")
+        self._params = params
+        # Additional arguments of the forward model: compiled scalar kernels take the coefficients directly, the other
+        # built-in forward models the parameter object and custom forward models nothing
+        if not self._builtin:
+            self._model_args = ()
+        elif self._scalar_action:
+            self._model_args = (params.coefficients,)
+        else:
+            self._model_args = (params,)
 
     def __enter__(self):
         return self
@@ -180,23 +495,90 @@ class QubeSimulator(object):
     def __exit__(self, type, value, traceback):
         self.close()
 
+    def _initial_state(self, alpha):
+        if self._num_qubes is None:
+            return np.array([0, alpha, 0, 0], dtype=np.float64) + np.random.randn(4) * 0.01
+        return np.array([0, alpha, 0, 0], dtype=np.float64) + np.random.randn(self._num_qubes, 4) * 0.01
+
     def step(self, action, led=None):
+        if self._scalar_action:
+            # Compiled kernels only accept scalars (clipping a Python float is much cheaper than `np.clip`)
+            Vm = min(max(np.asarray(action).item(), -self._max_voltage), self._max_voltage)
+            self.state = self._forward_model(
+                *self.state, Vm, self._dt, self._integration_steps, *self._model_args
+            )
+            return self.state
+
         action = np.clip(action, -self._max_voltage, self._max_voltage)
-        self.state = self._forward_model(
-            *self.state, action, self._dt, self._integration_steps
-        )
+        if self._batched:
+            state = self._forward_model(self.state, action, self._dt, self._integration_steps, *self._model_args)
+            self.state = state if self._num_qubes is not None else state[0]
+        else:
+            self.state = self._forward_model(
+                *self.state, action, self._dt, self._integration_steps, *self._model_args
+            )
+        return self.state
+
+    def rollout(self, init_state, actions):
+        """Simulate an open-loop sequence of voltages without changing the state of the simulator.
+
+        The Euler and RK4 forward models run the whole sequence in a single compiled call (see `rollout` in
+        `qube_simulator.py`); other forward models are stepped in a loop.
+
+        Args:
+            init_state: Initial state of shape (4,) or a batch of initial states of shape (N, 4)
+            actions: Voltages of shape (T,) for a single initial state or of shape (N, T) for a batch
+
+        Returns:
+            Array of shape (T + 1, 4) or (N, T + 1, 4) for a batch, the initial state is at index 0
+        """
+        init_state = np.asarray(init_state, dtype=np.float64)
+        init_states = init_state.reshape((-1, 4))
+        actions = np.asarray(actions, dtype=np.float64).reshape((init_states.shape[0], -1))
+
+        if self._rollout_method is not None:
+            states = rollout(init_states, actions, self._dt, self._integration_steps,
+                             method=self._rollout_method, max_voltage=self._max_voltage, params=self._params)
+        else:
+            actions = np.clip(actions, -self._max_voltage, self._max_voltage)
+            states = np.empty((init_states.shape[0], actions.shape[1] + 1, 4), dtype=np.float64)
+            states[:, 0] = init_states
+            for t in range(actions.shape[1]):
+                if self._batched:
+                    states[:, t + 1] = self._forward_model(
+                        states[:, t], actions[:, t], self._dt, self._integration_steps, *self._model_args
+                    )
+                else:
+                    for i in range(init_states.shape[0]):
+                        states[i, t + 1] = self._forward_model(
+                            *states[i, t], actions[i, t], self._dt, self._integration_steps, *self._model_args
+                        )
+
+        return states if init_state.ndim == 2 else states[0]
+
+    def get_state(self):
+        """Copy of the state `[theta, alpha, theta_dot, alpha_dot]` (of shape (N, 4) with `num_qubes=N`)."""
+        return np.array(self.state, dtype=np.float64)
+
+    def set_state(self, state):
+        """Sets the simulator to a state returned by `get_state` (or any other state of the same shape).
+
+        Returns:
+            The new state
+        """
+        state = np.array(state, dtype=np.float64)
+        shape = (4,) if self._num_qubes is None else (self._num_qubes, 4)
+        if state.shape != shape:
+            raise ValueError(f"'state' must have the shape {shape} but has the shape {state.shape}.")
+        self.state = state
         return self.state
 
     def reset_up(self):
-        self.state = (
-            np.array([0, 0, 0, 0], dtype=np.float64) + np.random.randn(4) * 0.01
-        )
+        self.state = self._initial_state(alpha=0.0)
         return self.state
 
     def reset_down(self):
-        self.state = (
-            np.array([0, np.pi, 0, 0], dtype=np.float64) + np.random.randn(4) * 0.01
-        )
+        self.state = self._initial_state(alpha=np.pi)
         return self.state
 
     def reset_encoders(self):
@@ -2,54 +2,227 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
-from scipy.integrate import odeint
 from numba import jit
 import numpy as np
 import math
 
-# Motor
-Rm = 8.4  # Resistance
-kt = 0.046 #0.042  # Current-torque (N-m/A)
-km = 0.042 # 0.042  # Back-emf constant (V-s/rad)
 
-# Rotary Arm
-mr = 0.10  # 0.095  # Mass (kg)
-Lr = 0.0855  # Total length (m)
-Jr = mr * Lr ** 2 / 12  # Moment of inertia about pivot (kg-m^2)
-Dr = 0.000275  # Equivalent viscous damping coefficient (N-m-s/rad)
+# Indices of the constant coefficients in `QubeParams.coefficients`
+KT_RM = 0  # kt / Rm
+KM_RM = 1  # km / Rm
+KM = 2  # km
+DR_4 = 3  # 4.0*Dr
+DP_8 = 4  # 8.0*Dp
+LP_LR_MP = 5  # Lp*Lr*mp
+LP2_MP = 6  # Lp**2*mp
+JP_4 = 7  # 4.0*Jp + Lp**2*mp
+JR_4 = 8  # 4.0*Jr + 4.0*Lr**2*mp
+LP_G_MP_4 = 9  # 4.0*Lp*g*mp
+LP2_LR2_MP2_4 = 10  # 4.0*Lp**2*Lr**2*mp**2
+NUM_COEFFICIENTS = 11
 
-# Pendulum Link
-mp = 0.04  # 0.024  # Mass (kg)
-Lp = 0.1288  # Total length (m)
-Jp = mp * Lp ** 2 / 12  # Moment of inertia about pivot (kg-m^2)
-Dp = 0.0000505  # Equivalent viscous damping coefficient (N-m-s/rad)
 
-g = 9.81  # Gravity constant
+def _compute_coefficients(Rm, kt, km, Lr, Dr, mp, Lp, Dp, g, Jr, Jp):
+    """Constant coefficients of the workbook dynamics; shape (NUM_COEFFICIENTS,) or (N, NUM_COEFFICIENTS) for arrays."""
+    coefficients = [None] * NUM_COEFFICIENTS
+    coefficients[KT_RM] = kt / Rm
+    coefficients[KM_RM] = km / Rm
+    coefficients[KM] = km
+    coefficients[DR_4] = 4.0 * Dr
+    coefficients[DP_8] = 8.0 * Dp
+    coefficients[LP_LR_MP] = Lp * Lr * mp
+    coefficients[LP2_MP] = Lp ** 2 * mp
+    coefficients[JP_4] = 4.0 * Jp + Lp ** 2 * mp
+    coefficients[JR_4] = 4.0 * Jr + 4.0 * Lr ** 2 * mp
+    coefficients[LP_G_MP_4] = 4.0 * Lp * g * mp
+    coefficients[LP2_LR2_MP2_4] = 4.0 * Lp ** 2 * Lr ** 2 * mp ** 2
+    return np.stack(np.broadcast_arrays(*coefficients), axis=-1).astype(np.float64)
 
 
-def diff_forward_model_ode(state, t, action, dt):
+class QubeParams(object):
+    """Physical parameters of the Qube used by the ODE simulation.
+
+    Besides the parameters themselves, the constant products appearing in the workbook dynamics are computed once in
+    `coefficients`. This array is what the forward models (and especially the compiled kernels) actually use, so
+    different parameter sets can be passed to the same kernel without touching any global state.
+
+    For the batched forward models each simulated Qube can have its own parameters: if any parameter is an array of
+    shape (N,) (or `num_qubes=N` is given) all parameters are stored as arrays of shape (N,) and `coefficients` has the
+    shape (N, NUM_COEFFICIENTS). Such parameters can be changed in place with `update` and `sample`, e.g. to randomize
+    the parameters of some of the Qubes whenever they are reset.
+    """
+
+    PARAMETER_NAMES = ("Rm", "kt", "km", "mr", "Lr", "Dr", "mp", "Lp", "Dp", "g", "Jr", "Jp")
+
+    def __init__(self, Rm=8.4, kt=0.046, km=0.042, mr=0.10, Lr=0.0855, Dr=0.000275, mp=0.04, Lp=0.1288,
+                 Dp=0.0000505, g=9.81, Jr=None, Jp=None, num_qubes=None):
+        """Creates a parameter set, the defaults are the tuned parameters of our Qube.
+
+        Args:
+            Rm: Motor resistance
+            kt: Current-torque (N-m/A)
+            km: Back-emf constant (V-s/rad)
+            mr: Mass of the rotary arm (kg)
+            Lr: Total length of the rotary arm (m)
+            Dr: Equivalent viscous damping coefficient of the rotary arm (N-m-s/rad)
+            mp: Mass of the pendulum link (kg)
+            Lp: Total length of the pendulum link (m)
+            Dp: Equivalent viscous damping coefficient of the pendulum link (N-m-s/rad)
+            g: Gravity constant
+            Jr: Moment of inertia of the rotary arm about pivot (kg-m^2); defaults to `mr * Lr ** 2 / 12`
+            Jp: Moment of inertia of the pendulum link about pivot (kg-m^2); defaults to `mp * Lp ** 2 / 12`
+            num_qubes: Number of Qubes with individual parameters; inferred from array-valued parameters if not given
+        """
+        # Derive the moments of inertia from the masses and lengths (also after an update) if they are not given
+        self._derive_Jr, self._derive_Jp = Jr is None, Jp is None
+        Jr = mr * Lr ** 2 / 12 if Jr is None else Jr
+        Jp = mp * Lp ** 2 / 12 if Jp is None else Jp
+        values = dict(Rm=Rm, kt=kt, km=km, mr=mr, Lr=Lr, Dr=Dr, mp=mp, Lp=Lp, Dp=Dp, g=g, Jr=Jr, Jp=Jp)
+
+        if num_qubes is None and any(np.ndim(value) > 0 for value in values.values()):
+            num_qubes = np.broadcast(*values.values()).size
+        self._num_qubes = num_qubes
+        for name, value in values.items():
+            if num_qubes is None:
+                setattr(self, name, float(value))
+            else:
+                setattr(self, name, np.array(np.broadcast_to(value, (num_qubes,)), dtype=np.float64))
+        self.coefficients = self._compute_coefficients()
+
+    @property
+    def num_qubes(self):
+        """Number of Qubes with individual parameters or `None` if the parameters are shared."""
+        return self._num_qubes
+
+    def _compute_coefficients(self, mask=slice(None)):
+        if self._num_qubes is None:
+            return _compute_coefficients(self.Rm, self.kt, self.km, self.Lr, self.Dr, self.mp, self.Lp, self.Dp,
+                                         self.g, self.Jr, self.Jp)
+        return _compute_coefficients(self.Rm[mask], self.kt[mask], self.km[mask], self.Lr[mask], self.Dr[mask],
+                                     self.mp[mask], self.Lp[mask], self.Dp[mask], self.g[mask], self.Jr[mask],
+                                     self.Jp[mask])
+
+    def _set(self, name, value, mask):
+        if self._num_qubes is None:
+            setattr(self, name, float(value))
+        else:
+            getattr(self, name)[mask] = value
+
+    def update(self, mask=None, **values):
+        """Change parameters in place and recompute the affected coefficients.
+
+        Args:
+            mask: Boolean mask or indices of the Qubes to update (only for per-Qube parameters); all if `None`
+            **values: New parameter values, e.g. `Rm=8.9` or `Rm=np.array([...])` with one value per selected Qube
+        """
+        mask = slice(None) if mask is None else mask
+        for name, value in values.items():
+            if name not in self.PARAMETER_NAMES:
+                raise ValueError(f"Unknown parameter '{name}'. Valid ones are {list(self.PARAMETER_NAMES)}.")
+            if name in ("Jr", "Jp"):
+                setattr(self, "_derive_" + name, False)
+            self._set(name, value, mask)
+        if self._derive_Jr:
+            Jr = self.mr * self.Lr ** 2 / 12
+            self._set("Jr", Jr if self._num_qubes is None else Jr[mask], mask)
+        if self._derive_Jp:
+            Jp = self.mp * self.Lp ** 2 / 12
+            self._set("Jp", Jp if self._num_qubes is None else Jp[mask], mask)
+        if self._num_qubes is None:
+            self.coefficients[:] = self._compute_coefficients()
+        else:
+            self.coefficients[mask] = self._compute_coefficients(mask)
+
+    def sample(self, distributions, np_random, mask=None):
+        """Draw new per-Qube parameters in place.
+
+        Args:
+            distributions: Dict mapping parameter names to either a tuple `(low, high)` of a uniform distribution or a
+                           callable `f(np_random, size)` returning `size` samples
+            np_random: Random number generator (e.g. from `gym.utils.seeding.np_random`)
+            mask: Boolean mask of the Qubes to resample; all if `None`
+        """
+        if self._num_qubes is None:
+            raise ValueError("Sampling requires per-Qube parameters (use 'num_qubes').")
+        size = self._num_qubes if mask is None else int(np.count_nonzero(mask))
+        values = {}
+        for name, distribution in distributions.items():
+            if callable(distribution):
+                values[name] = distribution(np_random, size)
+            else:
+                low, high = distribution
+                values[name] = np_random.uniform(low, high, size)
+        self.update(mask, **values)
+
+    def as_dict(self):
+        return dict(Rm=self.Rm, kt=self.kt, km=self.km, mr=self.mr, Lr=self.Lr, Dr=self.Dr, mp=self.mp, Lp=self.Lp,
+                    Dp=self.Dp, g=self.g, Jr=None if self._derive_Jr else self.Jr,
+                    Jp=None if self._derive_Jp else self.Jp)
+
+    def replace(self, **kwargs):
+        """Returns a new parameter set with the given parameters replaced (e.g. `params.replace(Rm=8.9)`)."""
+        params = self.as_dict()
+        params.update(kwargs)
+        return QubeParams(**params)
+
+    def __repr__(self):
+        params = ", ".join(f"{name}={value}" for name, value in self.as_dict().items() if value is not None)
+        return f"QubeParams({params})"
+
+
+def _coefficients(params):
+    """Coefficient array of `params` which is either a `QubeParams` instance or already a coefficient array."""
+    if isinstance(params, QubeParams):
+        return params.coefficients
+    return np.asarray(params, dtype=np.float64)
+
+
+DEFAULT_PARAMS = QubeParams()
+
+
+def _accelerations(alpha, theta_dot, alpha_dot, tau, c):
+    """Workbook accelerations for scalars or arrays of equal shape.
+
+    `c` are the coefficients of `QubeParams`, for arrays with one coefficient set per entry `c` has the shape
+    (NUM_COEFFICIENTS, N).
+    """
+    sin_alpha = np.sin(alpha)
+    cos_alpha = np.cos(alpha)
+    sin_2alpha = np.sin(2.0 * alpha)
+
+    # From Rotary Pendulum Workbook, the constant products are taken from the coefficients
+    pendulum = -c[DP_8]*alpha_dot + c[LP2_MP]*theta_dot**2*sin_2alpha + c[LP_G_MP_4]*sin_alpha
+    arm = c[DR_4]*theta_dot + c[LP2_MP]*alpha_dot*theta_dot*sin_2alpha + 2.0*c[LP_LR_MP]*alpha_dot**2*sin_alpha - 4.0*tau
+    inertia = c[JR_4] + c[LP2_MP]*sin_alpha**2
+    denominator = c[LP2_LR2_MP2_4]*cos_alpha**2 - c[JP_4]*inertia
+
+    theta_dot_dot = (-c[LP_LR_MP]*pendulum*cos_alpha + c[JP_4]*arm)/denominator
+    alpha_dot_dot = (2.0*c[LP_LR_MP]*arm*cos_alpha - 0.5*inertia*pendulum)/denominator
+
+    return theta_dot_dot, alpha_dot_dot
+
+
+def diff_forward_model_ode(state, t, action, dt, params=DEFAULT_PARAMS):
     theta, alpha, theta_dot, alpha_dot = state
+    c = params.coefficients
     Vm = action
-    tau = -(kt * (Vm - km * theta_dot)) / Rm  # torque
+    tau = -(c[KT_RM] * (Vm - c[KM] * theta_dot))  # torque
 
-    # fmt: off
-    # From Rotary Pendulum Workbook
-    theta_dot_dot = (-Lp*Lr*mp*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha))*np.cos(alpha) + (4.0*Jp + Lp**2*mp)*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*tau))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp))
-    alpha_dot_dot = (2.0*Lp*Lr*mp*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*tau)*np.cos(alpha) - 0.5*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp)*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha)))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp))
-    # fmt: on
+    theta_dot_dot, alpha_dot_dot = _accelerations(alpha, theta_dot, alpha_dot, tau, c)
 
-    diff_state = np.array([theta_dot, alpha_dot, theta_dot_dot, alpha_dot_dot]).reshape(
-        (4,)
-    )
-    diff_state = np.array(diff_state, dtype="float64")
+    diff_state = np.array([theta_dot, alpha_dot, theta_dot_dot, alpha_dot_dot], dtype="float64")
     return diff_state
 
 
-def forward_model_ode(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps):
+def forward_model_ode(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, params=DEFAULT_PARAMS):
+    # Imported on first use, scipy.integrate takes longer to import than all other dependencies of this module
+    from scipy.integrate import odeint
+
     t = np.linspace(0.0, dt, 2)  # TODO: add and check integration steps here
 
+    Vm = np.asarray(Vm, dtype=np.float64).item()
     state = np.array([theta, alpha, theta_dot, alpha_dot])
-    next_state = np.array(odeint(diff_forward_model_ode, state, t, args=(Vm, dt)))[1, :]
+    next_state = np.array(odeint(diff_forward_model_ode, state, t, args=(Vm, dt, params)))[1, :]
     theta, alpha, theta_dot, alpha_dot = next_state
 
     theta = ((theta + np.pi) % (2 * np.pi)) - np.pi
@@ -58,16 +231,14 @@ def forward_model_ode(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_st
     return theta, alpha, theta_dot, alpha_dot
 
 
-def forward_model_euler(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps):
+def forward_model_euler(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, params=DEFAULT_PARAMS):
+    c = params.coefficients
+    Vm = np.asarray(Vm, dtype=np.float64).item()
     dt /= integration_steps
     for step in range(integration_steps):
-        tau = -(km * (Vm - km * theta_dot)) / Rm  # torque
+        tau = -(c[KM_RM] * (Vm - c[KM] * theta_dot))  # torque
 
-        # fmt: off
-        # From Rotary Pendulum Workbook
-        theta_dot_dot = float((-Lp*Lr*mp*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha))*np.cos(alpha) + (4.0*Jp + Lp**2*mp)*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*tau))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp)))
-        alpha_dot_dot = float((2.0*Lp*Lr*mp*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*tau)*np.cos(alpha) - 0.5*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp)*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha)))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp)))
-        # fmt: on
+        theta_dot_dot, alpha_dot_dot = _accelerations(alpha, theta_dot, alpha_dot, tau, c)
 
         if True:  # semi-implicit euler (more accurate)
             theta_dot += theta_dot_dot * dt
@@ -84,3 +255,372 @@ def forward_model_euler(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_
         alpha = ((alpha + np.pi) % (2 * np.pi)) - np.pi
 
     return theta, alpha, theta_dot, alpha_dot
+
+
+def forward_model_euler_batch(state, Vm, dt, integration_steps, params=DEFAULT_PARAMS):
+    """Batched version of `forward_model_euler` which advances N Qubes at once.
+
+    Args:
+        state: Array of shape (N, 4) with the rows [theta, alpha, theta_dot, alpha_dot]
+        Vm: Array of shape (N,) (or (N, 1)) with the motor voltages
+        dt: Time of a single simulation step
+        integration_steps: Number of semi-implicit Euler steps during `dt`
+        params: Parameters of the Qube (`QubeParams`, also per-Qube parameters) or their coefficient array
+
+    Returns:
+        New array of shape (N, 4) with the next states
+    """
+    state = np.array(state, dtype=np.float64).reshape((-1, 4))
+    Vm = np.asarray(Vm, dtype=np.float64).reshape((-1,))
+    c = _coefficients(params).T  # Shape (NUM_COEFFICIENTS,) or (NUM_COEFFICIENTS, N)
+    # Column views, all updates below are written back into `state`
+    theta, alpha, theta_dot, alpha_dot = state[:, 0], state[:, 1], state[:, 2], state[:, 3]
+
+    dt /= integration_steps
+    for step in range(integration_steps):
+        tau = -(c[KM_RM] * (Vm - c[KM] * theta_dot))  # torque
+        theta_dot_dot, alpha_dot_dot = _accelerations(alpha, theta_dot, alpha_dot, tau, c)
+
+        # semi-implicit euler
+        theta_dot += theta_dot_dot * dt
+        alpha_dot += alpha_dot_dot * dt
+        theta += theta_dot * dt
+        alpha += alpha_dot * dt
+
+        theta[:] = ((theta + np.pi) % (2 * np.pi)) - np.pi
+        alpha[:] = ((alpha + np.pi) % (2 * np.pi)) - np.pi
+
+    return state
+
+
+# Compiled versions of the forward models. The kernels are cached on disk (`cache=True`) so that new processes (e.g.
+# workers of a vectorized environment) load the machine code instead of compiling it again. All kernels take the
+# coefficients of a `QubeParams` instance (`params.coefficients`) as argument; the batched kernels take them with the
+# shape (1, NUM_COEFFICIENTS) for shared parameters or (N, NUM_COEFFICIENTS) for per-Qube parameters.
+_accelerations_jit = jit(nopython=True, cache=True)(_accelerations)
+
+
+@jit(nopython=True, cache=True)
+def forward_model_euler_jit(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, c):
+    """Compiled version of `forward_model_euler`; all arguments except the coefficients `c` have to be scalars."""
+    dt /= integration_steps
+    for step in range(integration_steps):
+        tau = -(c[KM_RM] * (Vm - c[KM] * theta_dot))  # torque
+        theta_dot_dot, alpha_dot_dot = _accelerations_jit(alpha, theta_dot, alpha_dot, tau, c)
+
+        # semi-implicit euler
+        theta_dot += theta_dot_dot * dt
+        alpha_dot += alpha_dot_dot * dt
+        theta += theta_dot * dt
+        alpha += alpha_dot * dt
+
+        theta = ((theta + np.pi) % (2 * np.pi)) - np.pi
+        alpha = ((alpha + np.pi) % (2 * np.pi)) - np.pi
+
+    return theta, alpha, theta_dot, alpha_dot
+
+
+@jit(nopython=True, cache=True)
+def _forward_model_euler_batch_jit(state, Vm, dt, integration_steps, c, out):
+    for i in range(state.shape[0]):
+        c_i = c[i] if c.shape[0] > 1 else c[0]
+        out[i, 0], out[i, 1], out[i, 2], out[i, 3] = forward_model_euler_jit(
+            state[i, 0], state[i, 1], state[i, 2], state[i, 3], Vm[i], dt, integration_steps, c_i
+        )
+    return out
+
+
+def forward_model_euler_batch_jit(state, Vm, dt, integration_steps, params=DEFAULT_PARAMS):
+    """Compiled version of `forward_model_euler_batch` with the same arguments and return value."""
+    state = np.asarray(state, dtype=np.float64).reshape((-1, 4))
+    Vm = np.asarray(Vm, dtype=np.float64).reshape((-1,))
+    return _forward_model_euler_batch_jit(state, Vm, dt, integration_steps, np.atleast_2d(_coefficients(params)),
+                                          np.empty_like(state))
+
+
+@jit(nopython=True, cache=True)
+def _ode_accelerations_jit(alpha, theta_dot, alpha_dot, Vm, c):
+    tau = -(c[KT_RM] * (Vm - c[KM] * theta_dot))  # torque (same as in `diff_forward_model_ode`)
+    return _accelerations_jit(alpha, theta_dot, alpha_dot, tau, c)
+
+
+@jit(nopython=True, cache=True)
+def forward_model_rk4(theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, c):
+    """Classic fixed-step Runge-Kutta (RK4) integration of `diff_forward_model_ode`.
+
+    Replacement for `forward_model_ode` without the overhead of calling `odeint` every step. In contrast to
+    `forward_model_ode` the number of `integration_steps` is honored. With a step size of 1 ms or smaller (e.g.
+    250 Hz and 4 integration steps) the states stay within 1e-7 of `odeint` over a single step and within 1e-3 over
+    a 2 s trajectory (most of this difference is the tolerance of `odeint` itself). Angles are wrapped once at the end
+    of the step (like in `forward_model_ode`).
+    """
+    h = dt / integration_steps
+    for step in range(integration_steps):
+        # The derivatives do not depend on theta, therefore only alpha and the velocities are evaluated at the stages
+        a1_theta, a1_alpha = _ode_accelerations_jit(alpha, theta_dot, alpha_dot, Vm, c)
+
+        theta_dot_2 = theta_dot + 0.5 * h * a1_theta
+        alpha_dot_2 = alpha_dot + 0.5 * h * a1_alpha
+        a2_theta, a2_alpha = _ode_accelerations_jit(alpha + 0.5 * h * alpha_dot, theta_dot_2, alpha_dot_2, Vm, c)
+
+        theta_dot_3 = theta_dot + 0.5 * h * a2_theta
+        alpha_dot_3 = alpha_dot + 0.5 * h * a2_alpha
+        a3_theta, a3_alpha = _ode_accelerations_jit(alpha + 0.5 * h * alpha_dot_2, theta_dot_3, alpha_dot_3, Vm, c)
+
+        theta_dot_4 = theta_dot + h * a3_theta
+        alpha_dot_4 = alpha_dot + h * a3_alpha
+        a4_theta, a4_alpha = _ode_accelerations_jit(alpha + h * alpha_dot_3, theta_dot_4, alpha_dot_4, Vm, c)
+
+        theta += h / 6.0 * (theta_dot + 2.0 * theta_dot_2 + 2.0 * theta_dot_3 + theta_dot_4)
+        alpha += h / 6.0 * (alpha_dot + 2.0 * alpha_dot_2 + 2.0 * alpha_dot_3 + alpha_dot_4)
+        theta_dot += h / 6.0 * (a1_theta + 2.0 * a2_theta + 2.0 * a3_theta + a4_theta)
+        alpha_dot += h / 6.0 * (a1_alpha + 2.0 * a2_alpha + 2.0 * a3_alpha + a4_alpha)
+
+    theta = ((theta + np.pi) % (2 * np.pi)) - np.pi
+    alpha = ((alpha + np.pi) % (2 * np.pi)) - np.pi
+
+    return theta, alpha, theta_dot, alpha_dot
+
+
+@jit(nopython=True, cache=True)
+def _forward_model_rk4_batch(state, Vm, dt, integration_steps, c, out):
+    for i in range(state.shape[0]):
+        c_i = c[i] if c.shape[0] > 1 else c[0]
+        out[i, 0], out[i, 1], out[i, 2], out[i, 3] = forward_model_rk4(
+            state[i, 0], state[i, 1], state[i, 2], state[i, 3], Vm[i], dt, integration_steps, c_i
+        )
+    return out
+
+
+def forward_model_rk4_batch(state, Vm, dt, integration_steps, params=DEFAULT_PARAMS):
+    """Batched version of `forward_model_rk4` with the same arguments and return value as `forward_model_euler_batch`."""
+    state = np.asarray(state, dtype=np.float64).reshape((-1, 4))
+    Vm = np.asarray(Vm, dtype=np.float64).reshape((-1,))
+    return _forward_model_rk4_batch(state, Vm, dt, integration_steps, np.atleast_2d(_coefficients(params)),
+                                    np.empty_like(state))
+
+
+@jit(nopython=True, cache=True)
+def _rollout(init_states, actions, dt, integration_steps, max_voltage, use_rk4, c, states):
+    for i in range(init_states.shape[0]):
+        c_i = c[i] if c.shape[0] > 1 else c[0]
+        theta, alpha, theta_dot, alpha_dot = init_states[i, 0], init_states[i, 1], init_states[i, 2], init_states[i, 3]
+        states[i, 0, 0], states[i, 0, 1], states[i, 0, 2], states[i, 0, 3] = theta, alpha, theta_dot, alpha_dot
+        for t in range(actions.shape[1]):
+            Vm = min(max(actions[i, t], -max_voltage), max_voltage)
+            if use_rk4:
+                theta, alpha, theta_dot, alpha_dot = forward_model_rk4(
+                    theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, c_i
+                )
+            else:
+                theta, alpha, theta_dot, alpha_dot = forward_model_euler_jit(
+                    theta, alpha, theta_dot, alpha_dot, Vm, dt, integration_steps, c_i
+                )
+            states[i, t + 1, 0], states[i, t + 1, 1], states[i, t + 1, 2], states[i, t + 1, 3] = \
+                theta, alpha, theta_dot, alpha_dot
+    return states
+
+
+def rollout(init_states, actions, dt, integration_steps, method="rk4", max_voltage=np.inf, params=DEFAULT_PARAMS):
+    """Simulate open-loop voltage sequences for a batch of Qubes in a single compiled call.
+
+    Args:
+        init_states: Array of shape (N, 4) with the initial states
+        actions: Array of shape (N, T) with the voltages applied at each of the T steps
+        dt: Time of a single simulation step
+        integration_steps: Number of integration steps during `dt`
+        method: Integration method, either `euler` (`forward_model_euler_jit`) or `rk4` (`forward_model_rk4`)
+        max_voltage: Voltages are clipped into the range of +- max_voltage
+        params: Parameters of the Qube (`QubeParams`, also per-Qube parameters) or their coefficient array
+
+    Returns:
+        Array of shape (N, T + 1, 4) with the initial states at index 0 of the second dimension
+    """
+    if method not in ("euler", "rk4"):
+        raise ValueError("'method' must be one of ['euler', 'rk4'].")
+    init_states = np.asarray(init_states, dtype=np.float64).reshape((-1, 4))
+    actions = np.asarray(actions, dtype=np.float64).reshape((init_states.shape[0], -1))
+    states = np.empty((init_states.shape[0], actions.shape[1] + 1, 4), dtype=np.float64)
+    return _rollout(init_states, actions, dt, integration_steps, float(max_voltage), method == "rk4",
+                    np.atleast_2d(_coefficients(params)), states)
+
+
+@jit(nopython=True, cache=True)
+def _linearize(alpha, theta_dot, alpha_dot, Vm, c, k_tau, A, B):
+    """Writes the acceleration rows of the Jacobians of the continuous dynamics into A (4, 4) and B (4, 1).
+
+    `k_tau` is the torque coefficient of the forward model (`c[KT_RM]` for the ODE, `c[KM_RM]` for Euler). Returns the
+    accelerations at the operating point.
+    """
+    sin_alpha = np.sin(alpha)
+    cos_alpha = np.cos(alpha)
+    sin_2alpha = np.sin(2.0 * alpha)
+    cos_2alpha = np.cos(2.0 * alpha)
+    tau = -(k_tau * (Vm - c[KM] * theta_dot))
+
+    # Same terms as in `_accelerations`
+    pendulum = -c[DP_8]*alpha_dot + c[LP2_MP]*theta_dot**2*sin_2alpha + c[LP_G_MP_4]*sin_alpha
+    arm = c[DR_4]*theta_dot + c[LP2_MP]*alpha_dot*theta_dot*sin_2alpha + 2.0*c[LP_LR_MP]*alpha_dot**2*sin_alpha - 4.0*tau
+    inertia = c[JR_4] + c[LP2_MP]*sin_alpha**2
+    denominator = c[LP2_LR2_MP2_4]*cos_alpha**2 - c[JP_4]*inertia
+    numerator_theta = -c[LP_LR_MP]*pendulum*cos_alpha + c[JP_4]*arm
+    numerator_alpha = 2.0*c[LP_LR_MP]*arm*cos_alpha - 0.5*inertia*pendulum
+    denominator_2 = denominator**2
+
+    # Derivatives of the terms with respect to alpha, theta_dot, alpha_dot and Vm (quotient rule below)
+    d_pendulum = (
+        2.0*c[LP2_MP]*theta_dot**2*cos_2alpha + c[LP_G_MP_4]*cos_alpha,
+        2.0*c[LP2_MP]*theta_dot*sin_2alpha,
+        -c[DP_8],
+        0.0,
+    )
+    d_arm = (
+        2.0*c[LP2_MP]*alpha_dot*theta_dot*cos_2alpha + 2.0*c[LP_LR_MP]*alpha_dot**2*cos_alpha,
+        c[DR_4] + c[LP2_MP]*alpha_dot*sin_2alpha - 4.0*k_tau*c[KM],
+        c[LP2_MP]*theta_dot*sin_2alpha + 4.0*c[LP_LR_MP]*alpha_dot*sin_alpha,
+        4.0*k_tau,
+    )
+    d_inertia = c[LP2_MP]*sin_2alpha  # Only alpha
+    d_denominator = -c[LP2_LR2_MP2_4]*sin_2alpha - c[JP_4]*d_inertia  # Only alpha
+
+    for j in range(4):
+        d_numerator_theta = -c[LP_LR_MP]*d_pendulum[j]*cos_alpha + c[JP_4]*d_arm[j]
+        d_numerator_alpha = 2.0*c[LP_LR_MP]*d_arm[j]*cos_alpha - 0.5*inertia*d_pendulum[j]
+        if j == 0:
+            d_numerator_theta += c[LP_LR_MP]*pendulum*sin_alpha
+            d_numerator_alpha += -2.0*c[LP_LR_MP]*arm*sin_alpha - 0.5*d_inertia*pendulum
+            d_theta_dot_dot = (d_numerator_theta*denominator - numerator_theta*d_denominator)/denominator_2
+            d_alpha_dot_dot = (d_numerator_alpha*denominator - numerator_alpha*d_denominator)/denominator_2
+        else:
+            d_theta_dot_dot = d_numerator_theta/denominator
+            d_alpha_dot_dot = d_numerator_alpha/denominator
+        if j < 3:
+            A[2, j + 1] = d_theta_dot_dot
+            A[3, j + 1] = d_alpha_dot_dot
+        else:
+            B[2, 0] = d_theta_dot_dot
+            B[3, 0] = d_alpha_dot_dot
+
+    return numerator_theta/denominator, numerator_alpha/denominator
+
+
+@jit(nopython=True, cache=True)
+def _continuous_jacobians(state, Vm, c, A, B):
+    for i in range(state.shape[0]):
+        c_i = c[i] if c.shape[0] > 1 else c[0]
+        A[i, 0, 2] = 1.0
+        A[i, 1, 3] = 1.0
+        _linearize(state[i, 1], state[i, 2], state[i, 3], Vm[i], c_i, c_i[KT_RM], A[i], B[i])
+    return A, B
+
+
+@jit(nopython=True, cache=True)
+def _rk4_stage(state, Vm, c):
+    """Derivative of the state for `forward_model_rk4` together with its Jacobians."""
+    A = np.zeros((4, 4))
+    B = np.zeros((4, 1))
+    A[0, 2] = 1.0
+    A[1, 3] = 1.0
+    theta_dot_dot, alpha_dot_dot = _linearize(state[1], state[2], state[3], Vm, c, c[KT_RM], A, B)
+    derivative = np.array([state[2], state[3], theta_dot_dot, alpha_dot_dot])
+    return derivative, A, B
+
+
+@jit(nopython=True, cache=True)
+def _discrete_jacobians(state, Vm, dt, integration_steps, use_rk4, c, A, B):
+    h = dt / integration_steps
+    identity = np.eye(4)
+    for i in range(state.shape[0]):
+        c_i = c[i] if c.shape[0] > 1 else c[0]
+        x = state[i].copy()
+        A_i = np.eye(4)
+        B_i = np.zeros((4, 1))
+        for step in range(integration_steps):
+            if use_rk4:
+                # Chain rule through the four stages of the classic Runge-Kutta scheme
+                k1, J1, G1 = _rk4_stage(x, Vm[i], c_i)
+                k2, A2, B2 = _rk4_stage(x + 0.5 * h * k1, Vm[i], c_i)
+                J2 = A2 @ (identity + 0.5 * h * J1)
+                G2 = A2 @ (0.5 * h * G1) + B2
+                k3, A3, B3 = _rk4_stage(x + 0.5 * h * k2, Vm[i], c_i)
+                J3 = A3 @ (identity + 0.5 * h * J2)
+                G3 = A3 @ (0.5 * h * G2) + B3
+                k4, A4, B4 = _rk4_stage(x + h * k3, Vm[i], c_i)
+                J4 = A4 @ (identity + h * J3)
+                G4 = A4 @ (h * G3) + B4
+                A_step = identity + h / 6.0 * (J1 + 2.0 * J2 + 2.0 * J3 + J4)
+                B_step = h / 6.0 * (G1 + 2.0 * G2 + 2.0 * G3 + G4)
+                x = x + h / 6.0 * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+            else:
+                # Semi-implicit Euler: the angles are updated with the new velocities
+                A_c = np.zeros((4, 4))
+                B_c = np.zeros((4, 1))
+                theta_dot_dot, alpha_dot_dot = _linearize(x[1], x[2], x[3], Vm[i], c_i, c_i[KM_RM], A_c, B_c)
+                A_step = identity.copy()
+                A_step[2:] += h * A_c[2:]
+                A_step[:2] += h * A_step[2:]
+                B_step = np.zeros((4, 1))
+                B_step[2:] = h * B_c[2:]
+                B_step[:2] = h * B_step[2:]
+                x[2] += h * theta_dot_dot
+                x[3] += h * alpha_dot_dot
+                x[0] += h * x[2]
+                x[1] += h * x[3]
+            A_i = A_step @ A_i
+            B_i = A_step @ B_i + B_step
+        A[i] = A_i
+        B[i] = B_i
+    return A, B
+
+
+def _linearization_inputs(state, Vm, params):
+    state = np.asarray(state, dtype=np.float64)
+    single = state.ndim == 1
+    state = state.reshape((-1, 4))
+    Vm = np.ascontiguousarray(np.broadcast_to(np.asarray(Vm, dtype=np.float64).reshape((-1,)), (state.shape[0],)))
+    A = np.zeros((state.shape[0], 4, 4))
+    B = np.zeros((state.shape[0], 4, 1))
+    return state, Vm, np.atleast_2d(_coefficients(params)), A, B, single
+
+
+def continuous_jacobians(state, Vm=0.0, params=DEFAULT_PARAMS):
+    """Analytic Jacobians of the continuous dynamics `diff_forward_model_ode` at arbitrary operating points.
+
+    The dynamics are linearized to `d(state)/dt ~ A (state - state_0) + B (Vm - Vm_0) + d(state_0)/dt`.
+
+    Args:
+        state: Operating point `[theta, alpha, theta_dot, alpha_dot]` of shape (4,) or a batch of shape (N, 4)
+        Vm: Voltage at the operating point, a scalar or one per state
+        params: Parameters of the Qube (`QubeParams`, also per-Qube parameters) or their coefficient array
+
+    Returns:
+        Tuple `(A, B)` of shape (4, 4) and (4, 1), or (N, 4, 4) and (N, 4, 1) for a batch of states
+    """
+    state, Vm, c, A, B, single = _linearization_inputs(state, Vm, params)
+    A, B = _continuous_jacobians(state, Vm, c, A, B)
+    return (A[0], B[0]) if single else (A, B)
+
+
+def discrete_jacobians(state, Vm, dt, integration_steps=1, method="rk4", params=DEFAULT_PARAMS):
+    """Analytic Jacobians of a single simulation step at arbitrary operating points.
+
+    These are the exact derivatives of the discrete forward models `forward_model_rk4` (`method="rk4"`) and
+    `forward_model_euler` (`method="euler"`) with respect to the state and the voltage, i.e. the linearization
+    `next_state ~ A (state - state_0) + B (Vm - Vm_0) + next_state_0` used by discrete LQR, iLQR or an EKF.
+
+    Args:
+        state: Operating point `[theta, alpha, theta_dot, alpha_dot]` of shape (4,) or a batch of shape (N, 4)
+        Vm: Voltage at the operating point, a scalar or one per state
+        dt: Time of a single simulation step
+        integration_steps: Number of integration steps during `dt`
+        method: Integration method, either `euler` or `rk4`
+        params: Parameters of the Qube (`QubeParams`, also per-Qube parameters) or their coefficient array
+
+    Returns:
+        Tuple `(A, B)` of shape (4, 4) and (4, 1), or (N, 4, 4) and (N, 4, 1) for a batch of states
+    """
+    if method not in ("euler", "rk4"):
+        raise ValueError("'method' must be one of ['euler', 'rk4'].")
+    state, Vm, c, A, B, single = _linearization_inputs(state, Vm, params)
+    A, B = _discrete_jacobians(state, Vm, dt, integration_steps, method == "rk4", c, A, B)
+    return (A[0], B[0]) if single else (A, B)
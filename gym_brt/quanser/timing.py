@@ -0,0 +1,143 @@
+"""Constant-memory timing instrumentation of the control loop.
+
+`LatencyHistogram` counts durations in logarithmically spaced bins (32 per octave from about 1 us to about 69 s), so
+that percentiles can be estimated within about 2.2% (the relative width of a bin, 2**(1/32) - 1) without storing the
+individual durations. `StepTimer` combines the histograms of the different phases of an environment step with the
+number of control period overruns and missed HIL samples.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+SUB_BITS = 5  # 2**5 linear bins per octave
+SUB_BINS = 1 << SUB_BITS
+MIN_OCTAVE = 10  # Durations below 2**10 ns ~ 1 us fall into the first bin
+NUM_BINS = (36 - MIN_OCTAVE) << SUB_BITS  # Up to 2**36 ns ~ 69 s
+
+PHASES = ("read", "bookkeeping", "reward", "step", "interval")
+
+
+class LatencyHistogram(object):
+    """Histogram of durations (in ns) with a fixed number of logarithmically spaced bins."""
+
+    def __init__(self):
+        self.counts = [0] * NUM_BINS
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, duration_ns):
+        # The octave is given by the highest bit and the bin within the octave by the next SUB_BITS bits
+        octave = duration_ns.bit_length() - 1
+        if octave < MIN_OCTAVE:
+            index = 0
+        else:
+            index = ((octave - MIN_OCTAVE) << SUB_BITS) + ((duration_ns >> (octave - SUB_BITS)) & (SUB_BINS - 1))
+            if index >= NUM_BINS:
+                index = NUM_BINS - 1
+        self.counts[index] += 1
+        if self.count == 0 or duration_ns < self.min:
+            self.min = duration_ns
+        self.count += 1
+        self.total += duration_ns
+        if duration_ns > self.max:
+            self.max = duration_ns
+
+    def merge(self, other):
+        """Add the counts of another histogram to this one."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        if other.count and (self.count == 0 or other.min < self.min):
+            self.min = other.min
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def clear(self):
+        for i in range(NUM_BINS):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def percentile(self, q):
+        """Estimate of the `q`-th percentile (in us).
+
+        The durations are assumed to be spread evenly within the bin containing the percentile, i.e. the value is
+        interpolated linearly between the edges of the bin and clipped to the recorded minimum and maximum (a constant
+        duration is thus exact).
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                octave, sub_bin = MIN_OCTAVE + (i >> SUB_BITS), i & (SUB_BINS - 1)
+                lower_edge_ns = (SUB_BINS + sub_bin) << (octave - SUB_BITS) if i > 0 else 0
+                upper_edge_ns = (SUB_BINS + sub_bin + 1) << (octave - SUB_BITS)
+                fraction = (rank - (cumulative - count)) / count
+                value_ns = lower_edge_ns + fraction * (upper_edge_ns - lower_edge_ns)
+                return min(max(value_ns, self.min), self.max) / 1000.0
+        return self.max / 1000.0
+
+    def summary(self):
+        """Dict with the number of samples and the mean, min, p50, p99 and max duration (in us)."""
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000.0 if self.count else 0.0,
+            "min_us": self.min / 1000.0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+            "max_us": self.max / 1000.0,
+        }
+
+
+class StepTimer(object):
+    """Histograms of the phases of a step plus control period overruns and missed HIL samples.
+
+    The phases are `read` (sensor read and actuation of the Qube), `reward` (reward and termination), `bookkeeping`
+    (everything else within `step`), `step` (the whole step) and `interval` (time between the starts of two
+    consecutive steps, i.e. the actual control period). A step is counted as overrun if the interval exceeds the
+    control period by more than `overrun_tolerance` (relative).
+    """
+
+    def __init__(self, frequency, overrun_tolerance=0.5):
+        self.period_ns = int(1e9 / frequency)
+        self.overrun_ns = int(self.period_ns * (1.0 + overrun_tolerance))
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self.overruns = 0
+        self.missed_samples = 0
+
+    def record(self, read_ns, reward_ns, step_ns, interval_ns=None):
+        histograms = self.histograms
+        histograms["read"].record(read_ns)
+        histograms["reward"].record(reward_ns)
+        histograms["bookkeeping"].record(step_ns - read_ns - reward_ns)
+        histograms["step"].record(step_ns)
+        if interval_ns is not None:
+            histograms["interval"].record(interval_ns)
+            if interval_ns > self.overrun_ns:
+                self.overruns += 1
+
+    def merge(self, other):
+        for phase in PHASES:
+            self.histograms[phase].merge(other.histograms[phase])
+        self.overruns += other.overruns
+        self.missed_samples += other.missed_samples
+
+    def clear(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+        self.overruns = 0
+        self.missed_samples = 0
+
+    def summary(self):
+        stats = {phase: histogram.summary() for phase, histogram in self.histograms.items()}
+        stats["period_us"] = self.period_ns / 1000.0
+        stats["overruns"] = self.overruns
+        stats["missed_samples"] = self.missed_samples
+        return stats
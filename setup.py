@@ -40,13 +40,27 @@ extensions = [
     )
 ]
 
+# The same wrapper with the HIL SDK replaced by a simulated board (`QubeHardware(backend="mock")`), it only needs
+# Cython and a C compiler
+mock_extensions = [
+    Extension(
+        "gym_brt.quanser.quanser_wrapper.quanser_wrapper_mock",
+        [
+            "gym_brt/quanser/quanser_wrapper/quanser_wrapper_mock.pyx",
+            "gym_brt/quanser/quanser_wrapper/mock/mock_hil.c",
+        ],
+        include_dirs=["gym_brt/quanser/quanser_wrapper/mock"],
+        optional=True,
+    )
+]
+
 # If Cython is installed build from source otherwise use the precompiled version
 try:
     from Cython.Build import cythonize
 
-    extensions = cythonize(extensions)
+    is_cython_installed = True
 except ImportError:
-    pass
+    is_cython_installed = False
 
 
 # Hacky way to check if the HIL SDK is installed (allows to run on Mac OS)
@@ -54,10 +68,14 @@ is_hil_sdk_installed = False
 if os.path.isdir("/opt/quanser/hil_sdk/lib"):
     is_hil_sdk_installed = True
 
+ext_modules = extensions if is_hil_sdk_installed else []
+if is_cython_installed:
+    ext_modules = cythonize(ext_modules + mock_extensions)
+
 setup(
     name="gym_brt",
     version=0.2,
-    cmdclass={"build_ext": build_ext} if is_hil_sdk_installed else {},
+    cmdclass={"build_ext": build_ext} if ext_modules else {},
     install_requires=[
         "numpy",
         "gym>=0.17",
@@ -67,8 +85,10 @@ setup(
         "scipy"
     ],
     setup_requires=["numpy"],
+    # Lazy attributes of the package (PEP 562) and time.perf_counter_ns
+    python_requires=">=3.7",
     extras_require=extras,
-    ext_modules=extensions if is_hil_sdk_installed else None,
+    ext_modules=ext_modules or None,
     description="Extended and adapted version of Blue River's OpenAI Gym wrapper around Quanser hardware.",
     url="https://github.com/BlueRiverTech/quanser-openai-driver/",
     author="Blue River Technology, "
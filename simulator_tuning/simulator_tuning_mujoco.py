@@ -19,6 +19,7 @@ from gym_brt.control.control import _convert_state
 from gym_brt.quanser import QubeHardware, QubeSimulator
 from gym_brt.quanser.qube_interfaces import forward_model_ode
 from gym_brt.envs.reinforcementlearning_extensions import TrigonometricObservationWrapper, convert_single_state, convert_states_array
+from simulator_tuning.qube_simulator_optimize import tuning_params
 
 
 # No input
@@ -235,7 +236,8 @@ def run_mujoco(begin_up, policy, n_steps, frequency, integration_steps, params=N
 
 def run_sim(begin_up, policy, nsteps, frequency, integration_steps, params=None, init_state=None, render=False):
     if params is not None:
-        sim_function = functools.partial(forward_model_ode_optimize, params=params)
+        # The parameter set is built once for the whole run
+        sim_function = functools.partial(forward_model_ode, params=tuning_params(params))
     else:
         sim_function = forward_model_ode
 
@@ -527,39 +529,49 @@ def visualize(plot_real_qube=False, plot_mujoco=False, plot_ode=False):
     plot_results(hists=hists, labels=labels, normalize=normalization)
 
 
-def record_traj(n_steps, frequency=250):
+def record_traj(n_steps, frequency=250, path="./simulator_tuning/data/traj_qube_real.npy"):
     """Records a trajectory on the real Qube to use it for parameter identification for the simulations.
 
+    All steps are streamed into the memory-mapped file `path` (see `TrajectoryRecorder`), so that a crash of a long
+    run does not lose the recorded data.
+
     Args:
         n_steps: Number of steps for the trajectory.
         frequency: Frequency to grab values from the Qube.
+        path: File the steps of all episodes are recorded to.
 
     Returns:
-        Recorded trajectory from the real Qube.
+        Recorded trajectory of the last episode from the real Qube (rows `[theta, alpha, theta_dot, alpha_dot, action]`
+        with the action applied in this state) and its initial state.
     """
     from gym_brt.control import QubeFlipUpControl
     from gym_brt.envs import QubeSwingupEnv
+    from gym_brt.envs.reinforcementlearning_extensions import TrajectoryRecorder, TrajectoryReader
 
     solved = False
-    with QubeSwingupEnv(use_simulator=False, frequency=frequency) as env:
+    with QubeSwingupEnv(use_simulator=False, frequency=frequency) as qube_env:
+        env = TrajectoryRecorder(qube_env, path, capacity=16 * (n_steps + 1))
         controller = QubeFlipUpControl(sample_freq=frequency, env=env)
         while not solved:
-            state = init_state = env.reset()
+            state = env.reset()
             action = controller.action(state)
-            actions = [action]
-            trajectory = [state]
             for step in range(n_steps):
                 state, reward, done, info = env.step(action)
-                trajectory.append(state)
                 action = controller.action(state)
-                actions.append(action)
                 if np.abs(state[1]) <= (20.0 * np.pi / 180.0):
                     solved = True
                 if done:
                     print(solved)
                     break
-    output = np.concatenate((np.array(trajectory), np.array(actions)), axis=1)
-    return output, init_state
+        env.flush()
+
+    reader = TrajectoryReader(path)
+    # Views of the records of the last episode (starts with the record of its reset)
+    start = np.flatnonzero(reader.steps == 0)[-1]
+    states, actions = reader.states[start:], reader.actions[start:]
+    # The action of a record is the one which led to its state
+    output = np.concatenate((states[:-1], actions[1:]), axis=1)
+    return output, states[0].copy()
 
 
 if __name__ == '__main__':
@@ -582,6 +594,11 @@ if __name__ == '__main__':
     elif TRAJ_RECORDING:
         hist, init_state = record_traj(n_steps=N_STEPS, frequency=FREQUENCY)
         save("./simulator_tuning/data/hist_qube_real", hist, "./simulator_tuning/data/init_state_real", init_state)
+        # Keep all recorded episodes in the dataset, so that the identification can be fitted against many runs
+        from gym_brt.envs.reinforcementlearning_extensions import TrajectoryDataset, TrajectoryReader
+        with TrajectoryDataset("./simulator_tuning/data/trajectories.zip", mode="a") as dataset:
+            dataset.add_recording(TrajectoryReader("./simulator_tuning/data/traj_qube_real.npy"),
+                                  policy="flip_up", frequency=FREQUENCY)
     else:
         # Choose which mode should be run
         RUN_REAL = False
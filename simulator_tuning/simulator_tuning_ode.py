@@ -17,7 +17,7 @@ from gym_brt.control.control import _convert_state, QubeFlipUpControl
 
 
 # No input
-from simulator_tuning.qube_simulator_optimize import forward_model_ode_optimize
+from simulator_tuning.qube_simulator_optimize import tuning_params
 
 
 def zero_policy(state, **kwargs):
@@ -167,7 +167,8 @@ def run_qube(begin_up, policy, nsteps, frequency, integration_steps):
 
 def run_sim(init_state, policy, nsteps, frequency, integration_steps, params=None):
     if params is not None:
-        sim_function = functools.partial(forward_model_ode_optimize, params=params)
+        # The parameter set is built once for the whole run
+        sim_function = functools.partial(forward_model_ode, params=tuning_params(params))
     else:
         sim_function = forward_model_ode
 
@@ -196,6 +197,21 @@ def run_sim(init_state, policy, nsteps, frequency, integration_steps, params=Non
         return np.concatenate((np.array(s_hist), np.array(a_hist)), axis=1)
 
 
+def replay_sim(init_state, actions, frequency, integration_steps, forward_model="rk4"):
+    """Replay recorded actions open-loop in the simulator with a single call of `QubeSimulator.rollout`."""
+    with QubeSimulator(
+            forward_model=forward_model,
+            frequency=frequency,
+            integration_steps=integration_steps,
+            max_voltage=3.0,
+    ) as qube:
+        actions = np.asarray(actions, dtype=np.float64).reshape((-1,))
+        states = qube.rollout(init_state, actions[:-1])
+
+        # Same layout as `run_sim`: ['Theta', 'Alpha', 'Theta dot', 'Alpha dot', 'Action']
+        return np.concatenate((states, actions[:, np.newaxis]), axis=1)
+
+
 def plot_results(hists, labels, colors=None, normalize=None):
     state_dims = ['Theta', 'Alpha', 'Theta dot', 'Alpha dot', 'Action']
 
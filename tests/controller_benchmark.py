@@ -0,0 +1,162 @@
+"""
+Latency benchmark of the controllers in `gym_brt.control`.
+
+Every controller is driven with a stream of states (recorded with `--states` or simulated swing-ups of the ODE
+simulation by default) and each call is timed individually. For each control frequency the report contains the
+p50/p99/max latency per call, the share of the control period they use and the memory allocated per call (peak of
+the memory traced by `tracemalloc` during the call and the memory still held after it). The report is printed (or
+written to `--output`) as JSON, so that results of different commits can be compared.
+
+Example:
+    python tests/controller_benchmark.py --frequencies 120 250 500 --calls 2000 --output latency.json
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from gym_brt.control import (
+    dampen_policy,
+    QubeFlipUpControl,
+    QubeHoldControl,
+    QubeMPPIControl,
+    PIDCtrl,
+    GoToLimCtrl,
+    CalibrCtrl,
+)
+from gym_brt.quanser import QubeSimulator
+
+
+def _controllers(frequency):
+    """Callables `f(state) -> action` of all controllers for the given control frequency."""
+    return {
+        "QubeFlipUpControl": QubeFlipUpControl(sample_freq=frequency).action,
+        "QubeHoldControl": QubeHoldControl(None, sample_freq=frequency).action,
+        "QubeMPPIControl": QubeMPPIControl(sample_freq=frequency, seed=0).action,
+        "dampen_policy": dampen_policy,
+        "PIDCtrl": PIDCtrl(fs_ctrl=frequency),
+        "GoToLimCtrl": GoToLimCtrl(fs_ctrl=frequency),
+        "CalibrCtrl": CalibrCtrl(fs_ctrl=frequency),
+    }
+
+
+def simulate_states(num_states, frequency, seed=0):
+    """States of noisy swing-ups (and balancing) of the simulated Qube with `QubeFlipUpControl`."""
+    np.random.seed(seed)
+    simulator = QubeSimulator(forward_model="rk4", frequency=frequency, integration_steps=4)
+    controller = QubeFlipUpControl(sample_freq=frequency)
+    states = np.empty((num_states, 4), dtype=np.float64)
+    state = simulator.reset_down()
+    for i in range(num_states):
+        # Restart every 10 seconds to cover the swing-up as well as the balancing
+        if i % (10 * frequency) == 0:
+            state = simulator.reset_down()
+        states[i] = state
+        action = controller.action(np.asarray(state)) + np.random.normal(0.0, 0.5)
+        state = simulator.step(action)
+    return states
+
+
+def _measure(controller, states):
+    """Latency (in ns) of every call."""
+    latencies = np.empty(len(states), dtype=np.int64)
+    for i, state in enumerate(states):
+        start = time.perf_counter_ns()
+        controller(state)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies
+
+
+def _measure_allocations(controller, states):
+    """Peak of the traced memory during each call and the memory still held after it (both in bytes)."""
+    peak = np.empty(len(states), dtype=np.int64)
+    retained = np.empty(len(states), dtype=np.int64)
+    tracemalloc.start()
+    try:
+        for i, state in enumerate(states):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            controller(state)
+            after, peak_during = tracemalloc.get_traced_memory()
+            peak[i] = peak_during - before
+            retained[i] = after - before
+    finally:
+        tracemalloc.stop()
+    return peak, retained
+
+
+def benchmark(frequencies, num_calls, warmup_calls=100, states=None):
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "calls": num_calls,
+        "results": [],
+    }
+    for frequency in frequencies:
+        period_us = 1e6 / frequency
+        stream = states if states is not None else simulate_states(warmup_calls + num_calls, frequency)
+        for name in _controllers(frequency):
+            # Fresh instances for timing and allocations (some controllers have an internal state)
+            controller = _controllers(frequency)[name]
+            _measure(controller, stream[:warmup_calls])
+            latencies_us = _measure(controller, stream[warmup_calls:warmup_calls + num_calls]) / 1e3
+
+            controller = _controllers(frequency)[name]
+            _measure(controller, stream[:warmup_calls])
+            peak, retained = _measure_allocations(controller, stream[warmup_calls:warmup_calls + num_calls])
+
+            p50, p99 = np.percentile(latencies_us, [50, 99])
+            max_us = latencies_us.max()
+            report["results"].append({
+                "controller": name,
+                "frequency": frequency,
+                "period_us": period_us,
+                "p50_us": float(p50),
+                "p99_us": float(p99),
+                "max_us": float(max_us),
+                "p99_period_share": float(p99 / period_us),
+                "max_period_share": float(max_us / period_us),
+                "within_period": bool(max_us < period_us),
+                "peak_alloc_bytes_p50": float(np.percentile(peak, 50)),
+                "peak_alloc_bytes_max": int(peak.max()),
+                "retained_bytes_mean": float(retained.mean()),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmark of the Qube controllers.")
+    parser.add_argument("--frequencies", type=int, nargs="+", default=[120, 250, 500, 1000],
+                        help="Control frequencies to compare the latencies with.")
+    parser.add_argument("--calls", type=int, default=2000, help="Number of timed calls per controller.")
+    parser.add_argument("--warmup", type=int, default=100, help="Number of untimed calls before the timed ones.")
+    parser.add_argument("--states", type=str, default=None,
+                        help="Recorded states (.npy file of shape (T, 4)) instead of simulated ones.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file.")
+    args = parser.parse_args()
+
+    states = None
+    if args.states is not None:
+        states = np.load(args.states).reshape((-1, 4))
+        if len(states) < args.warmup + args.calls:
+            raise ValueError(f"{args.states} contains {len(states)} states but {args.warmup + args.calls} are needed.")
+
+    report = benchmark(args.frequencies, args.calls, warmup_calls=args.warmup, states=states)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark of `QubeBaseEnv.step` with and without the allocation-free fast path (`fast_step=True`) and the state in the
+info (`step_info`).
+
+Each environment is stepped with the simulator for the given number of steps and every step is timed individually.
+The report contains the steps per second, the p50/p99/max latency per step, the peak memory traced by `tracemalloc`
+during a step and the number of garbage collections of generation 0 per 1000 steps. It is printed (or written to
+`--output`) as JSON.
+
+Example:
+    python tests/env_step_benchmark.py --steps 20000 --simulation-modes rk4 euler_jit
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import gc
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from gym_brt.envs import QubeSwingupEnv, QubeBeginDownEnv
+
+
+ENVIRONMENTS = {
+    "QubeSwingupEnv": QubeSwingupEnv,
+    "QubeBeginDownEnv": QubeBeginDownEnv,
+}
+
+
+def _run(env, actions):
+    latencies = np.empty(len(actions), dtype=np.int64)
+    env.reset()
+    for i, action in enumerate(actions):
+        start = time.perf_counter_ns()
+        _, _, done, _ = env.step(action)
+        latencies[i] = time.perf_counter_ns() - start
+        if done:
+            env.reset()
+    return latencies
+
+
+def _peak_allocations(env, actions):
+    peak = np.empty(len(actions), dtype=np.int64)
+    env.reset()
+    tracemalloc.start()
+    try:
+        for i, action in enumerate(actions):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _, _, done, _ = env.step(action)
+            peak[i] = tracemalloc.get_traced_memory()[1] - before
+            if done:
+                env.reset()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark(num_steps, simulation_modes, frequency=250, seed=0):
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "steps": num_steps,
+        "results": [],
+    }
+    # A single action array which is reused, such that only the allocations of the environment are measured
+    actions = np.random.RandomState(seed).uniform(-3.0, 3.0, size=(num_steps, 1))
+    for name, env_class in ENVIRONMENTS.items():
+        for simulation_mode in simulation_modes:
+            for fast_step, step_info in ((False, True), (True, True), (True, False)):
+                with env_class(use_simulator=True, simulation_mode=simulation_mode, frequency=frequency,
+                               fast_step=fast_step, step_info=step_info) as env:
+                    env.seed(seed)
+                    _run(env, actions[:100])  # Warm up (e.g. loading of the compiled kernels)
+
+                    collections = gc.get_stats()[0]["collections"]
+                    start = time.perf_counter()
+                    latencies_us = _run(env, actions) / 1e3
+                    duration = time.perf_counter() - start
+                    collections = gc.get_stats()[0]["collections"] - collections
+
+                    peak = _peak_allocations(env, actions[:min(num_steps, 2000)])
+
+                p50, p99 = np.percentile(latencies_us, [50, 99])
+                report["results"].append({
+                    "env": name,
+                    "simulation_mode": simulation_mode,
+                    "fast_step": fast_step,
+                    "step_info": step_info,
+                    "steps_per_second": num_steps / duration,
+                    "p50_us": float(p50),
+                    "p99_us": float(p99),
+                    "max_us": float(latencies_us.max()),
+                    "peak_alloc_bytes_p50": float(np.percentile(peak, 50)),
+                    "gc_gen0_per_1000_steps": 1000.0 * collections / num_steps,
+                })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the step of the Qube environments.")
+    parser.add_argument("--steps", type=int, default=20000, help="Number of timed steps per configuration.")
+    parser.add_argument("--simulation-modes", type=str, nargs="+", default=["rk4", "euler_jit"],
+                        help="Simulation modes of the ODE simulation to benchmark.")
+    parser.add_argument("--frequency", type=int, default=250, help="Sample frequency of the environments.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file.")
+    args = parser.parse_args()
+
+    report = benchmark(args.steps, args.simulation_modes, frequency=args.frequency)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of the import time of the `gym_brt` packages.
+
+Every package is imported in a fresh interpreter (so nothing is cached in `sys.modules`) for the given number of
+repetitions. The report contains the min/median import time, the budget of the package and the heavy optional modules
+(cv2, PySpin, mujoco_py, pybullet, scipy.signal, ...) which were loaded by the import. It is printed (or written to
+`--output`) as JSON and the script exits with status 1 if the median of a package exceeds its budget.
+
+Example:
+    python tests/import_time_benchmark.py --repeat 10 --budget-scale 2.0
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import numpy as np
+
+
+# Budgets (in seconds) of the median import time; `import gym_brt` itself should only load the configuration and gym
+# (to register the environments, about 0.3 s of every budget)
+BUDGETS = {
+    "gym_brt": 0.6,
+    "gym_brt.quanser": 0.9,
+    "gym_brt.control": 0.9,
+    "gym_brt.envs": 1.2,
+}
+HEAVY_MODULES = ("cv2", "PySpin", "mujoco_py", "pybullet", "scipy.signal", "scipy.integrate", "scipy.linalg", "numba",
+                 "gym", "vpython", "tqdm")
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps({{"duration": duration, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _import_once(module):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    output = subprocess.run(
+        [sys.executable, "-c", _SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    # Packages might print to stdout on import, the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(modules, repeat, budget_scale=1.0):
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": [],
+    }
+    for module in modules:
+        runs = [_import_once(module) for _ in range(repeat)]
+        durations = np.array([run["duration"] for run in runs])
+        median = float(np.median(durations))
+        budget = BUDGETS.get(module)
+        budget = budget * budget_scale if budget is not None else None
+        report["results"].append({
+            "module": module,
+            "min_s": float(durations.min()),
+            "median_s": median,
+            "budget_s": budget,
+            "within_budget": budget is None or median <= budget,
+            "heavy_modules": runs[-1]["modules"],
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time benchmark of the gym_brt packages.")
+    parser.add_argument("--modules", type=str, nargs="+", default=list(BUDGETS), help="Modules to import.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters per module.")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Factor for the budgets (e.g. for slower machines).")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file.")
+    args = parser.parse_args()
+
+    report = benchmark(args.modules, args.repeat, budget_scale=args.budget_scale)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if not all(result["within_budget"] for result in report["results"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
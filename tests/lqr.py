@@ -1,72 +1,36 @@
-try:
-    import autograd.numpy as np
-    from autograd import grad, jacobian
-except:
-    raise ImportError("Please install autograd.")
+import numpy as np
 try:
     import scipy.linalg as sp_linalg
 except:
     raise ImportError("Please install scipy.")
 
+from gym_brt.quanser.qube_simulator import DEFAULT_PARAMS, diff_forward_model_ode
 
-# Motor
-Rm = 8.4  # Resistance
-kt = 0.042  # Current-torque (N-m/A)
-km = 0.042  # Back-emf constant (V-s/rad)
-
-# Rotary Arm
-mr = 0.095  # Mass (kg)
-Lr = 0.085  # Total length (m)
-Jr = mr * Lr ** 2 / 12  # Moment of inertia about pivot (kg-m^2)
-Br = Dr = 0.0015  # Equivalent viscous damping coefficient (N-m-s/rad)
-
-# Pendulum Link
-mp = 0.024  # Mass (kg)
-Lp = 0.129  # Total length (m)
-Jp = mp * Lp ** 2 / 12  # Moment of inertia about pivot (kg-m^2)
-Dp = Bp = 0.0005  # Equivalent viscous damping coefficient (N-m-s/rad)
-
-g = 9.81  # Gravity constant
-
-
-def forward_model(state, action, dt=1 / 300.0):
-    theta = state[0]
-    alpha = state[1]
-    theta_dot = state[2]
-    alpha_dot = state[3]
-    Vm = action
-
-    tau = (km * (Vm - km * theta_dot)) / Rm  # torque
-
-    # fmt: off
-    alpha_dot_dot = (2.0*Lp*Lr*mp*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*(tau))*np.cos(alpha) - 0.5*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp)*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha)))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp))
-    theta_dot_dot = (-Lp*Lr*mp*(-8.0*Dp*alpha_dot + Lp**2*mp*theta_dot**2*np.sin(2.0*alpha) + 4.0*Lp*g*mp*np.sin(alpha))*np.cos(alpha) + (4.0*Jp + Lp**2*mp)*(4.0*Dr*theta_dot + Lp**2*alpha_dot*mp*theta_dot*np.sin(2.0*alpha) + 2.0*Lp*Lr*alpha_dot**2*mp*np.sin(alpha) - 4.0*(tau)))/(4.0*Lp**2*Lr**2*mp**2*np.cos(alpha)**2 - (4.0*Jp + Lp**2*mp)*(4.0*Jr + Lp**2*mp*np.sin(alpha)**2 + 4.0*Lr**2*mp))
-    # fmt: on
-
-    # Works around a single operating point
-    theta += theta_dot * dt  # TODO: Shouldn't the angles be ahead of the velocities?
-    alpha += alpha_dot * dt
-    theta_dot += theta_dot_dot * dt
-    alpha_dot += alpha_dot_dot * dt
 
-    theta %= 2 * np.pi
-    alpha %= 2 * np.pi
+def forward_model(state, action, dt=1 / 300.0, params=DEFAULT_PARAMS):
+    # Works around a single operating point (the angles are not wrapped, so that the model can be differentiated there)
+    state_dot = diff_forward_model_ode(state, 0.0, action, dt, params)
 
     # For continuous version of LQR
-    # state = np.array([theta_dot,alpha_dot,theta_dot_dot,alpha_dot_dot]).reshape((4,))
+    # state = state_dot
 
     # For discrete version of LQR
-    state = np.array([theta, alpha, theta_dot, alpha_dot]).reshape((4,))
+    state = np.asarray(state, dtype=np.float64) + state_dot * dt
     return state
 
 
-def computeAB(current_state, current_control):
-    # Linearizing Dynamics
-    forward_dynamics_model = lambda state, action: forward_model(state, action)
-    a_mat = jacobian(forward_dynamics_model, 0)
-    b_mat = jacobian(forward_dynamics_model, 1)
-    A = a_mat(current_state, current_control)
-    B = b_mat(current_state, current_control)
+def computeAB(current_state, current_control, params=DEFAULT_PARAMS, eps=1e-6):
+    # Linearizing Dynamics with central differences
+    current_state = np.asarray(current_state, dtype=np.float64)
+    action = float(np.squeeze(current_control))
+    A = np.zeros((4, 4))
+    for i in range(4):
+        delta = np.zeros(4)
+        delta[i] = eps
+        A[:, i] = (forward_model(current_state + delta, action, params=params)
+                   - forward_model(current_state - delta, action, params=params)) / (2 * eps)
+    B = ((forward_model(current_state, action + eps, params=params)
+          - forward_model(current_state, action - eps, params=params)) / (2 * eps)).reshape((4, 1))
 
     # Correct continuous time linearization from Quanser Workbook -
     # A = np.array( [[0,0,1.0000,0],[0,0,0 ,1.0000], [0,149.2751,-0.0104,0],[0,261.6091,-0.0103,0]]).reshape((4,4))
@@ -75,12 +39,12 @@ def computeAB(current_state, current_control):
     return A, B
 
 
-def LQR_control():
+def LQR_control(params=DEFAULT_PARAMS):
     # Cost matrices for LQR
     Q = np.diag(np.array([1, 1, 1, 1]))  # state_dimension = 4
     R = np.eye(1)  # control_dimension = 1
 
-    A, B = computeAB(np.array([0.0, 0.0, 0.0, 0.0]), np.array([0.0]))
+    A, B = computeAB(np.array([0.0, 0.0, 0.0, 0.0]), np.array([0.0]), params=params)
 
     # Use if discrete forward dynamics is used
     X = sp_linalg.solve_discrete_are(A, B, Q, R)
@@ -98,6 +62,8 @@ def main():
     quanser workbook and more importantly achieve balance on the Qube Hardware
     """
     K_real = [-2.0, 35.0, -1.5, 3.0]  # Correct K from quanser workbook
+    # The simulation applies the voltage with the opposite sign (see the torque in `diff_forward_model_ode`), which
+    # flips the sign of the calculated gains
     K_calc = LQR_control().tolist()
     print("The two following should be close to each other")
     print("\tThe gains from Quanser are:", K_real)
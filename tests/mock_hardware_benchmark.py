@@ -0,0 +1,104 @@
+"""
+Load test of the hardware code path of the Qube environments with the simulated HIL board (`backend="mock"`).
+
+The environment is run with `use_simulator=False`, i.e. through `QubeHardware` and the HIL task, whose samples are
+taken by `gym_brt.quanser.mock_hil` from the ODE model on the clock of the task (the compiled wrapper
+`quanser_wrapper_mock` is required, see `python setup.py build_ext --inplace`). Every configuration of the hardware
+options (single sample reads, draining the buffer, timed writes, trusted actions and the control thread) is stepped
+with random actions for the given number of steps. The report contains the timing statistics of the environment
+(`get_timing_stats`, including the control thread), the missed samples and the HIL transactions per step. It is printed
+(or written to `--output`) as JSON.
+
+With `--virtual` the board runs on a virtual clock instead of the wall time, so that the CPU cost of the loop is
+measured without waiting for the samples (the control thread needs the wall time and is skipped).
+
+Example:
+    python tests/mock_hardware_benchmark.py --steps 2500 --configurations default control_thread
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from gym_brt.envs import QubeSwingupEnv
+
+
+CONFIGURATIONS = {
+    "default": {},
+    "drain_samples": {"drain_samples": True},
+    "timed_write": {"timed_write": True},
+    "trusted_timed_write": {"timed_write": True, "trusted_actions": True},
+    "control_thread": {"control_thread": True},
+}
+
+
+def benchmark(num_steps, configurations, frequency=250, virtual=False, noise=1.0, seed=0):
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "steps": num_steps,
+        "frequency": frequency,
+        "virtual": virtual,
+        "results": [],
+    }
+    actions = np.random.RandomState(seed).uniform(-3.0, 3.0, size=(num_steps, 1))
+    for name in configurations:
+        if virtual and CONFIGURATIONS[name].get("control_thread"):
+            continue
+        hardware_options = dict(
+            CONFIGURATIONS[name], backend="mock", board_options={"realtime": not virtual, "noise": noise, "seed": seed}
+        )
+        with QubeSwingupEnv(use_simulator=False, frequency=frequency, timing_stats=True, fast_step=True,
+                            hardware_options=hardware_options) as env:
+            env.reset()
+            # Only the steps are measured, not the resets (which run the dampening controller of the hardware)
+            duration, transactions = 0.0, 0
+            for action in actions:
+                start, start_transactions = time.perf_counter(), env.qube.qube.transactions
+                _, _, done, _ = env.step(action)
+                duration += time.perf_counter() - start
+                transactions += env.qube.qube.transactions - start_transactions
+                if done:
+                    env.reset()
+            stats = env.get_timing_stats()
+
+        report["results"].append({
+            "configuration": name,
+            "hardware_options": CONFIGURATIONS[name],
+            "steps_per_second": num_steps / duration,
+            "transactions_per_step": transactions / num_steps,
+            "timing": stats,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the Qube hardware path with the simulated HIL board.")
+    parser.add_argument("--steps", type=int, default=2500, help="Number of steps per configuration.")
+    parser.add_argument("--configurations", type=str, nargs="+", default=list(CONFIGURATIONS),
+                        choices=list(CONFIGURATIONS), help="Hardware options to benchmark.")
+    parser.add_argument("--frequency", type=int, default=250, help="Sample frequency of the HIL task.")
+    parser.add_argument("--virtual", action="store_true", help="Run the board on a virtual clock.")
+    parser.add_argument("--noise", type=float, default=1.0,
+                        help="Standard deviation of the disturbance of the simulated Qube (in rad/s^2).")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report to this file.")
+    args = parser.parse_args()
+
+    report = benchmark(args.steps, args.configurations, frequency=args.frequency, virtual=args.virtual,
+                       noise=args.noise)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()